@@ -1,8 +1,11 @@
 # Gather statistics for the KS problem and store to file 
 module KSGather
 
+using DelimitedFiles
+
 include("kuramoto-sivashinsky.jl")
 using .kuramoto_sivashinsky
+include(joinpath(@__DIR__, "..", "utils", "shards.jl"))
 
 # define integrand functions needed for time averages 
 function ident(val) 
@@ -25,28 +28,147 @@ function Print3DArray(file, arr::AbstractArray{Float64,3})
     end
 end
 
+"""
+    WriteDataFile(file_name, names, arrays[, meta])
+
+Write `arrays` to `file_name` using `Print3DArray`, preceded by a header that
+lists the name, shape, and line and byte offsets of each block, so readers can
+validate the file and seek to a single block.  `meta` is a vector of 
+`key => value` pairs recorded in the header.  See `utils/data_header.py` for 
+the format; the shape is listed in reverse, matching the row-major view of the
+data.
+"""
+function WriteDataFile(file_name, names, arrays, meta=Pair{String,Any}[])
+    blocks = Vector{Vector{UInt8}}()
+    for arr in arrays
+        buf = IOBuffer()
+        Print3DArray(buf, arr)
+        push!(blocks, take!(buf))
+    end
+    file = open(file_name, "w")
+    println(file, "# hoc-data 1")
+    for (key, val) in meta
+        println(file, "# meta ", key, "=", join(val, ","))
+    end
+    line = 0
+    offset = 0
+    for (name, arr, bytes) in zip(names, arrays, blocks)
+        shape = reverse(size(arr))
+        println(file, "# block name=", name, " dtype=float64 shape=", 
+                join(shape, ","), " line=", line, " offset=", offset)
+        line += div(length(arr), shape[end])
+        offset += length(bytes)
+    end
+    println(file, "# end")
+    for bytes in blocks
+        write(file, bytes)
+    end
+    close(file)
+end
+
+# campaign parameters, shared by gatherStatsKS and gatherJobKS
+const Lx = 128.0                         # domain size
+const spin = 1000.0                      # spin-up period
+const num_samples = 10                   # number of ensemble samples to use
+const dt = 0.01
+const base_time = 40.0
+const base_steps = convert(Int, base_time/dt)
+const time_fac = 10
+const orders = [2, 4, 6]
+const mesh_nodes = Array{Int}(128:32:256) .- 1
+const num_spin = convert(Int, spin/dt)
+
+"""
+    u_avg, u2_avg, cputime = sampleStatsKS(ks, order)
+
+Runs one long-time sample of the KS problem defined by `ks`, starting from a
+random initial condition and a spin-up period, and returns the averages over
+the short, medium and long periods.  Each returned array has `time_fac^2` 
+rows and one column per period.
+"""
+function sampleStatsKS(ks, order::Int)
+    tp = Float64
+    num_nodes = ks.num_nodes
+    time = base_time*time_fac^2
+    num_steps = base_steps*time_fac^2
+    u_avg = zeros(time_fac^2, 3)
+    u2_avg = zeros(size(u_avg))
+    cputime = zeros(size(u_avg))
+
+    # run spin up simulation 
+    u = 2*rand(num_nodes) .- 1
+    sol = kuramoto_sivashinsky.solveUsingMidpoint(ks, spin, num_spin, u)
+    u = sol[2:end-1,end]
+    sol = nothing 
+    
+    # solve for the statistics using longest simulation time 
+    # print("\t") # this is so the elapsed time is indented 
+    cpu_long = @elapsed begin 
+        sol = kuramoto_sivashinsky.
+        solveUsingMidpoint(ks, time, num_steps, u)
+    end            
+    if any(isnan, sol)
+        error("KS failed to solve due to instability.")
+    end
+    
+    # We partition the long-time simulation into smaller periods for
+    # statistics gathering.  For example, if the long-time is 4000
+    # units then we have 1 sample for 4000, 10 samples for 400
+    # units, and 100 samples for 40 units.
+    # The statistics for the medium and long periods are duplicated 
+    # to simplify the file I/O (NumPy loadtxt is easier), so this 
+    # needs to be accounted for by dividing by the same number of 
+    # total samples, which is num_samples*time_fac^2
+    u_avg_long = kuramoto_sivashinsky.
+        calcSolutionAverage(order, sol, ident)
+    u2_avg_long = kuramoto_sivashinsky.
+        calcSolutionAverage(order, sol, square)
+    ptr = 1
+    for s1 = 1:time_fac
+        ibeg = base_steps*(s1-1)*time_fac + 1
+        iend = base_steps*s1*time_fac + 1
+        u_avg_med = kuramoto_sivashinsky.
+            calcSolutionAverage(order, view(sol,:,ibeg:iend), ident)
+        u2_avg_med = kuramoto_sivashinsky.
+            calcSolutionAverage(order, view(sol,:,ibeg:iend), square)
+        for s2 = 1:time_fac 
+            # get statistics for the shortest period 
+            ibeg = base_steps*((s1-1)*time_fac + s2 - 1) + 1
+            iend = base_steps*((s1-1)*time_fac + s2) + 1
+            u_avg[ptr,1] = kuramoto_sivashinsky.
+                calcSolutionAverage(order, view(sol,:,ibeg:iend), ident)
+            u2_avg[ptr,1] = kuramoto_sivashinsky.
+                calcSolutionAverage(order, view(sol,:,ibeg:iend), square)
+            cputime[ptr,1] = cpu_long/(time_fac^2)
+            # get statistics for the medium period 
+            u_avg[ptr,2] = u_avg_med
+            u2_avg[ptr,2] = u2_avg_med 
+            cputime[ptr,2] = cpu_long/time_fac
+            # get statistics for the longest period 
+            u_avg[ptr,3] = u_avg_long 
+            u2_avg[ptr,3] = u2_avg_long
+            cputime[ptr,3] = cpu_long
+            
+            ptr += 1
+        end 
+    end
+    return u_avg, u2_avg, cputime
+end
+
 """
     gatherStatsKS()
 
 Runs the KS problem with different discretization orders, mesh sizes and 
-integration periods, and writes results to file.
+integration periods, and writes results to file.  Each sample is also written
+to a shard in `shards/order<p>` as soon as it completes; if the run is 
+restarted, samples whose shard exists are read back instead of recomputed.
 """
 function gatherStatsKS()
     
     # set some parameters
     tp = Float64             # floating point type to use 
-    Lx = convert(tp, 128)    # domain size 
-    spin = convert(tp, 1000) # spin-up period 
-    num_samples = 10         # number of ensemble samples to use
-    
-    # set the discretization parameters
-    dt = 0.01
-    base_time = 40.0
-    base_steps = convert(Int, base_time/dt)
-    time_fac = 10
-    order = [2, 4, 6]
-    num_nodes = Array{Int}(128:32:256) .- 1
-    num_spin = convert(Int, spin/dt)
+    order = orders
+    num_nodes = mesh_nodes
     
     println("Information")
     println("\tdt = ",dt)
@@ -64,8 +186,14 @@ function gatherStatsKS()
         u_avg = zeros(size(dx))
         u2_avg = zeros(size(dx))
         cputime = zeros(size(dx))
-        time = base_time*time_fac^2
-        num_steps = base_steps*time_fac^2
+        names = ["dx", "u_avg", "u2_avg", "cputime"]
+        meta = ["order" => order[p], "tau" => base_time*time_fac.^(0:2)]
+        shard_dir = joinpath("shards", "order$(order[p])")
+        initManifest(shard_dir, ["name" => "ks"; meta; "names" => names;
+                                 "values" => num_nodes; 
+                                 "value_key" => "num_nodes";
+                                 "num_samples" => num_samples;
+                                 "rows" => time_fac^2])
         
         for n = 1:size(num_nodes,1)
             println("\tUsing number of nodes = ",num_nodes[n])
@@ -74,80 +202,52 @@ function gatherStatsKS()
             ks = kuramoto_sivashinsky.buildKSData(order[p], num_nodes[n], tp)
             
             for s = 1:num_samples
-                println("\tRunning long-time sample ",s)
-                # run spin up simulation 
-                u = 2*rand(num_nodes[n]) .- 1
-                sol = kuramoto_sivashinsky.solveUsingMidpoint(ks, spin, num_spin, u)
-                u = sol[2:end-1,end]
-                sol = nothing 
-                
-                # solve for the statistics using longest simulation time 
-                # print("\t") # this is so the elapsed time is indented 
-                cpu_long = @elapsed begin 
-                    sol = kuramoto_sivashinsky.
-                    solveUsingMidpoint(ks, time, num_steps, u)
-                end            
-                if any(isnan, sol)
-                    error("KS failed to solve due to instability.")
-                end
-                
-                # We partition the long-time simulation into smaller periods for
-                # statistics gathering.  For example, if the long-time is 4000
-                # units then we have 1 sample for 4000, 10 samples for 400
-                # units, and 100 samples for 40 units.
-                # The statistics for the medium and long periods are duplicated 
-                # to simplify the file I/O (NumPy loadtxt is easier), so this 
-                # needs to be accounted for by dividing by the same number of 
-                # total samples, which is num_samples*time_fac^2
-                u_avg_long = kuramoto_sivashinsky.
-                    calcSolutionAverage(order[p], sol, ident)
-                u2_avg_long = kuramoto_sivashinsky.
-                    calcSolutionAverage(order[p], sol, square)
-                ptr = (s-1)*time_fac^2 + 1
-                for s1 = 1:time_fac
-                    ibeg = base_steps*(s1-1)*time_fac + 1
-                    iend = base_steps*s1*time_fac + 1
-                    u_avg_med = kuramoto_sivashinsky.
-                        calcSolutionAverage(order[p], view(sol,:,ibeg:iend),
-                                            ident)
-                    u2_avg_med = kuramoto_sivashinsky.
-                        calcSolutionAverage(order[p], view(sol,:,ibeg:iend),
-                                            square)
-                    for s2 = 1:time_fac 
-                        # get statistics for the shortest period 
-                        ibeg = base_steps*((s1-1)*time_fac + s2 - 1) + 1
-                        iend = base_steps*((s1-1)*time_fac + s2) + 1
-                        u_avg[ptr,n,1] = kuramoto_sivashinsky.
-                        calcSolutionAverage(order[p], view(sol,:,ibeg:iend),
-                                            ident)
-                        u2_avg[ptr,n,1] = kuramoto_sivashinsky.
-                        calcSolutionAverage(order[p], view(sol,:,ibeg:iend),
-                                            square)
-                        cputime[ptr,n,1] = cpu_long/(time_fac^2)
-                        # get statistics for the medium period 
-                        u_avg[ptr,n,2] = u_avg_med
-                        u2_avg[ptr,n,2] = u2_avg_med 
-                        cputime[ptr,n,2] = cpu_long/time_fac
-                        # get statistics for the longest period 
-                        u_avg[ptr,n,3] = u_avg_long 
-                        u2_avg[ptr,n,3] = u2_avg_long
-                        cputime[ptr,n,3] = cpu_long
-                        
-                        ptr += 1
-                    end 
+                rows = (s-1)*time_fac^2+1:s*time_fac^2
+                shard = shardName(shard_dir, "ks", order[p], num_nodes[n], s)
+                if isfile(shard)
+                    println("\tReusing long-time sample ",s)
+                    recordShard(shard, order[p], num_nodes[n], s)
+                    _, u_avg[rows,n,:], u2_avg[rows,n,:], cputime[rows,n,:] =
+                        readShard(shard, 4, 3)
+                    continue
                 end
+                println("\tRunning long-time sample ",s)
+                u_avg[rows,n,:], u2_avg[rows,n,:], cputime[rows,n,:] =
+                    sampleStatsKS(ks, order[p])
+                writeShard(shard, order[p], num_nodes[n], s, names,
+                           [dx[rows,n:n,:], u_avg[rows,n:n,:], 
+                            u2_avg[rows,n:n,:], cputime[rows,n:n,:]],
+                           [meta; "num_nodes" => num_nodes[n]; 
+                            "sample" => s])
             end
         end
         
         # write the data
-        data = open("raw_statistics_ks_order$(order[p]).dat", "w")
-        Print3DArray(data, dx)
-        Print3DArray(data, u_avg)
-        Print3DArray(data, u2_avg)
-        Print3DArray(data, cputime)
-        close(data)
+        WriteDataFile("raw_statistics_ks_order$(order[p]).dat", names,
+                      [dx, u_avg, u2_avg, cputime],
+                      [meta; "num_nodes" => num_nodes])
     end
 end 
 
+"""
+    gatherJobKS(order, num_nodes, sample, file_name)
+
+Runs a single (order, mesh, sample) job of `gatherStatsKS` and writes its
+statistics to the shard `file_name`, with blocks of size `(time_fac^2, 1, 3)`
+laid out as in the raw statistics files.  `utils/campaign.py` runs these jobs
+in parallel and merges the shards.
+"""
+function gatherJobKS(order::Int, num_nodes::Int, sample::Int, file_name)
+    tp = Float64
+    ks = kuramoto_sivashinsky.buildKSData(order, num_nodes, tp)
+    dx = fill(Lx/(num_nodes+1), (time_fac^2, 1, 3))
+    u_avg, u2_avg, cputime = sampleStatsKS(ks, order)
+    WriteDataFile(file_name, ["dx", "u_avg", "u2_avg", "cputime"],
+                  [dx, reshape(u_avg, size(dx)), reshape(u2_avg, size(dx)),
+                   reshape(cputime, size(dx))],
+                  ["order" => order, "tau" => base_time*time_fac.^(0:2),
+                   "num_nodes" => num_nodes, "sample" => sample])
+end
+
 end # module KSGather
 
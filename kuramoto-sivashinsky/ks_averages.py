@@ -0,0 +1,153 @@
+"""module for space-time averages of KS solutions in a single streaming pass
+
+`calcSolutionAverage` in `kuramoto-sivashinsky.jl` applies the Gregory rule of
+`buildQuadrature(order)` along both space and time, one integrand and one
+window at a time.  Since the rule is a tensor product, the space-time average
+of `f(u)` over a window is the time average of the spatial averages
+`s_f[n] = w_x . f(u[:,n])`.  `SpaceTimeAverager` uses this to compute any
+number of integrands, for any number of window lengths, from one pass over
+the solution: each chunk of time steps is reduced in space right away, and
+the results are folded into the window averages with `gregory.WindowAverager`.
+"""
+
+import functools
+import os
+import sys
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "utils"))
+from gregory import boundary_weights, WindowAverager
+
+# integrands that are evaluated as powers of u, sharing intermediate products
+powers = {"u": 1, "u2": 2, "u3": 3, "u4": 4}
+
+@functools.lru_cache(maxsize=None)
+def spatial_weights(num_pts, order):
+    """
+    Return the weights that give the spatial average over `num_pts` nodes.
+
+    These are the Gregory weights of `buildQuadrature(order)` (with `order-1`
+    boundary nodes at each end) divided by the number of intervals,
+    `num_pts-1`, as in `calcSolutionAverage`.  The array is read-only.
+    """
+    w = np.ones(num_pts)
+    quad = boundary_weights(order - 1, order)
+    if num_pts < 2*quad.size:
+        raise ValueError("too few nodes for an order {} rule".format(order))
+    w[:quad.size] = quad
+    w[num_pts-quad.size:] = quad[::-1]
+    w /= num_pts - 1
+    w.setflags(write=False)
+    return w
+
+def calc_solution_average(order, sol, func):
+    """
+    Returns the space and time average of `func(sol)` using an `order` order
+    accurate Gregory rule, where `sol[i,n]` is node `i` at time step `n`.
+
+    This is the Python counterpart of `calcSolutionAverage`.
+    """
+    sol = np.asarray(sol, dtype=float)
+    wx = spatial_weights(sol.shape[0], order)
+    wt = spatial_weights(sol.shape[1], order)
+    return wx @ func(sol) @ wt
+
+class SpaceTimeAverager:
+    """
+    Accumulate space-time averages of several integrands over time windows.
+
+    `order` sets the Gregory rule in space and time, `num_pts` is the number
+    of spatial nodes (including the boundary nodes, as in the `sol` arrays
+    returned by `solveUsingMidpoint`), and `window_steps` lists the window
+    lengths, in time steps, to average over.  `integrands` lists the
+    integrands: names from `powers` ("u", "u2", "u3", "u4") or `(name,
+    func)` pairs, where `func` acts elementwise on an array of solution
+    values.  `wx` overrides the spatial weights (e.g. uniform weights for a
+    periodic mesh).  Pass the solution to `update` in chunks of time steps;
+    the memory used does not depend on the number of steps.
+    """
+    def __init__(self, order, num_pts, window_steps, integrands=("u", "u2"),
+                 wx=None):
+        self.order = order
+        if wx is None:
+            wx = spatial_weights(num_pts, order)
+        elif len(wx) != num_pts:
+            raise ValueError("wx must have num_pts entries")
+        self.wx = wx
+        self.names = []
+        self.funcs = []
+        for item in integrands:
+            if isinstance(item, str):
+                if item not in powers:
+                    raise ValueError("unknown integrand " + repr(item))
+                self.names.append(item)
+                self.funcs.append(None)
+            else:
+                self.names.append(item[0])
+                self.funcs.append(item[1])
+        self.windows = WindowAverager(window_steps, order)
+
+    def spatial_averages(self, chunk):
+        """
+        Return the spatial averages of each integrand for the time steps in
+        `chunk`, where `chunk[n,i]` is node `i` at time step `n`.  The result
+        has one row per time step and one column per integrand.
+        """
+        chunk = np.asarray(chunk, dtype=float)
+        cols = []
+        pows = {1: chunk}
+        for name, func in zip(self.names, self.funcs):
+            if func is None:
+                p = powers[name]
+                if p not in pows:
+                    half = pows.get(p//2)
+                    if half is None:
+                        half = chunk**(p//2)
+                    pows[p] = half*half if p % 2 == 0 else half*half*chunk
+                vals = pows[p]
+            else:
+                vals = func(chunk)
+            cols.append(vals @ self.wx)
+        return np.stack(cols, axis=-1)
+
+    def update(self, chunk):
+        """Fold the time steps in `chunk` (`chunk[n,i]`, time-major) in."""
+        self.windows.update(self.spatial_averages(chunk))
+
+    def averages(self, num_steps):
+        """
+        Return a dictionary mapping each integrand name to its averages over
+        the completed windows of `num_steps` time steps.
+        """
+        avg = self.windows.averages(num_steps)
+        if avg.size == 0:
+            return {name: np.zeros(0) for name in self.names}
+        return {name: avg[:,k] for k, name in enumerate(self.names)}
+
+def read_solution_chunks(file_name, chunk_steps=1000):
+    """
+    Yield the space-time solution in `file_name` (the text format written at
+    the end of `solve_ks.jl`, one time step per line) `chunk_steps` time
+    steps at a time, without reading the whole file into memory.
+    """
+    with open(file_name, "r") as f:
+        while True:
+            chunk = np.loadtxt(f, max_rows=chunk_steps, ndmin=2)
+            if chunk.shape[0] == 0:
+                break
+            yield chunk
+
+def stream_averages(chunks, order, window_steps, integrands=("u", "u2")):
+    """
+    Return the `SpaceTimeAverager` obtained by passing every chunk in
+    `chunks` (time-major arrays, e.g. from `read_solution_chunks`) through
+    one pass over the data.
+    """
+    averager = None
+    for chunk in chunks:
+        if averager is None:
+            averager = SpaceTimeAverager(order, chunk.shape[1], window_steps,
+                                         integrands)
+        averager.update(chunk)
+    return averager
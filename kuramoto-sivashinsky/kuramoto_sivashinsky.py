@@ -0,0 +1,261 @@
+"""module for solving the nonperiodic KS problem with streamed statistics
+
+This is a Python counterpart of `kuramoto-sivashinsky.jl` for the problem
+with homogeneous Dirichlet and Neumann conditions.  The operators are built
+exactly as in `buildKSData` (ghost-node elimination for the linear terms and
+a boundary first-derivative operator for the skew-symmetric nonlinear term),
+but they are stored and applied as banded matrices: the nonlinear term is
+evaluated with vectorized stencil slices, and each Newton step of the
+implicit midpoint rule uses a banded solve.  Instead of storing the whole
+space-time solution, `solve_using_midpoint` can pass the time steps to a
+`ks_averages.SpaceTimeAverager` in fixed-size chunks, so the memory used does
+not grow with the integration period.
+"""
+
+import collections
+import math
+import time as timer
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+from ks_averages import SpaceTimeAverager
+
+FiniteDiff = collections.namedtuple("FiniteDiff", ["stencil", "coeffs"])
+FiniteDiff.__doc__ = """Finite-difference operator on uniformly spaced points;
+`stencil` holds the node offsets and `coeffs` the coefficients."""
+
+def build_finite_difference(deriv, order, h=1.0):
+    """
+    Returns a centered finite-difference operator for a derivative of order
+    `deriv` and order of accuracy `order`; `h` sets the mesh spacing.
+    """
+    num_pts = deriv + order - 1
+    if num_pts % 2 == 0:
+        num_pts += 1
+    half = (num_pts - 1)//2
+    stencil = np.arange(-half, half + 1)
+    V = np.vander(stencil, num_pts, increasing=True).T.astype(float)
+    b = np.zeros(num_pts)
+    b[deriv] = math.factorial(deriv)
+    return FiniteDiff(stencil, np.linalg.solve(V, b)/h**deriv)
+
+def build_ghost_op(order):
+    """
+    Returns `(num_ghost, num_bndry, ghost_op)`, where `ghost_op` produces the
+    `num_ghost` ghost values (including the boundary node) from the first
+    `num_bndry` interior nodes, such that u = 0 and du/dx = 0 at the boundary.
+    See `buildGhostOp` for details.
+    """
+    fd = build_finite_difference(1, order)
+    num_pts = fd.stencil.size
+    num_ghost = (num_pts - 1)//2 + 1
+    num_bndry = num_pts - num_ghost
+    A = np.zeros((2, num_ghost))
+    A[0,-1] = 1.0
+    A[1,:] = fd.coeffs[:num_ghost]
+    B = np.zeros((2, num_bndry))
+    B[1,:] = fd.coeffs[num_ghost:]
+    return num_ghost, num_bndry, -A.T @ np.linalg.solve(A @ A.T, B)
+
+class KSData:
+    """
+    Operators for the KS problem on `num_nodes` interior nodes.
+
+    `linear_op` is the sparse linear (Laplacian plus biLaplacian) operator,
+    `linear_band` the same operator in the diagonal-ordered form used by
+    `scipy.linalg.solve_banded` with `bandwidth` sub- and super-diagonals,
+    `fd` the first-derivative operator for the interior nodes, and
+    `bndry_op` the first-derivative operator for the `num_bndry` nodes next
+    to each boundary.
+    """
+    def __init__(self, order, num_nodes, num_ghost, num_bndry, bndry_op,
+                 linear_op, fd):
+        self.order = order
+        self.num_nodes = num_nodes
+        self.num_ghost = num_ghost
+        self.num_bndry = num_bndry
+        self.bndry_op = bndry_op
+        self.linear_op = scipy.sparse.csr_matrix(linear_op)
+        self.fd = fd
+        # the band must hold the linear operator and the nonlinear Jacobian
+        rows, cols = np.nonzero(linear_op)
+        self.bandwidth = int(max(np.max(np.abs(rows - cols)),
+                                 np.max(np.abs(fd.stencil)),
+                                 bndry_op.shape[1] - 1))
+        self.linear_band = to_banded(linear_op, self.bandwidth)
+
+def to_banded(A, bandwidth):
+    """Return the square matrix `A` in diagonal-ordered banded form."""
+    n = A.shape[0]
+    ab = np.zeros((2*bandwidth + 1, n))
+    for off in range(-bandwidth, bandwidth + 1):
+        diag = np.diagonal(A, off)
+        if off >= 0:
+            ab[bandwidth - off, off:] = diag
+        else:
+            ab[bandwidth - off, :n+off] = diag
+    return ab
+
+def _eliminate_ghosts(A, fd, fac, num_bndry, num_ghost, Bg):
+    """Add the terms of stencil `fd` (scaled by `fac`) to `A`, eliminating
+    the ghost nodes with `Bg` at both ends."""
+    n = A.shape[0]
+    for i in range(n):
+        idx = (fd.stencil + i >= 0) & (fd.stencil + i < n)
+        A[i, fd.stencil[idx] + i] -= fd.coeffs[idx]*fac
+    Ag = np.zeros((num_bndry, num_ghost))
+    for i in range(num_bndry):
+        idx = fd.stencil + i < 0
+        Ag[i, fd.stencil[idx] + num_ghost + i] -= fd.coeffs[idx]*fac
+    G = Ag @ Bg
+    A[:num_bndry,:num_bndry] += G
+    A[::-1,::-1][:num_bndry,:num_bndry] += G
+
+def build_ks_data(order, num_nodes):
+    """
+    Returns a `KSData` structure for the KS equations on `num_nodes` interior
+    nodes with homogeneous Dirichlet and Neumann conditions at the ends of
+    the domain, following `buildKSData`.
+    """
+    Lx = 128.0
+    h = Lx/(num_nodes + 1)
+    num_ghost, num_bndry, Bg = build_ghost_op(order)
+    A = np.zeros((num_nodes, num_nodes))
+    # Laplacian and biLaplacian terms, with ghost contributions eliminated
+    _eliminate_ghosts(A, build_finite_difference(2, order), 1/h**2,
+                      num_bndry, num_ghost, Bg)
+    _eliminate_ghosts(A, build_finite_difference(4, order), 1/h**4,
+                      num_bndry, num_ghost, Bg)
+    # first-derivative operator for nonlinear terms, and its boundary version
+    fd = build_finite_difference(1, order, h=h)
+    Ag = np.zeros((num_bndry, num_ghost))
+    G = np.zeros((num_bndry, (fd.stencil.size + 1)//2 + num_bndry - 1))
+    for i in range(num_bndry):
+        idx = fd.stencil + i < 0
+        Ag[i, fd.stencil[idx] + num_ghost + i] += fd.coeffs[idx]
+        idx = fd.stencil + i >= 0
+        G[i, fd.stencil[idx] + i] += fd.coeffs[idx]
+    G[:,:num_bndry] += Ag @ Bg
+    return KSData(order, num_nodes, num_ghost, num_bndry, G, A, fd)
+
+def _stencil_sum(ks, v):
+    """Return sum_k coeffs[k]*v[i+stencil[k]] for the interior nodes i."""
+    n = ks.num_nodes
+    nb = ks.num_bndry
+    out = np.zeros(n - 2*nb)
+    for s, c in zip(ks.fd.stencil, ks.fd.coeffs):
+        out += c*v[nb+s:n-nb+s]
+    return out
+
+def get_ks_func(ks, u):
+    """
+    Returns the spatial discretization of the KS equation at `u`; see
+    `getKSFunc!`.  The nonlinear term uses the skew-symmetric split form.
+    """
+    du = ks.linear_op @ u
+    n = ks.num_nodes
+    nb = ks.num_bndry
+    third = 1.0/3.0
+    u2 = u*u
+    du[nb:n-nb] -= third*(u[nb:n-nb]*_stencil_sum(ks, u)
+                          + _stencil_sum(ks, u2))
+    m = ks.bndry_op.shape[1]
+    G = ks.bndry_op
+    urev = u[::-1]
+    du[:nb] -= third*(u[:nb]*(G @ u[:m]) + G @ u2[:m])
+    du[::-1][:nb] += third*(
+        urev[:nb]*(G @ urev[:m]) + G @ (urev[:m]*urev[:m]))
+    return du
+
+def get_ks_jac_banded(ks, u):
+    """
+    Returns the Jacobian of `get_ks_func` at `u` in the diagonal-ordered
+    banded form with `ks.bandwidth` sub- and super-diagonals; see
+    `getKSJac!`.
+    """
+    ab = ks.linear_band.copy()
+    n = ks.num_nodes
+    nb = ks.num_bndry
+    bw = ks.bandwidth
+    third = 1.0/3.0
+    interior = slice(nb, n - nb)
+    # du[i] -= third*(u[i]*D(u)[i] + D(u^2)[i]) on the interior
+    ab[bw, interior] -= third*_stencil_sum(ks, u)
+    for s, c in zip(ks.fd.stencil, ks.fd.coeffs):
+        ab[bw - s, nb+s:n-nb+s] -= third*c*(u[interior] + 2*u[nb+s:n-nb+s])
+    # boundary rows, at both ends of the domain
+    G = ks.bndry_op
+    m = G.shape[1]
+    for i in range(nb):
+        ab[bw, i] -= third*(G[i] @ u[:m])
+        ab[bw, n-1-i] += third*(G[i] @ u[::-1][:m])
+        for k in range(m):
+            ab[bw + i - k, k] -= third*G[i,k]*(u[i] + 2*u[k])
+            r, c = n - 1 - i, n - 1 - k
+            ab[bw + r - c, c] += third*G[i,k]*(u[r] + 2*u[c])
+    return ab
+
+def solve_using_midpoint(ks, Time, num_steps, u, averager=None,
+                         chunk_steps=1000, newt_tol=1e-10, max_newt_iter=50):
+    """
+    Solve the KS problem with the implicit midpoint rule from t=0 to `Time`
+    using `num_steps` steps, starting from the interior values `u`.
+
+    Returns the interior values at the final time.  If `averager` (a
+    `ks_averages.SpaceTimeAverager`) is given, every time step, including
+    the initial condition and with the zero boundary values added as in
+    `solveUsingMidpoint`, is passed to it in chunks of `chunk_steps` steps,
+    so the memory used is independent of `num_steps`.
+    """
+    u = np.array(u, dtype=float)
+    n = u.size
+    dt = Time/num_steps
+    bw = ks.bandwidth
+    buf = None
+    if averager is not None:
+        buf = np.zeros((chunk_steps, n + 2))
+        buf[0,1:-1] = u
+        fill = 1
+    for step in range(num_steps):
+        u_old = u.copy()
+        norm0 = 1.0
+        for k in range(max_newt_iter):
+            u_mid = 0.5*(u + u_old)
+            r = u - u_old - dt*get_ks_func(ks, u_mid)
+            rnorm = np.linalg.norm(r)
+            if k == 0:
+                norm0 = rnorm
+            elif rnorm < newt_tol*norm0:
+                break
+            # Jac = 0.5*dt*dF/du - I, and u += Jac \ r
+            ab = get_ks_jac_banded(ks, u_mid)
+            ab *= 0.5*dt
+            ab[bw] -= 1.0
+            u += scipy.linalg.solve_banded((bw, bw), ab, r,
+                                           check_finite=False)
+        if buf is not None:
+            buf[fill,1:-1] = u
+            fill += 1
+            if fill == chunk_steps:
+                averager.update(buf)
+                fill = 0
+    if buf is not None and fill > 0:
+        averager.update(buf[:fill])
+    return u
+
+def run_statistics(ks, Time, num_steps, u, window_steps,
+                   integrands=("u", "u2"), chunk_steps=1000):
+    """
+    Solve from `u` over `Time` with `num_steps` steps while accumulating the
+    space-time averages of `integrands` over windows of `window_steps` steps.
+
+    Returns `(averager, u, cputime)`: the `SpaceTimeAverager` holding the
+    window averages, the final interior values, and the elapsed time of the
+    solve in seconds.
+    """
+    averager = SpaceTimeAverager(ks.order, ks.num_nodes + 2, window_steps,
+                                 integrands)
+    start = timer.perf_counter()
+    u = solve_using_midpoint(ks, Time, num_steps, u, averager=averager,
+                             chunk_steps=chunk_steps)
+    return averager, u, timer.perf_counter() - start
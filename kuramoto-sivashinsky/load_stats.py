@@ -1,7 +1,15 @@
 """module for opening and extracting data from statistics files"""
 
+import os
+import sys
 import numpy as np 
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "utils"))
+from stats_cube import load_stats_cube
+from summary_stats import load_summary
+from data_header import legacy_blocks, load_block
+
 # benchmark values: each value corresponds to one run of 10,000 time units
 u_avg_vals = np.array([0.0036085040322204457, 0.017162563361389372, -0.006088325288715798, -0.010631336720701254, 0.007368644678970582, -0.014816141976358967, 0.0029188453204799813, 0.0059640957789224205, 0.011339885974491, 0.005670395778808522])
 u2_avg_vals = np.array([1.6188001393490339, 1.6125466976326321, 1.623312488441052, 1.6224184238235249, 1.626842627264861, 1.6137903994866671, 1.6316554298925166, 1.618702561149633, 1.6278317446004285, 1.6237992034233588])
@@ -12,6 +20,78 @@ u2_avg_ref = np.mean(u2_avg_vals) # 1.621969971506371
 print('u_avg_ref = ', u_avg_ref)
 print('u2_avg_ref = ', u2_avg_ref)
 
+# the blocks written by gatherStatsKS, in file order
+quantities = ("dx", "u_avg", "u2_avg", "cputime")
+
+# domain size, time step and spin-up period of `chaotic_statistics_gather.jl`
+domain_length = 128.0
+time_step = 0.01
+spin_time = 1000.0
+
+def load_cube(file_name, num_meshes, num_times):
+    """
+    Return the raw KS data in `file_name` as a `StatsCube`.
+
+    `file_name` may also be a shard directory (e.g. `shards/order2`), in
+    which case the cube holds the samples completed so far; this applies to
+    the other loaders below as well.
+
+    The cube has axes (quantity, tau, mesh, sample), with quantities labeled
+    by `quantities`.  See `load_stats_cube` for details.
+    """
+    return load_stats_cube(file_name, quantities, num_meshes, num_times)
+
+def load_summary_table(file_name, num_meshes, num_times):
+    """
+    Return the box-plot summaries of the percent errors of `u_avg` and
+    `u2_avg` in `file_name`, against `u_avg_ref` and `u2_avg_ref`, as a
+    `SummaryTable` with axes (qoi, field, tau, mesh).  See `load_summary`.
+    """
+    return load_summary(file_name, quantities, num_meshes, num_times,
+                        dict(u_avg=u_avg_ref, u2_avg=u2_avg_ref))
+
+def sketch_stats(file_name, num_meshes, num_times, rel_err=0.01):
+    """
+    Return the mergeable sketches of the percent errors of `u_avg` and
+    `u2_avg`, and of the cpu time, in `file_name` as a `StatsSketch` with
+    axes (channel, tau, mesh).  Save it with `sketches.save_sketch` to
+    combine campaigns run on separate machines; see `sketches.py`.
+    """
+    from sketches import sketch_cube
+    return sketch_cube(load_cube(file_name, num_meshes, num_times),
+                       dict(u_avg=u_avg_ref, u2_avg=u2_avg_ref),
+                       rel_err=rel_err)
+
+def extrapolate_reference(data_files, orders, num_meshes, num_times,
+                          time_idx, quantity="u2_avg", terms=1):
+    """
+    Return the Richardson extrapolation of the mean of `quantity`, for the
+    integration period `time_idx`, from the raw data `data_files` of the
+    schemes of accuracy `orders`, e.g. (2, 4, 6), as a `ReferenceFit`.  See
+    `convergence.extrapolate_cubes`.
+    """
+    from convergence import extrapolate_cubes
+    cubes = [load_cube(file_name, num_meshes, num_times)
+             for file_name in data_files]
+    return extrapolate_cubes(cubes, orders, quantity, time_idx, terms)
+
+def cost_planner(data_files, orders, num_meshes, num_times, tau,
+                 quantity="u2_avg", field="med"):
+    """
+    Return a `CostPlanner` for the percent errors of `quantity` (the summary
+    `field`, e.g. "med") and the cpu times in `data_files`, the raw data of
+    the schemes of accuracy `orders` with the integration periods `tau`.
+    A run on the mesh dx has `domain_length/dx - 1` nodes and steps of
+    `time_step`, after a spin-up of `spin_time`.  See `cost_model.py`.
+    """
+    from cost_model import CostPlanner
+    tables = [load_summary_table(file_name, num_meshes, num_times)
+              for file_name in data_files]
+    return CostPlanner(tables, orders, tau, quantity,
+                       nodes=lambda dx: domain_length/dx - 1,
+                       dt=lambda dx: np.full_like(dx, time_step),
+                       spin=spin_time, field=field)
+
 def load_dx_stats(file_name, num_meshes, num_times, time_idx):
     """
     Extract data for different dx values for fixed integration period.
@@ -20,28 +100,16 @@ def load_dx_stats(file_name, num_meshes, num_times, time_idx):
     should correspond to a run with `num_meshes` different mesh sizes and
     `num_times` distinct integration periods.  This function extracts all
     the data (`dx` values, `u_avg` data, `u2_avg` data, and `cputime` values)
-    for the time integration period corresponding to `time_idx`.
+    for the time integration period corresponding to `time_idx`.  The
+    returned arrays are views into the cube from `load_cube`.
     """
-    if num_meshes <= 0:
-        raise ValueError("num_meshes must be positive!")
-    if num_times <=0:
-        raise ValueError("num_times must be positive!")
     if time_idx < 0 or time_idx >= num_times:
         raise ValueError("time_idx must be >= 0 and < num_times!")
-    data = np.loadtxt(file_name)
-    offset = num_meshes*num_times 
-    if data.shape[0] != 4*offset:
-        raise ValueError("num_meshes and/or num_times inconsistent with "
-                         + file_name)
-    # the dx values repeat, so just grab the first num_meshes values 
-    dx = data[0:num_meshes,0] 
-    ptr = offset + time_idx*num_meshes
-    u_avg = data[ptr:ptr+num_meshes,:]
-    ptr = 2*offset + time_idx*num_meshes
-    u2_avg = data[ptr:ptr+num_meshes,:]
-    ptr = 3*offset + time_idx*num_meshes
-    cputime = data[ptr:ptr+num_meshes,:]
-    return dx, u_avg.T, u2_avg.T, cputime.T  
+    cube = load_cube(file_name, num_meshes, num_times)
+    # the dx values repeat, so just grab those of the first sample 
+    dx = cube.mesh_values()
+    return (dx, cube["u_avg"][time_idx].T, cube["u2_avg"][time_idx].T,
+            cube["cputime"][time_idx].T)
 
 def load_time_stats(file_name, num_meshes, num_times, dx_idx):
     """
@@ -51,25 +119,35 @@ def load_time_stats(file_name, num_meshes, num_times, dx_idx):
     should correspond to a run with `num_meshes` different mesh sizes and
     `num_times` distinct integration periods.  This function extracts all
     the data (`dx` values, `u_avg` data, `u2_avg` data, and `cputime` values)
-    for the mesh size corresponding to `dx_idx`.
+    for the mesh size corresponding to `dx_idx`.  The returned arrays are
+    views into the cube from `load_cube`.
     """
-    if num_meshes <= 0:
-        raise ValueError("num_meshes must be positive!")
-    if num_times <=0:
-        raise ValueError("num_times must be positive!")
     if dx_idx < 0 or dx_idx >= num_meshes:
         raise ValueError("dx_idx must be >= 0 and < num_meshes!")
-    data = np.loadtxt(file_name)
-    offset = num_meshes*num_times 
-    if data.shape[0] != 4*offset:
-        raise ValueError("num_meshes and/or num_times inconsistent with "
-                         + file_name)
-    dx = data[dx_idx, 0]
-    ptr = offset
-    u_avg = data[ptr+dx_idx:ptr+offset:num_meshes,:]
-    ptr = 2*offset 
-    u2_avg = data[ptr+dx_idx:ptr+offset:num_meshes,:]
-    ptr = 3*offset 
-    cputime = data[ptr+dx_idx:ptr+offset:num_meshes,:]
-    return dx, u_avg.T, u2_avg.T, cputime.T 
+    cube = load_cube(file_name, num_meshes, num_times)
+    dx = cube.mesh_values()[dx_idx]
+    return (dx, cube["u_avg"][:,dx_idx,:].T, cube["u2_avg"][:,dx_idx,:].T,
+            cube["cputime"][:,dx_idx,:].T)
+
+# the blocks written by verify_spatial_accuracy.jl, in file order
+verify_quantities = ("dx", "dt", "err_avg", "err_sqavg", "cputime")
 
+def load_verify_block(file_name, name, num_orders=None, num_meshes=None,
+                      num_steps=None):
+    """
+    Extract one block of the verification data written by
+    `verify_spatial_accuracy.jl`.
+
+    Returns the block `name` (one of `verify_quantities`) of `file_name` as an
+    array indexed by [order, mesh, time step].  If the file has a header, the
+    block is read without parsing the others, and any of `num_orders`,
+    `num_meshes` and `num_steps` that are given are checked against it.
+    Files without a header need all three sizes to locate the block.
+    """
+    legacy = None
+    if None not in (num_orders, num_meshes, num_steps):
+        legacy = legacy_blocks(verify_quantities,
+                               [(num_orders, num_meshes, num_steps)]*
+                               len(verify_quantities))
+    return load_block(file_name, name, shape=(num_orders, num_meshes,
+                                              num_steps), legacy=legacy)
@@ -0,0 +1,150 @@
+"""module for a pseudo-spectral reference solver of the periodic KS problem
+
+`solve_periodic_ks.jl` discretizes u_t = -u_xx - u_xxxx - u u_x on a periodic
+domain of length 128 with finite differences and marches it with the implicit
+midpoint rule, which needs very fine meshes and small steps before the
+statistics are accurate to many digits.  This module instead represents u by
+its Fourier coefficients and marches it with the fourth-order exponential
+time differencing Runge-Kutta scheme (ETDRK4) of Cox and Matthews.  The stiff
+linear terms are integrated exactly, and the ETDRK4 coefficients are
+evaluated with the contour integrals of Kassam and Trefethen to avoid
+cancellation for small |L dt|.  Every time step is passed in chunks to a
+`ks_averages.SpaceTimeAverager`, so the u and u^2 averages are accumulated
+exactly as for the finite-difference solvers.
+
+Usage from the command line, with the parameters of `solve_periodic_ks.jl`:
+
+    python periodic_ks_spectral.py [num_nodes] [Time] [num_steps]
+"""
+
+import sys
+import time as timer
+import numpy as np
+from ks_averages import SpaceTimeAverager
+
+class SpectralKSData:
+    """
+    Operators and ETDRK4 coefficients for the periodic KS problem.
+
+    The solution is held as the `rfft` of its values at the `num_nodes`
+    uniformly spaced nodes x = 0, h, ..., Lx-h.  `E` and `E2` are the
+    exponentials of the linear operator over a full and half step, and `Q`,
+    `f1`, `f2` and `f3` are the ETDRK4 coefficients, with the factor of the
+    nonlinear term, -ik/2, already included.
+    """
+    def __init__(self, num_nodes, dt, Lx, num_contour):
+        self.num_nodes = num_nodes
+        self.dt = dt
+        self.Lx = Lx
+        k = 2*np.pi/Lx*np.arange(num_nodes//2 + 1)
+        if num_nodes % 2 == 0:
+            k[-1] = 0.0 # drop the derivative of the Nyquist mode
+        L = k**2 - k**4
+        self.linear = L
+        self.E = np.exp(dt*L)
+        self.E2 = np.exp(0.5*dt*L)
+        # contour integrals over points on circles about each dt*L
+        r = np.exp(1j*np.pi*(np.arange(1, num_contour + 1) - 0.5)/num_contour)
+        LR = dt*L[:,None] + r[None,:]
+        eLR = np.exp(LR)
+        g = -0.5j*k
+        self.Q = g*dt*np.real(np.mean((np.exp(0.5*LR) - 1)/LR, axis=1))
+        self.f1 = g*dt*np.real(np.mean(
+            (-4 - LR + eLR*(4 - 3*LR + LR**2))/LR**3, axis=1))
+        self.f2 = g*dt*np.real(np.mean(
+            (2 + LR + eLR*(-2 + LR))/LR**3, axis=1))
+        self.f3 = g*dt*np.real(np.mean(
+            (-4 - 3*LR - LR**2 + eLR*(4 - LR))/LR**3, axis=1))
+
+def build_spectral_data(num_nodes, dt, Lx=128.0, num_contour=32):
+    """
+    Returns a `SpectralKSData` structure for `num_nodes` Fourier nodes on a
+    periodic domain of length `Lx` and a time step `dt`.  `num_contour`
+    points are used for the contour integrals of the ETDRK4 coefficients.
+    """
+    return SpectralKSData(num_nodes, dt, Lx, num_contour)
+
+def _nonlinear(n, v):
+    """Return the Fourier coefficients of u^2, where v = rfft(u)."""
+    return np.fft.rfft(np.fft.irfft(v, n)**2)
+
+def etdrk4_step(sp, v):
+    """Return the Fourier coefficients `v` advanced by one ETDRK4 step."""
+    n = sp.num_nodes
+    Nv = _nonlinear(n, v)
+    a = sp.E2*v + sp.Q*Nv
+    Na = _nonlinear(n, a)
+    b = sp.E2*v + sp.Q*Na
+    Nb = _nonlinear(n, b)
+    c = sp.E2*a + sp.Q*(2*Nb - Nv)
+    Nc = _nonlinear(n, c)
+    return sp.E*v + Nv*sp.f1 + 2*(Na + Nb)*sp.f2 + Nc*sp.f3
+
+def solve_using_etdrk4(sp, num_steps, u, averager=None, chunk_steps=1000):
+    """
+    Solve the periodic KS problem with ETDRK4 for `num_steps` steps of size
+    `sp.dt`, starting from the nodal values `u`.
+
+    Returns the nodal values at the final time.  If `averager` (a
+    `ks_averages.SpaceTimeAverager` over `sp.num_nodes` points) is given,
+    every time step, including the initial condition, is passed to it in
+    chunks of `chunk_steps` steps, so the memory used is independent of
+    `num_steps`.
+    """
+    n = sp.num_nodes
+    v = np.fft.rfft(np.asarray(u, dtype=float))
+    buf = None
+    if averager is not None:
+        buf = np.zeros((chunk_steps, n))
+        buf[0] = np.fft.irfft(v, n)
+        fill = 1
+    for step in range(num_steps):
+        v = etdrk4_step(sp, v)
+        if buf is not None:
+            buf[fill] = np.fft.irfft(v, n)
+            fill += 1
+            if fill == chunk_steps:
+                averager.update(buf)
+                fill = 0
+    if buf is not None and fill > 0:
+        averager.update(buf[:fill])
+    return np.fft.irfft(v, n)
+
+def run_statistics(num_nodes, Time, num_steps, u, window_steps,
+                   integrands=("u", "u2"), order=4, transient_steps=0,
+                   chunk_steps=1000):
+    """
+    Solve from `u` over `Time` with `num_steps` ETDRK4 steps while
+    accumulating the space-time averages of `integrands` over windows of
+    `window_steps` steps.
+
+    The spatial averages are plain means over the nodes, which are
+    spectrally accurate on the periodic mesh, while the time averages use
+    the Gregory rule of order `order`.  The first `transient_steps` steps
+    (of the same size, Time/num_steps) are taken before the averaging
+    starts.  Returns `(averager, u, cputime)`, as in
+    `kuramoto_sivashinsky.run_statistics`.
+    """
+    sp = build_spectral_data(num_nodes, Time/num_steps)
+    averager = SpaceTimeAverager(order, num_nodes, window_steps, integrands,
+                                 wx=np.full(num_nodes, 1.0/num_nodes))
+    start = timer.perf_counter()
+    if transient_steps > 0:
+        u = solve_using_etdrk4(sp, transient_steps, u)
+    u = solve_using_etdrk4(sp, num_steps, u, averager=averager,
+                           chunk_steps=chunk_steps)
+    return averager, u, timer.perf_counter() - start
+
+if __name__ == "__main__":
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 128
+    Time = float(sys.argv[2]) if len(sys.argv) > 2 else 500.0
+    num_steps = int(sys.argv[3]) if len(sys.argv) > 3 else 5000
+    Lx = 128.0
+    x = np.arange(num_nodes)*Lx/num_nodes
+    u = np.exp(-((x - 64)**2)/512)
+    averager, u, cputime = run_statistics(num_nodes, Time, num_steps, u,
+                                          [num_steps])
+    avg = averager.averages(num_steps)
+    print("u averaged = ", avg["u"][0])
+    print("u^2 averaged = ", avg["u2"][0])
+    print("cputime = ", cputime)
@@ -1,11 +1,12 @@
 """
-Plot the error versus mesh size for the KS verification problem 
+Plot the error versus mesh size for the KS verification problem
 """
 
 order = [2, 4, 6] #, 8]
 
 dump=True # set to True to write a png file
 dt_idx = 2 # 0 = coarsest time step, 2 = finest time step
+fit_points = 3 # number of finest meshes the convergence rate is fitted to
 
 import matplotlib
 if dump:
@@ -16,6 +17,8 @@ from matplotlib.path import Path
 import matplotlib.patches as patches
 import numpy as np
 import math
+from load_stats import load_verify_block
+from convergence import fit_error_model
 
 # set some formating parameters
 axis_fs = 14 # axis title font size
@@ -37,109 +40,121 @@ def plotRate(p, loc, dx, ax):
             ha='center',va='top', bbox=dict(facecolor='w',edgecolor='w',zorder=1, alpha=0.0), \
             zorder=1)
 
-# set figure size in inches, and crete a single set of axes
-fig = plt.figure(figsize=(3,4), facecolor='w', dpi=300)
-ax = fig.add_subplot(111)
-
-data_file = open('./verify_accuracy_ks.dat', 'r')
-#data_file = open('./accuracy_ks.dat', 'r')
-data = np.loadtxt(data_file)
-offset = 8 # 8 meshes for verify_accuracy_ks.dat
-ptr = 0
-dx = data[0:offset*3,:]
-ptr += offset*3
-dt = data[ptr:ptr+offset*3,:]
-ptr += offset*3
-err_avg = data[ptr:ptr+offset*3,:]
-ptr += offset*3
-err_sqavg = data[ptr:ptr+offset*3,:]
-ptr += offset*3
-cputime = data[ptr:ptr+offset*3,:]
-
-print("dx = ",dx)
-print("dt = ",dt)
-
-colors = ['lightskyblue', 'cornflowerblue', 'navy']
-style = [':o', '--s', '-d']
-lw = [2.0, 1.5, 1.0]
-ms = [6, 5, 4]
-line_h = []
-
-for d in range(len(order)):
-    error = err_sqavg[d*offset:(d+1)*offset,dt_idx] # error for smallest time step
-    deltax = dx[d*offset:(d+1)*offset,-1]
-    rate = np.log(error[-1]/error[-2])/np.log(deltax[-1]/deltax[-2])
-    print("maxdeg ",order[d]," rate is ",rate)
-    plotRate(p=rate, loc=[deltax[-1], 0.7*error[-1]], dx=0.1, ax=ax)
-    h, = ax.plot(deltax[:], error[:], style[d], lw=lw[d], color=colors[d],
-                 ms=ms[d])
-    line_h.append(h)
-
-# Tweak the appearance of the axes
-ax.axis([0.2, 3.0, 1e-6, 1.])  # axes ranges
-ax.set_position([0.26, 0.12, 0.735, 0.855]) # position relative to figure edges
-#ax.set_position([0.21, 0.12, 0.785, 0.855]) # position relative to figure edges
-ax.set_xlabel("$\Delta x$", fontsize=axis_fs, weight='bold', labelpad=0)
-ax.xaxis.set_label_coords(0.4, -0.08)
-#ax.xaxis.set_label_coords(0.65, -0.09)
-#ax.set_ylabel("$L^2$ Error", fontsize=axis_fs, weight='normal', rotation=90)
-ax.set_ylabel("Functional Error", fontsize=axis_fs, weight='normal', rotation=90)
-ax.yaxis.set_label_coords(-0.23, 0.5)
-#ax.yaxis.set_label_coords(-0.18, 0.5)
-
-ax.set_yscale('log')
-ax.set_xscale('log') #, subsx=[])
-for axis in ['top','bottom','left','right']:
-  ax.spines[axis].set_linewidth(axis_lw)
-
-ax.set_xticklabels([], minor=True)
-#plt.minorticks_labels_off()
-
-ax.grid(which='major', axis='y', linestyle=':')
-ax.set_axisbelow(True) # grid lines are plotted below
-
-# ticks on bottom and left only
-ax.xaxis.tick_bottom() # use ticks on bottom only
-ax.yaxis.tick_left()
-for line in ax.xaxis.get_ticklines():
-    line.set_markersize(-6) # length of the tick
-    line.set_markeredgewidth(axis_lw) # thickness of the tick
-for line in ax.yaxis.get_ticklines():
-    line.set_markersize(-6) # length of the tick
-    line.set_markeredgewidth(axis_lw) # thickness of the tick
-for label in ax.xaxis.get_ticklabels():
-    label.set_fontsize(label_fs)
-for label in ax.yaxis.get_ticklabels():
-    label.set_fontsize(label_fs)
-for tick in ax.get_xaxis().get_major_ticks():
-    tick.set_pad(8.)
-    #tick.label1 = tick._get_text1()
-for tick in ax.get_yaxis().get_major_ticks():
-    tick.set_pad(8.)
-    #tick.label1 = tick._get_text1()
-
-# We change the fontsize of minor ticks label
-ax.tick_params(axis='both', which='major', labelsize=label_fs)
-ax.tick_params(axis='both', which='minor', labelsize=label_fs)
-#ax.axhline(linewidth=axis_lw)
-#ax.axvline(linewidth=axis_lw)
-
-leglabels = []
-for d in order:
-    if d == 2:
-        leglabels.append(str(d)+"nd order")
+data_file = './verify_accuracy_ks.dat'
+#data_file = './accuracy_ks.dat'
+# sizes are only needed for files written without a header; 8 meshes and 3
+# time steps for verify_accuracy_ks.dat
+num_meshes = 8
+num_steps = 3
+
+def plot_error_verification(dt_idx=dt_idx, verbose=True,
+                            data_file=data_file, fit_points=fit_points):
+    """
+    Return the figure of the functional error versus dx for the time step
+    `dt_idx` of the verification data in `data_file`.  The rates are
+    least-squares fits to the `fit_points` finest meshes.  The step sizes
+    and observed rates, with their standard errors, are printed if
+    `verbose` is set.
+    """
+    # set figure size in inches, and crete a single set of axes
+    fig = plt.figure(figsize=(3,4), facecolor='w', dpi=300)
+    ax = fig.add_subplot(111)
+
+    dx = load_verify_block(data_file, "dx", len(order), num_meshes, num_steps)
+    dt = load_verify_block(data_file, "dt", len(order), num_meshes, num_steps)
+    err_sqavg = load_verify_block(data_file, "err_sqavg", len(order), num_meshes,
+                                  num_steps)
+
+    if verbose:
+        print("dx = ",dx)
+        print("dt = ",dt)
+
+    colors = ['lightskyblue', 'cornflowerblue', 'navy']
+    style = [':o', '--s', '-d']
+    lw = [2.0, 1.5, 1.0]
+    ms = [6, 5, 4]
+    line_h = []
+
+    for d in range(len(order)):
+        error = err_sqavg[d,:,dt_idx] # error for selected time step
+        deltax = dx[d,:,-1]
+        fit = fit_error_model(deltax[-fit_points:], error[-fit_points:])
+        rate = fit.rate
+        if verbose:
+            print("maxdeg ",order[d]," rate is ",rate," +/- ",fit.rate_se)
+        plotRate(p=rate, loc=[deltax[-1], 0.7*error[-1]], dx=0.1, ax=ax)
+        h, = ax.plot(deltax[:], error[:], style[d], lw=lw[d], color=colors[d],
+                     ms=ms[d])
+        line_h.append(h)
+
+    # Tweak the appearance of the axes
+    ax.axis([0.2, 3.0, 1e-6, 1.])  # axes ranges
+    ax.set_position([0.26, 0.12, 0.735, 0.855]) # position relative to figure edges
+    #ax.set_position([0.21, 0.12, 0.785, 0.855]) # position relative to figure edges
+    ax.set_xlabel("$\Delta x$", fontsize=axis_fs, weight='bold', labelpad=0)
+    ax.xaxis.set_label_coords(0.4, -0.08)
+    #ax.xaxis.set_label_coords(0.65, -0.09)
+    #ax.set_ylabel("$L^2$ Error", fontsize=axis_fs, weight='normal', rotation=90)
+    ax.set_ylabel("Functional Error", fontsize=axis_fs, weight='normal', rotation=90)
+    ax.yaxis.set_label_coords(-0.23, 0.5)
+    #ax.yaxis.set_label_coords(-0.18, 0.5)
+
+    ax.set_yscale('log')
+    ax.set_xscale('log') #, subsx=[])
+    for axis in ['top','bottom','left','right']:
+      ax.spines[axis].set_linewidth(axis_lw)
+
+    ax.set_xticklabels([], minor=True)
+    #plt.minorticks_labels_off()
+
+    ax.grid(which='major', axis='y', linestyle=':')
+    ax.set_axisbelow(True) # grid lines are plotted below
+
+    # ticks on bottom and left only
+    ax.xaxis.tick_bottom() # use ticks on bottom only
+    ax.yaxis.tick_left()
+    for line in ax.xaxis.get_ticklines():
+        line.set_markersize(-6) # length of the tick
+        line.set_markeredgewidth(axis_lw) # thickness of the tick
+    for line in ax.yaxis.get_ticklines():
+        line.set_markersize(-6) # length of the tick
+        line.set_markeredgewidth(axis_lw) # thickness of the tick
+    for label in ax.xaxis.get_ticklabels():
+        label.set_fontsize(label_fs)
+    for label in ax.yaxis.get_ticklabels():
+        label.set_fontsize(label_fs)
+    for tick in ax.get_xaxis().get_major_ticks():
+        tick.set_pad(8.)
+        #tick.label1 = tick._get_text1()
+    for tick in ax.get_yaxis().get_major_ticks():
+        tick.set_pad(8.)
+        #tick.label1 = tick._get_text1()
+
+    # We change the fontsize of minor ticks label
+    ax.tick_params(axis='both', which='major', labelsize=label_fs)
+    ax.tick_params(axis='both', which='minor', labelsize=label_fs)
+    #ax.axhline(linewidth=axis_lw)
+    #ax.axvline(linewidth=axis_lw)
+
+    leglabels = []
+    for d in order:
+        if d == 2:
+            leglabels.append(str(d)+"nd order")
+        else:
+            leglabels.append(str(d)+"th order")
+    leg = ax.legend(line_h, leglabels,
+                    loc="lower right", numpoints=1, borderpad=0.5, \
+                    handlelength=1)
+    rect = leg.get_frame()
+    rect.set_linewidth(axis_lw)
+    for t in leg.get_texts():
+        t.set_fontsize(label_fs)
+    return fig
+
+if __name__ == "__main__":
+    fig = plot_error_verification()
+    if dump:
+        #fig.savefig('accuracy.eps', facecolor=fig.get_facecolor(), dpi=300, edgecolor='none')
+        fig.savefig('ks_verification.png', facecolor=fig.get_facecolor(), dpi=300, edgecolor='none')
     else:
-        leglabels.append(str(d)+"th order")
-leg = ax.legend(line_h, leglabels,
-                loc="lower right", numpoints=1, borderpad=0.5, \
-                handlelength=1)
-rect = leg.get_frame()
-rect.set_linewidth(axis_lw)
-for t in leg.get_texts():
-    t.set_fontsize(label_fs)
-
-if dump:
-    #fig.savefig('accuracy.eps', facecolor=fig.get_facecolor(), dpi=300, edgecolor='none')
-    fig.savefig('ks_verification.png', facecolor=fig.get_facecolor(), dpi=300, edgecolor='none')
-else:
-    plt.show()
+        plt.show()
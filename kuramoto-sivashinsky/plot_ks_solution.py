@@ -1,10 +1,17 @@
 """Plot contour plots of the KS solution"""
 
 import matplotlib.pyplot as plt
-import numpy as np
 from matplotlib import cm
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "utils"))
+from space_time_store import open_solution
+from space_time_pyramid import render_space_time
 
 dump = False
+fast = True # draw with imshow; set to False to draw filled contours
 import matplotlib
 if dump:
     matplotlib.use('Agg')
@@ -18,24 +25,22 @@ label_fs = 8 # axis labels' font size
 fig = plt.figure(figsize=(6,3), facecolor='w', dpi=300)
 ax = fig.add_subplot(111) #, projection='polar')
 
-# get data from file
-sol = np.loadtxt("ks_solution.dat")
-#sol = np.loadtxt("ks_benchmark_sample_sol.dat")
-#sol = np.loadtxt("verify_ks_solution.dat")
-print("sol.shape = ",sol.shape)
-num_nodes = sol.shape[1]
-num_steps = sol.shape[0]
-
-# define the time and space ranges
-x = np.linspace(0, 128, num_nodes)
-t = np.linspace(0, 400, num_steps)
-X, T = np.meshgrid(x, t)
+# get data from file, through its tiled binary store
+sol = open_solution("ks_solution.dat", time_range=(0, 400))
+#sol = open_solution("ks_benchmark_sample_sol.dat", time_range=(0, 400))
+#sol = open_solution("verify_ks_solution.dat", time_range=(0, 400))
+print("sol.shape = ",sol.data.shape)
+num_nodes = sol.num_nodes
+num_steps = sol.num_steps
 
-ch = ax.contourf(T, X, sol, 20, cmap=plt.cm.inferno) #bone)
+# the axes are positioned first, so the level of detail drawn matches their
+# size in pixels
+ax.set_position([0.12, 0.21, 0.86, 0.78]) # position relative to figure edges
+ch = render_space_time(ax, sol, x_range=(0, 128), cmap=plt.cm.inferno,
+                       levels=20, fast=fast) #bone)
 
 # Tweak the appeareance of the axes
 ax.axis([0, 400, 0, 128])
-ax.set_position([0.12, 0.21, 0.86, 0.78]) # position relative to figure edges
 ax.set_xlabel("$t$", fontsize=axis_fs, weight='bold', labelpad=0)
 ax.xaxis.set_label_coords(0.5, -0.15)
 ax.set_ylabel("$x$", fontsize=axis_fs, weight='normal', rotation=0)
@@ -8,6 +8,12 @@ if dump:
 
 import matplotlib.pyplot as plt
 import numpy as np
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "utils"))
+from space_time_store import open_solution
 
 # set some formating parameters
 axis_fs = 10 # axis title font size
@@ -18,16 +24,16 @@ label_fs = 8 # axis labels' font size
 fig = plt.figure(figsize=(6,2), facecolor='w', dpi=300)
 ax = fig.add_subplot(111)
 
-# get data from file
-sol = np.loadtxt("verify_ks_solution.dat")
-print("sol.shape = ",sol.shape)
-num_nodes = sol.shape[1]
-num_steps = sol.shape[0]
+# get data from file; only the first and last time steps are read
+sol = open_solution("verify_ks_solution.dat")
+print("sol.shape = ",sol.data.shape)
+num_nodes = sol.num_nodes
+num_steps = sol.num_steps
 
 # plot the initial condition and final solution
 x = np.linspace(0, 128, num_nodes)
-ic_h = ax.plot(x, sol[0,:], '-k', lw=1.0, label=r"$u(x,0)=u_0(x)$")
-fc_h = ax.plot(x, sol[-1,:], '--r', lw=1.0, label=r"$u(x,\tau)$")
+ic_h = ax.plot(x, sol.step(0), '-k', lw=1.0, label=r"$u(x,0)=u_0(x)$")
+fc_h = ax.plot(x, sol.step(-1), '--r', lw=1.0, label=r"$u(x,\tau)$")
 
 # Tweak the appeareance of the axes
 ax.axis([0, 128, -1.5, 4.0])
@@ -22,6 +22,44 @@ function Print3DArray(file, arr::AbstractArray{Float64,3})
     end
 end
 
+"""
+    WriteDataFile(file_name, names, arrays[, meta])
+
+Write `arrays` to `file_name` using `Print3DArray`, preceded by a header that
+lists the name, shape, and line and byte offsets of each block, so readers can
+validate the file and seek to a single block.  `meta` is a vector of 
+`key => value` pairs recorded in the header.  See `utils/data_header.py` for 
+the format; this version of `Print3DArray` writes rows along the last index, so
+the shape is listed as is.
+"""
+function WriteDataFile(file_name, names, arrays, meta=Pair{String,Any}[])
+    blocks = Vector{Vector{UInt8}}()
+    for arr in arrays
+        buf = IOBuffer()
+        Print3DArray(buf, arr)
+        push!(blocks, take!(buf))
+    end
+    file = open(file_name, "w")
+    println(file, "# hoc-data 1")
+    for (key, val) in meta
+        println(file, "# meta ", key, "=", join(val, ","))
+    end
+    line = 0
+    offset = 0
+    for (name, arr, bytes) in zip(names, arrays, blocks)
+        shape = size(arr)
+        println(file, "# block name=", name, " dtype=float64 shape=", 
+                join(shape, ","), " line=", line, " offset=", offset)
+        line += div(length(arr), shape[end])
+        offset += length(bytes)
+    end
+    println(file, "# end")
+    for bytes in blocks
+        write(file, bytes)
+    end
+    close(file)
+end
+
 # set the parameters
 tp = Float64            # floating point type to use 
 #num_nodes = 255         # number of (interior) nodes to use 
@@ -97,12 +135,9 @@ for k = 1:size(num_steps,1)
 end 
 
 # write the data
-data = open("accuracy_ks.dat", "w")
-Print3DArray(data, dx)
-Print3DArray(data, dt)
-Print3DArray(data, err_avg)
-Print3DArray(data, err_sqavg)
-Print3DArray(data, cputime)
-close(data)
+WriteDataFile("accuracy_ks.dat", ["dx", "dt", "err_avg", "err_sqavg", "cputime"],
+              [dx, dt, err_avg, err_sqavg, cputime],
+              ["order" => order, "num_nodes" => num_nodes,
+               "num_steps" => num_steps])
 
 
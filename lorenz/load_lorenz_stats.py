@@ -1,10 +1,82 @@
 """module for opening and extracting data from Lorenz files"""
 
+import os
+import sys
 import numpy as np 
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "utils"))
+from stats_cube import load_stats_cube
+from summary_stats import load_summary
+
 # benchmark value for avg z from Kehlet and Logg
 z_avg_ref = 23.48468206951560755245057102025885979019964736765101924707073717557587258424199920886343339296252912951352491012574579728837492837908146796544143984717970678004311135572490748065191862686863343643256426105086074910125752532750449061231599561663829395691169702709602537689153890023399543833773688068719317285034023205710501713870759360345043011808489315996709079430022133849451570275830309192590323130272650067634773054825306185773
 
+# the blocks written by gatherStatsLorenz, in file order
+quantities = ("dt", "z_avg", "cputime")
+
+def load_cube(file_name, num_step_sizes, num_times):
+    """
+    Return the raw Lorenz data in `file_name` as a `StatsCube`.
+
+    `file_name` may also be a shard directory (e.g. `shards/order2`), in
+    which case the cube holds the samples completed so far; this applies to
+    the other loaders below as well.
+
+    The cube has axes (quantity, tau, step size, sample), with quantities
+    labeled by `quantities`.  See `load_stats_cube` for details.
+    """
+    return load_stats_cube(file_name, quantities, num_step_sizes, num_times)
+
+def load_summary_table(file_name, num_step_sizes, num_times):
+    """
+    Return the box-plot summaries of the percent errors of `z_avg` in
+    `file_name`, against `z_avg_ref`, as a `SummaryTable` with axes (qoi,
+    field, tau, step size).  See `load_summary`.
+    """
+    return load_summary(file_name, quantities, num_step_sizes, num_times,
+                        dict(z_avg=z_avg_ref))
+
+def sketch_stats(file_name, num_step_sizes, num_times, rel_err=0.01):
+    """
+    Return the mergeable sketches of the percent errors of `z_avg`, and of
+    the cpu time, in `file_name` as a `StatsSketch` with axes (channel,
+    tau, step size).  Save it with `sketches.save_sketch` to combine
+    campaigns run on separate machines; see `sketches.py`.
+    """
+    from sketches import sketch_cube
+    return sketch_cube(load_cube(file_name, num_step_sizes, num_times),
+                       dict(z_avg=z_avg_ref), rel_err=rel_err)
+
+def extrapolate_reference(data_files, orders, num_step_sizes, num_times,
+                          time_idx, quantity="z_avg", terms=1):
+    """
+    Return the Richardson extrapolation of the mean of `quantity`, for the
+    integration period `time_idx`, from the raw data `data_files` of the
+    schemes of accuracy `orders`, e.g. (2, 4, 8), as a `ReferenceFit`.  See
+    `convergence.extrapolate_cubes`.
+    """
+    from convergence import extrapolate_cubes
+    cubes = [load_cube(file_name, num_step_sizes, num_times)
+             for file_name in data_files]
+    return extrapolate_cubes(cubes, orders, quantity, time_idx, terms)
+
+def cost_planner(data_files, orders, num_step_sizes, num_times, tau,
+                 quantity="z_avg", field="med"):
+    """
+    Return a `CostPlanner` for the percent errors of `quantity` (the summary
+    `field`, e.g. "med") and the cpu times in `data_files`, the raw data of
+    the schemes of accuracy `orders` with the integration periods `tau`.
+    The runs start on the attractor, so there is no spin-up, and the
+    system counts as a single node.  See `cost_model.py`.
+    """
+    from cost_model import CostPlanner
+    tables = [load_summary_table(file_name, num_step_sizes, num_times)
+              for file_name in data_files]
+    return CostPlanner(tables, orders, tau, quantity,
+                       nodes=lambda dt: np.ones_like(dt), dt=lambda dt: dt,
+                       field=field)
+
 def load_dt_stats(file_name, num_step_sizes, num_times, time_idx):
     """
     Extract data for different dt values for fixed integration period.
@@ -13,26 +85,15 @@ def load_dt_stats(file_name, num_step_sizes, num_times, time_idx):
     should correspond to a run with `num_step_sizes` different dt values and
     `num_times` distinct integration periods.  This function extracts all
     the data (`dt` values, `z_avg` data, and `cputime` values) for the time
-    integration period corresponding to `time_idx`.
+    integration period corresponding to `time_idx`.  The returned arrays are
+    views into the cube from `load_cube`.
     """
-    if num_step_sizes <= 0:
-        raise ValueError("num_step_sizes must be positive!")
-    if num_times <=0:
-        raise ValueError("num_times must be positive!")
     if time_idx < 0 or time_idx >= num_times:
         raise ValueError("time_idx must be >= 0 and < num_times!")
-    data = np.loadtxt(file_name)
-    offset = num_step_sizes*num_times 
-    if data.shape[0] != 3*offset:
-        raise ValueError("num_step_sizes and/or num_times inconsistent with "
-                         + file_name)
-    # the dt values repeat, so just grab the first num_step_sizes values 
-    dt = data[0:num_step_sizes,0]
-    ptr = offset + time_idx*num_step_sizes
-    z_avg = data[ptr:ptr+num_step_sizes,:]
-    ptr = 2*offset + time_idx*num_step_sizes
-    cputime = data[ptr:ptr+num_step_sizes,:]
-    return dt, z_avg.T, cputime.T
+    cube = load_cube(file_name, num_step_sizes, num_times)
+    # the dt values repeat, so just grab those of the first sample 
+    dt = cube.mesh_values()
+    return dt, cube["z_avg"][time_idx].T, cube["cputime"][time_idx].T
 
 def load_time_stats(file_name, num_step_sizes, num_times, dt_idx):
     """
@@ -42,22 +103,11 @@ def load_time_stats(file_name, num_step_sizes, num_times, dt_idx):
     should correspond to a run with `num_step_sizes` different dt values and
     `num_times` distinct integration periods.  This function extracts all the
     data (`dt` values, `z_avg` data, and `cputime` values) for the dt step size
-    corresponding to `dt_idx`.
+    corresponding to `dt_idx`.  The returned arrays are views into the cube
+    from `load_cube`.
     """
-    if num_step_sizes <= 0:
-        raise ValueError("num_step_sizes must be positive!")
-    if num_times <=0:
-        raise ValueError("num_times must be positive!")
     if dt_idx < 0 or dt_idx >= num_step_sizes:
         raise ValueError("dt_idx must be >= 0 and < num_step_sizes!")
-    data = np.loadtxt(file_name)
-    offset = num_step_sizes*num_times 
-    if data.shape[0] != 3*offset:
-        raise ValueError("num_step_sizes and/or num_times inconsistent with "
-                         + file_name)
-    dt = data[dt_idx, 0]
-    ptr = offset
-    z_avg = data[ptr+dt_idx:ptr+offset:num_step_sizes,:]
-    ptr = 2*offset
-    cputime = data[ptr+dt_idx:ptr+offset:num_step_sizes,:]
-    return dt, z_avg.T, cputime.T 
\ No newline at end of file
+    cube = load_cube(file_name, num_step_sizes, num_times)
+    dt = cube.mesh_values()[dt_idx]
+    return dt, cube["z_avg"][:,dt_idx,:].T, cube["cputime"][:,dt_idx,:].T
@@ -5,6 +5,7 @@ using DelimitedFiles, DifferentialEquations, GeometricIntegratorsDiffEq
 
 include("gregory.jl")
 using .Gregory 
+include(joinpath(@__DIR__, "..", "utils", "shards.jl"))
 
 function calcZAverage(sol, ibeg::Int, iend::Int, 
     num_steps::Int, order::Int)::Float64
@@ -39,6 +40,44 @@ function Print3DArray(file, arr::AbstractArray{Float64,3})
     end
 end
 
+"""
+    WriteDataFile(file_name, names, arrays[, meta])
+
+Write `arrays` to `file_name` using `Print3DArray`, preceded by a header that
+lists the name, shape, and line and byte offsets of each block, so readers can
+validate the file and seek to a single block.  `meta` is a vector of 
+`key => value` pairs recorded in the header.  See `utils/data_header.py` for 
+the format; the shape is listed in reverse, matching the row-major view of the
+data.
+"""
+function WriteDataFile(file_name, names, arrays, meta=Pair{String,Any}[])
+    blocks = Vector{Vector{UInt8}}()
+    for arr in arrays
+        buf = IOBuffer()
+        Print3DArray(buf, arr)
+        push!(blocks, take!(buf))
+    end
+    file = open(file_name, "w")
+    println(file, "# hoc-data 1")
+    for (key, val) in meta
+        println(file, "# meta ", key, "=", join(val, ","))
+    end
+    line = 0
+    offset = 0
+    for (name, arr, bytes) in zip(names, arrays, blocks)
+        shape = reverse(size(arr))
+        println(file, "# block name=", name, " dtype=float64 shape=", 
+                join(shape, ","), " line=", line, " offset=", offset)
+        line += div(length(arr), shape[end])
+        offset += length(bytes)
+    end
+    println(file, "# end")
+    for bytes in blocks
+        write(file, bytes)
+    end
+    close(file)
+end
+
 # define the Lorenz problem
 function lorenz!(du,u,p,t)
     du[1] = 10.0*(u[2]-u[1])
@@ -46,25 +85,91 @@ function lorenz!(du,u,p,t)
     du[3] = u[1]*u[2] - (8/3)*u[3]
 end
 
+# campaign parameters, shared by gatherStatsLorenz and gatherJobLorenz
+const u0 = [-5.276131687990789; -8.274832825254473; 16.36301350713599]
+const final_time = 1000.0
+const time_fac = 10
+const base_time = final_time/time_fac^3
+const base_steps = [10; 20; 40; 80; 160]
+const orders = [2, 4, 8]
+const lorenz_methods = [Heun(), RK4(), Vern8()]
+
+"""
+    z_avg, cputime = dtStatsLorenz(prob, p, n)
+
+Solves `prob` with method `p` (an index into `orders`) and step size
+`base_time/base_steps[n]`, and returns the z averages over the short, medium
+and long periods.  Each returned array has `time_fac^3` rows and one column 
+per period; they are `nothing` if the solve is unstable.
+"""
+function dtStatsLorenz(prob, p::Int, n::Int)
+    z_avg = zeros(time_fac^3, 3)
+    cputime = zeros(size(z_avg))
+    println("\tSolve using num steps = ",time_fac^3*base_steps[n])
+    cpu_full = @elapsed sol = solve(prob, lorenz_methods[p],
+                                    dt=base_time/base_steps[n],
+                                    adaptive=false)
+    #if any(isnan, sol)
+    if sol.retcode != :Success 
+        println("\t\tLorenz failed to solve due to instability.")
+        return nothing, nothing
+    end
+    
+    # We partition the simulation into smaller periods for statistics
+    # gathering.  For example, if the simulation time is 1000 units
+    # then we have 10 samples for 100, 100 samples for 10 units, and
+    # 1000 samples for 1 unit.
+    # The statistics for the medium and long periods are duplicated to 
+    # simplify the file I/O (NumPy loadtxt is easier)
+    ptr = 1
+    for s1 = 1:time_fac 
+        ibeg = base_steps[n]*(s1-1)*time_fac*time_fac + 1
+        iend = base_steps[n]*s1*time_fac*time_fac + 1
+        z_avg_long = calcZAverage(sol, ibeg, iend,
+                                  time_fac^2*base_steps[n], orders[p])
+        for s2 = 1:time_fac
+            ibeg = base_steps[n]*((s1-1)*time_fac + s2 - 1)*time_fac + 1
+            iend = base_steps[n]*((s1-1)*time_fac + s2)*time_fac + 1
+            z_avg_med = calcZAverage(sol, ibeg, iend,
+                                     time_fac*base_steps[n], orders[p])
+            for s3 = 1:time_fac
+                # get statistics for the shortest period
+                ibeg = base_steps[n]*(
+                ( (s1-1)*time_fac + s2-1)*time_fac + s3 - 1) + 1
+                iend = base_steps[n]*(
+                ( (s1-1)*time_fac + s2-1)*time_fac + s3) + 1
+                z_avg[ptr,1] = calcZAverage(sol, ibeg, iend,
+                                            base_steps[n], orders[p])
+                cputime[ptr,1] = cpu_full/(time_fac^3)
+                
+                # get statistics for the medium period
+                z_avg[ptr,2] = z_avg_med
+                cputime[ptr,2] = cpu_full/(time_fac^2)
+                
+                # get statistics for the long period
+                z_avg[ptr,3] = z_avg_long
+                cputime[ptr,3] = cpu_full/time_fac
+                
+                ptr += 1
+            end 
+        end
+    end
+    return z_avg, cputime
+end
+
 """
 gatherStatsLorenz()
 
 Runs the Lorenz problem with different discretization orders, steps sizes and 
-integration periods, and writes results to file.
+integration periods, and writes results to file.  Each step size is also 
+written to a shard in `shards/order<p>` as soon as it completes; if the run is
+restarted, step sizes whose shard exists are read back instead of recomputed.
 """
 function gatherStatsLorenz()
     
-    u0 = [-5.276131687990789; -8.274832825254473; 16.36301350713599]
-    time = 1000.0
-    probLorenz = ODEProblem(lorenz!, u0, (0, time))
-    
-    time_fac = 10
-    #num_steps = [6250; 12500; 25000; 50000; 100000]
-    base_time = time/time_fac^3
-    base_steps = [10; 20; 40; 80; 160]
-    order = [2, 4, 8]
+    probLorenz = ODEProblem(lorenz!, u0, (0, final_time))
+    order = orders
     #file_prefix = ["Heun_u_", "RK4_u_", "GLRK(4)_u_"]
-    method = [Heun(), RK4(), Vern8() ]
     
     # loop over the different order methods  
     for p = 1:size(order,1)
@@ -74,75 +179,69 @@ function gatherStatsLorenz()
         dt = zeros(Float64, (time_fac^3, size(base_steps,1), 3) )
         z_avg = zeros(size(dt))
         cputime = zeros(size(dt))
+        names = ["dt", "z_avg", "cputime"]
+        meta = ["order" => order[p], "tau" => base_time*time_fac.^(0:2)]
+        shard_dir = joinpath("shards", "order$(order[p])")
+        initManifest(shard_dir, ["name" => "lorenz"; meta; "names" => names;
+                                 "values" => 1:size(base_steps,1); 
+                                 "num_samples" => 1; "rows" => time_fac^3])
         
         println("Initial compile...")
-        cpu_full = @elapsed sol = solve(probLorenz, method[p],
+        cpu_full = @elapsed sol = solve(probLorenz, lorenz_methods[p],
                                         dt=base_time/base_steps[1],
                                         adaptive=false)
 
         for n = 1:size(base_steps,1)
             dt[:,n,:] .= base_time/base_steps[n]
-            println("\tSolve using num steps = ",time_fac^3*base_steps[n])
-            cpu_full = @elapsed sol = solve(probLorenz, method[p],
-                                            dt=base_time/base_steps[n],
-                                            adaptive=false)
-            #if any(isnan, sol)
-            if sol.retcode != :Success 
-                println("\t\tLorenz failed to solve due to instability.")
+            shard = shardName(shard_dir, "lorenz", order[p], n, 1)
+            if isfile(shard)
+                println("\tReusing num steps = ",time_fac^3*base_steps[n])
+                recordShard(shard, order[p], n, 1)
+                _, z_avg[:,n,:], cputime[:,n,:] = readShard(shard, 3, 3)
                 continue
             end
-            
-            # We partition the simulation into smaller periods for statistics
-            # gathering.  For example, if the simulation time is 1000 units
-            # then we have 10 samples for 100, 100 samples for 10 units, and
-            # 1000 samples for 1 unit.
-            # The statistics for the medium and long periods are duplicated to 
-            # simplify the file I/O (NumPy loadtxt is easier)
-            ptr = 1
-            for s1 = 1:time_fac 
-                ibeg = base_steps[n]*(s1-1)*time_fac*time_fac + 1
-                iend = base_steps[n]*s1*time_fac*time_fac + 1
-                z_avg_long = calcZAverage(sol, ibeg, iend,
-                                          time_fac^2*base_steps[n],
-                order[p])
-                for s2 = 1:time_fac
-                    ibeg = base_steps[n]*((s1-1)*time_fac + s2 - 1)*time_fac + 1
-                    iend = base_steps[n]*((s1-1)*time_fac + s2)*time_fac + 1
-                    z_avg_med = calcZAverage(sol, ibeg, iend,
-                    time_fac*base_steps[n], order[p])
-                    for s3 = 1:time_fac
-                        # get statistics for the shortest period
-                        ibeg = base_steps[n]*(
-                        ( (s1-1)*time_fac + s2-1)*time_fac + s3 - 1) + 1
-                        iend = base_steps[n]*(
-                        ( (s1-1)*time_fac + s2-1)*time_fac + s3) + 1
-                        z_avg[ptr,n,1] = calcZAverage(sol, ibeg, iend,
-                        base_steps[n], order[p])
-                        cputime[ptr,n,1] = cpu_full/(time_fac^3)
-                        
-                        # get statistics for the medium period
-                        ibeg = base_steps[n]*((s1-1)*time_fac+s2-1)*time_fac + 1
-                        iend = base_steps[n]*((s1-1)*time_fac + s2)*time_fac + 1
-                        z_avg[ptr,n,2] = z_avg_med
-                        cputime[ptr,n,2] = cpu_full/(time_fac^2)
-                        
-                        # get statistics for the long period
-                        z_avg[ptr,n,3] = z_avg_long
-                        cputime[ptr,n,3] = cpu_full/time_fac
-                        
-                        ptr += 1
-                    end 
-                end
+            z, cpu = dtStatsLorenz(probLorenz, p, n)
+            if z !== nothing
+                z_avg[:,n,:] = z
+                cputime[:,n,:] = cpu
             end
+            writeShard(shard, order[p], n, 1, names,
+                       [dt[:,n:n,:], z_avg[:,n:n,:], cputime[:,n:n,:]],
+                       [meta; "step" => n])
         end
         
         # write the data
-        data = open("raw_statistics_lorenz_order$(order[p]).dat", "w")
-        Print3DArray(data, dt)
-        Print3DArray(data, z_avg)
-        Print3DArray(data, cputime)
-        close(data)
+        WriteDataFile("raw_statistics_lorenz_order$(order[p]).dat", names,
+                      [dt, z_avg, cputime], meta)
+    end
+end
+
+"""
+    gatherJobLorenz(order, n, file_name)
+
+Runs the step size `base_time/base_steps[n]` of `gatherStatsLorenz` for the 
+method of order `order`, and writes its statistics to the shard `file_name`,
+with blocks of size `(time_fac^3, 1, 3)` laid out as in the raw statistics
+files (zeros if the solve is unstable).  `utils/campaign.py` runs these jobs
+in parallel and merges the shards.
+"""
+function gatherJobLorenz(order::Int, n::Int, file_name)
+    p = findfirst(isequal(order), orders)
+    probLorenz = ODEProblem(lorenz!, u0, (0, final_time))
+    # initial compile, so it is not included in the timing
+    solve(probLorenz, lorenz_methods[p], dt=base_time/base_steps[1],
+          adaptive=false)
+    dt = fill(base_time/base_steps[n], (time_fac^3, 1, 3))
+    z_avg = zeros(size(dt))
+    cputime = zeros(size(dt))
+    z, cpu = dtStatsLorenz(probLorenz, p, n)
+    if z !== nothing
+        z_avg[:,1,:] = z
+        cputime[:,1,:] = cpu
     end
+    WriteDataFile(file_name, ["dt", "z_avg", "cputime"], [dt, z_avg, cputime],
+                  ["order" => order, "tau" => base_time*time_fac.^(0:2),
+                   "step" => n])
 end
     
 end # LorenzMod
\ No newline at end of file
@@ -0,0 +1,233 @@
+"""module for the autocorrelation of the QoI integrand along one trajectory
+
+The gatherers cut one long trajectory into windows of length tau and treat
+the window averages as independent samples.  Whether they are, and how
+long a run has to be for a given standard error, depends on how long the
+integrand stays correlated.  This module estimates that from a single
+stored trajectory:
+
+  * `autocovariance` computes the autocovariance of a series up to some
+    lag with FFTs over blocks of `chunk_steps` steps, so a memory-mapped
+    trajectory (`trajectory_store.py`, `space_time_store.py`) of any
+    length is read one block at a time;
+  * `integrated_time` estimates the integrated autocorrelation time
+    `tau_int = 1 + 2 sum_k rho_k` (in steps) with the self-consistent
+    window of Sokal, doubling the maximum lag until the window fits;
+  * `batch_means` returns, for any period tau, the variance of the
+    averages over non-overlapping windows, computed with the Gregory rule
+    of the gatherers by a `gregory.WindowAverager` fed one block at a
+    time, so it is memory-bounded as well.
+
+For windows much longer than `tau_int`, the variance of a window average
+of `m` steps is about `tau_int var(f)/m`; `steps_for_standard_error`
+turns this into the integration period needed for a target standard error.
+
+Usage from the command line, for the z component of a Lorenz trajectory or
+the spatial average of u^2 of a KS solution:
+
+    python autocorrelation.py "../lorenz/Simulated Solutions/Heun_u_0.01.txt" \
+        --dt 0.01 --tau 1 10 100
+    python autocorrelation.py ks_solution.dat --dt 0.01 --ks-order 4 --tau 40
+"""
+
+import argparse
+import collections
+import os
+import sys
+import numpy as np
+from gregory import WindowAverager, tau_steps
+
+_chunk_steps = 1 << 20
+
+IntegratedTime = collections.namedtuple("IntegratedTime", [
+    "tau", "tau_se", "window", "mean", "variance", "num_steps", "rho"])
+IntegratedTime.__doc__ = """The integrated autocorrelation time `tau` of a
+series, in steps, with its standard error (Sokal's estimate) and the
+summation `window`; the `mean`, `variance` and number of steps of the
+series; and the normalized autocorrelation `rho` up to the largest lag
+computed."""
+
+BatchMeans = collections.namedtuple("BatchMeans", [
+    "mean", "variance", "variance_se", "num_batches", "averages"])
+BatchMeans.__doc__ = """The window averages of one period (`averages`) and
+their mean, sample variance, the standard error of that variance (assuming
+independent, normal averages), and their number."""
+
+def _mean(x, chunk_steps):
+    total = 0.0
+    for start in range(0, x.shape[0], chunk_steps):
+        total += np.sum(x[start:start+chunk_steps], dtype=float)
+    return total/x.shape[0]
+
+def autocovariance(x, max_lag, mean=None, chunk_steps=_chunk_steps):
+    """
+    Return the autocovariance of the 1D series `x` at lags 0 to `max_lag`,
+    with the usual biased normalization by the length of `x`.
+
+    The sums of products are accumulated over blocks of `chunk_steps`
+    steps, each correlated with itself and the `max_lag` steps that follow
+    it by one FFT, so only a block (plus the lags) is held at a time.  The
+    `mean` is computed in a first pass unless given.
+    """
+    n = x.shape[0]
+    max_lag = min(int(max_lag), n - 1)
+    if mean is None:
+        mean = _mean(x, chunk_steps)
+    block = max(int(chunk_steps), max_lag + 1)
+    size = 1 << int(np.ceil(np.log2(block + max_lag + 1)))
+    sums = np.zeros(max_lag + 1)
+    for start in range(0, n, block):
+        head = np.asarray(x[start:start+block], dtype=float) - mean
+        ext = np.asarray(x[start:start+block+max_lag], dtype=float) - mean
+        corr = np.fft.irfft(np.conj(np.fft.rfft(head, size))
+                            * np.fft.rfft(ext, size), size)
+        sums += corr[:max_lag+1]
+    return sums/n
+
+def integrated_time(x, c=5.0, max_lag=None, chunk_steps=_chunk_steps):
+    """
+    Return the `IntegratedTime` of the 1D series `x`.
+
+    The window is the smallest `M` with `M >= c*tau_int(M)` (Sokal's
+    automatic windowing); `c` between 4 and 10 is usual.  The
+    autocovariance is first computed up to `max_lag` (default 1024 lags)
+    and the lag doubled until the window is found or covers the series.
+    """
+    n = x.shape[0]
+    if n < 2:
+        raise ValueError("the series needs at least two steps!")
+    mean = _mean(x, chunk_steps)
+    lag = min(n - 1, 1024 if max_lag is None else int(max_lag))
+    while True:
+        acov = autocovariance(x, lag, mean, chunk_steps)
+        if acov[0] <= 0:
+            rho = np.ones(1)
+            tau, window = 1.0, 0
+            break
+        rho = acov/acov[0]
+        taus = 2*np.cumsum(rho) - 1
+        ok = np.flatnonzero(np.arange(rho.size) >= c*taus)
+        if ok.size > 0 or lag >= n - 1:
+            window = int(ok[0]) if ok.size > 0 else rho.size - 1
+            tau = float(taus[window])
+            break
+        lag = min(n - 1, 2*lag)
+    tau_se = tau*np.sqrt(2*(2*window + 1)/n)
+    return IntegratedTime(tau, tau_se, window, mean, float(acov[0])*n
+                          /max(n - 1, 1), n, rho)
+
+def _window_averages(x, window_steps, order, chunk_steps):
+    """
+    Return a `WindowAverager` of the windows of `window_steps` steps of the
+    1D series `x`, fed blocks of `chunk_steps` steps.
+    """
+    averager = WindowAverager(window_steps, order)
+    for start in range(0, x.shape[0], chunk_steps):
+        averager.update(np.asarray(x[start:start+chunk_steps], dtype=float))
+    return averager
+
+def _batch_means(averages):
+    """Return the `BatchMeans` of the window averages `averages`."""
+    count = averages.shape[0]
+    if count < 2:
+        return BatchMeans(np.mean(averages) if count else np.nan, np.nan,
+                          np.nan, count, averages)
+    variance = np.var(averages, ddof=1)
+    return BatchMeans(np.mean(averages), variance,
+                      variance*np.sqrt(2/(count - 1)), count, averages)
+
+def batch_means(x, batch_steps, order=4, chunk_steps=_chunk_steps):
+    """
+    Return the `BatchMeans` of the averages of `x` over non-overlapping
+    windows of `batch_steps` steps, taken with the Gregory rule of order
+    `order` as in the gatherers.  `x` is read in blocks of `chunk_steps`
+    steps.
+    """
+    averager = _window_averages(x, (batch_steps,), order, chunk_steps)
+    return _batch_means(averager.averages(batch_steps))
+
+def batch_means_for_taus(x, dt, taus, order=4, chunk_steps=_chunk_steps):
+    """
+    Return a dictionary mapping each period in `taus` to the `BatchMeans`
+    of `x`, sampled with spacing `dt`, over windows of that length.  All
+    the periods are averaged in one pass over `x`.
+    """
+    steps = {tau: tau_steps(tau, dt) for tau in taus}
+    averager = _window_averages(x, sorted(set(steps.values())), order,
+                                chunk_steps)
+    return {tau: _batch_means(averager.averages(n))
+            for tau, n in steps.items()}
+
+def window_variance(fit, window_steps):
+    """
+    Return the variance of the average over `window_steps` steps predicted
+    by the `IntegratedTime` `fit`, valid for windows much longer than
+    `fit.tau`.
+    """
+    return fit.tau*fit.variance/window_steps
+
+def steps_for_standard_error(fit, standard_error, num_samples=1):
+    """
+    Return the number of steps each of `num_samples` independent runs
+    must cover for the mean of their averages to have the standard error
+    `standard_error`, from the `IntegratedTime` `fit`.
+    """
+    return int(np.ceil(fit.tau*fit.variance
+                       /(num_samples*standard_error**2)))
+
+def _ks_series(file_name, order, integrand, chunk_steps):
+    """Return the spatial averages of `integrand` of a KS solution."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "..", "kuramoto-sivashinsky"))
+    from ks_averages import powers, spatial_weights
+    from space_time_store import open_solution
+    sol = open_solution(file_name)
+    w = spatial_weights(sol.num_nodes, order)
+    series = np.empty(sol.num_steps)
+    for start in range(0, sol.num_steps, chunk_steps):
+        chunk = np.asarray(sol.data[start:start+chunk_steps])
+        series[start:start+chunk.shape[0]] = chunk**powers[integrand] @ w
+    return series
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="autocorrelation time and batch means of a trajectory")
+    parser.add_argument("file")
+    parser.add_argument("--dt", type=float, required=True)
+    parser.add_argument("--component", type=int, default=2,
+                        help="component of a trajectory (default: z)")
+    parser.add_argument("--ks-order", type=int, default=None,
+                        help="read a KS space-time solution, averaged in "
+                        "space with the Gregory rule of this order")
+    parser.add_argument("--integrand", default="u2",
+                        choices=("u", "u2", "u3", "u4"),
+                        help="integrand of a KS solution (default: u2)")
+    parser.add_argument("--tau", type=float, nargs="*", default=())
+    parser.add_argument("--order", type=int, default=4,
+                        help="order of the Gregory rule of the batch means")
+    parser.add_argument("--standard-error", type=float, default=None,
+                        help="report the period a run needs for this "
+                        "standard error of its average")
+    args = parser.parse_args()
+    if args.ks_order is None:
+        from trajectory_store import open_trajectory
+        series = open_trajectory(args.file).component(args.component)
+    else:
+        series = _ks_series(args.file, args.ks_order, args.integrand,
+                            _chunk_steps//64)
+    fit = integrated_time(series)
+    print("steps {}  mean {:.8g}  variance {:.6g}".format(
+        fit.num_steps, fit.mean, fit.variance))
+    print("tau_int {:.4g} +/- {:.2g} steps = {:.4g} time units "
+          "(window {})".format(fit.tau, fit.tau_se, fit.tau*args.dt,
+                               fit.window))
+    for tau, bm in batch_means_for_taus(series, args.dt, args.tau,
+                                        args.order).items():
+        predicted = window_variance(fit, tau_steps(tau, args.dt))
+        print("tau {:g}: {} windows, variance {:.4g} +/- {:.2g} "
+              "(predicted {:.4g})".format(tau, bm.num_batches, bm.variance,
+                                          bm.variance_se, predicted))
+    if args.standard_error is not None:
+        steps = steps_for_standard_error(fit, args.standard_error)
+        print("standard error {:g}: {} steps = {:.4g} time units".format(
+            args.standard_error, steps, steps*args.dt))
@@ -0,0 +1,95 @@
+"""module for vectorized bootstrap confidence intervals of sample statistics
+
+The statistics files hold, for every mesh (or step) size and integration
+period, a handful to thousands of independent samples, e.g. the percent
+errors `np.abs(u2_avg - u2_avg_ref)*100/u2_avg_ref` of the matrices returned
+by `load_dx_stats` and `load_dt_stats`, with samples along the first axis.
+`bootstrap_ci` returns percentile bootstrap confidence intervals of the
+median, mean and any quantiles of every cell (column) at once.
+
+No Python loop runs over the resamples.  The resamples are drawn as one
+tensor of sample indices, a chunk of resamples at a time so that memory
+stays below `max_bytes`.  Each cell's samples are sorted once, and each
+chunk's indices are sorted along the sample axis, so the sorted resamples
+of every cell are gathered from the sorted samples with the same indices,
+and the quantiles of all resamples of all cells are read off at fixed
+positions.  The means come from the matrix product of the resample counts
+with the samples.  Every cell is resampled with the same indices, which
+leaves the interval of each cell unchanged.
+"""
+
+import collections
+import numpy as np
+
+CI = collections.namedtuple("CI", ["estimate", "lo", "hi", "se"])
+CI.__doc__ = """A bootstrap confidence interval: the `estimate` from the
+original samples, the bounds `lo` and `hi`, and the bootstrap standard
+error `se`, each with the shape of the cells."""
+
+def _quantile_sorted(x, q):
+    """Return quantile `q` of the sorted `x` along axis 0 (numpy linear)."""
+    h = (x.shape[0] - 1)*q
+    lo = int(np.floor(h))
+    hi = min(lo + 1, x.shape[0] - 1)
+    return x[lo] + (h - lo)*(x[hi] - x[lo])
+
+def bootstrap_ci(samples, stats=("median", "mean"), quantiles=(),
+                 num_resamples=10000, alpha=0.05, seed=None,
+                 max_bytes=1 << 28):
+    """
+    Return bootstrap confidence intervals for the statistics of `samples`.
+
+    `samples` holds the samples along axis 0 and any number of cells along
+    the other axes; it must not contain NaN.  `stats` may include "median"
+    and "mean", and `quantiles` lists further quantiles in [0, 1].  The
+    intervals have coverage `1 - alpha` and are computed from
+    `num_resamples` resamples drawn with the generator seeded by `seed`;
+    the index tensors are drawn in chunks of at most `max_bytes`.
+
+    Returns a dict mapping each name in `stats`, and each quantile, to a
+    `CI`.
+    """
+    samples = np.asarray(samples, dtype=float)
+    if samples.ndim == 0 or samples.shape[0] == 0:
+        raise ValueError("samples must have at least one sample!")
+    if np.isnan(samples).any():
+        raise ValueError("samples must not contain NaN!")
+    n = samples.shape[0]
+    cells = samples.shape[1:]
+    x = np.sort(samples.reshape(n, -1), axis=0)
+    qs = dict((q, q) for q in quantiles)
+    if "median" in stats:
+        qs["median"] = 0.5
+    for name in stats:
+        if name not in ("median", "mean"):
+            raise ValueError("unknown statistic " + repr(name))
+    want_mean = "mean" in stats
+    boot = dict((key, np.empty((num_resamples, x.shape[1]))) for key in qs)
+    if want_mean:
+        boot["mean"] = np.empty((num_resamples, x.shape[1]))
+    rng = np.random.default_rng(seed)
+    # the indices and, for the means, the counts take 16 bytes per draw
+    chunk = max(1, min(num_resamples, max_bytes//(16*n)))
+    for start in range(0, num_resamples, chunk):
+        size = min(chunk, num_resamples - start)
+        idx = np.sort(rng.integers(0, n, size=(size, n)), axis=1)
+        for key, q in qs.items():
+            h = (n - 1)*q
+            lo = int(np.floor(h))
+            hi = min(lo + 1, n - 1)
+            xlo, xhi = x[idx[:, lo]], x[idx[:, hi]]
+            boot[key][start:start+size] = xlo + (h - lo)*(xhi - xlo)
+        if want_mean:
+            flat = (np.arange(size)[:, None]*n + idx).ravel()
+            counts = np.bincount(flat, minlength=size*n).reshape(size, n)
+            boot["mean"][start:start+size] = counts @ x/n
+    result = {}
+    for key, values in boot.items():
+        if key == "mean":
+            estimate = x.mean(axis=0)
+        else:
+            estimate = _quantile_sorted(x, qs[key])
+        lo, hi = np.quantile(values, [alpha/2, 1 - alpha/2], axis=0)
+        result[key] = CI(estimate.reshape(cells), lo.reshape(cells),
+                         hi.reshape(cells), values.std(axis=0).reshape(cells))
+    return result
@@ -0,0 +1,301 @@
+"""module for running the statistics campaigns as parallel jobs
+
+`gatherStatsKS` and `gatherStatsLorenz` run every (order, mesh or step size,
+sample) combination one after the other on a single core.  This module
+splits a campaign into those independent jobs, runs each one as a separate
+Julia process (`gatherJobKS` or `gatherJobLorenz`) on a local pool of
+workers, and merges the shard each job writes into the same
+`raw_statistics_*` files, with the same headers, that the serial gatherers
+write.  The shards of each order go to their own directory, with a
+manifest, in the layout of `shard_store.py`, so a campaign can be restarted
+and its partial results loaded at any time.  With `--target`, the
+remaining jobs of a mesh are skipped once its error statistics have
+converged (see `sequential_planner.py`).  The command used to run a job
+is a template, so a stub worker can stand in for Julia; `--stub` uses the
+one in this module, which writes shards of the right shape filled with
+dummy values.
+
+Usage from the command line:
+
+    python campaign.py ks --workers 64
+    python campaign.py lorenz --workers 15 --stub
+    python campaign.py ks --workers 64 --target 1.0
+"""
+
+import argparse
+import collections
+import concurrent.futures
+import os
+import subprocess
+import sys
+import numpy as np
+from data_header import write_data_file
+from sequential_planner import SequentialStopper
+from shard_store import (append_manifest, init_manifest, merge_manifest,
+                         read_manifest)
+
+_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+Job = collections.namedtuple("Job", ["order", "index", "value", "sample",
+                                     "shard"])
+Job.__doc__ = """One job of a campaign: `order` of accuracy, `index` of the
+mesh or step size in the campaign (from 0), its `value` as passed to the
+Julia entry point, the `sample` number (from 1), and the `shard` file the
+job writes."""
+
+class Campaign:
+    """
+    Description of a statistics campaign.
+
+    `orders` lists the orders of accuracy and `values` the meshes or step
+    sizes, as passed to the Julia job entry point; each (order, value) pair
+    has `num_samples` jobs, each writing `rows` samples per period of the
+    blocks `names`.  `directory` holds the Julia gatherer, and `command` is
+    the default job command: a list of arguments formatted with the fields
+    of `Job` and `directory`.  `output` is the name of the merged file for
+    an order, `tau` the integration periods, and `value_key`, if not None,
+    the metadata key under which `values` are recorded.
+    """
+    def __init__(self, name, directory, orders, values, num_samples, rows,
+                 names, output, tau, command, value_key=None):
+        self.name = name
+        self.directory = directory
+        self.orders = tuple(orders)
+        self.values = tuple(values)
+        self.num_samples = num_samples
+        self.rows = rows
+        self.names = tuple(names)
+        self.output = output
+        self.tau = tuple(tau)
+        self.command = command
+        self.value_key = value_key
+
+    def order_dir(self, shard_dir, order):
+        """Return the directory of the shards of `order` in `shard_dir`."""
+        return os.path.join(shard_dir, "order{}".format(order))
+
+    def shard_name(self, shard_dir, order, value, sample):
+        return os.path.join(self.order_dir(shard_dir, order),
+                            "{}_order{}_{}_sample{}.dat".format(
+                                self.name, order, value, sample))
+
+    def manifest_meta(self, order):
+        """Return the metadata recorded in the manifest of `order`."""
+        meta = [("name", self.name), ("order", order), ("names", self.names),
+                ("tau", self.tau), ("values", self.values)]
+        if self.value_key is not None:
+            meta.append(("value_key", self.value_key))
+        return meta + [("num_samples", self.num_samples),
+                       ("rows", self.rows)]
+
+    def jobs(self, shard_dir, orders=None, interleave=False):
+        """
+        Return the jobs of the campaign for `orders` (default: all of them),
+        the most expensive (largest `value`) first, so the slowest jobs do
+        not end up at the tail of the run.  With `interleave`, the jobs are
+        ordered by sample first, so every mesh gets its first samples before
+        any gets its last.
+        """
+        jobs = []
+        for order in self.orders if orders is None else orders:
+            for index, value in enumerate(self.values):
+                for sample in range(1, self.num_samples + 1):
+                    jobs.append(Job(order, index, value, sample,
+                                    self.shard_name(shard_dir, order, value,
+                                                    sample)))
+        if interleave:
+            return sorted(jobs, key=lambda job: (job.sample, -job.value))
+        return sorted(jobs, key=lambda job: -job.value)
+
+ks_campaign = Campaign(
+    "ks", os.path.join(_root, "kuramoto-sivashinsky"), orders=(2, 4, 6),
+    values=range(127, 256, 32), num_samples=10, rows=100,
+    names=("dx", "u_avg", "u2_avg", "cputime"),
+    output="raw_statistics_ks_order{}.dat", tau=(40.0, 400.0, 4000.0),
+    command=["julia", "-e", 'include("chaotic_statistics_gather.jl"); '
+             'KSGather.gatherJobKS({order}, {value}, {sample}, '
+             'raw"{shard}")'],
+    value_key="num_nodes")
+
+lorenz_campaign = Campaign(
+    "lorenz", os.path.join(_root, "lorenz"), orders=(2, 4, 8),
+    values=range(1, 6), num_samples=1, rows=1000,
+    names=("dt", "z_avg", "cputime"),
+    output="raw_statistics_lorenz_order{}.dat", tau=(1.0, 10.0, 100.0),
+    command=["julia", "-e", 'include("statistics_gather.jl"); '
+             'LorenzMod.gatherJobLorenz({order}, {value}, raw"{shard}")'])
+
+campaigns = {"ks": ks_campaign, "lorenz": lorenz_campaign}
+
+def stub_command(campaign):
+    """Return a job command that runs `write_stub_shard` instead of Julia."""
+    return [sys.executable, os.path.abspath(__file__), "stub", campaign.name,
+            "{order}", "{value}", "{sample}", "{shard}"]
+
+def write_stub_shard(campaign, order, value, sample, shard):
+    """Write a shard with the layout of a real job, filled with dummy data."""
+    rng = np.random.default_rng([order, value, sample])
+    shape = (len(campaign.tau), 1, campaign.rows)
+    blocks = [(campaign.names[0], np.full(shape, 1.0/value))]
+    blocks += [(name, rng.random(shape)) for name in campaign.names[1:]]
+    write_data_file(shard, blocks, _meta(campaign, order, value))
+
+def _meta(campaign, order, values):
+    meta = [("order", order), ("tau", campaign.tau)]
+    if campaign.value_key is not None:
+        meta.append((campaign.value_key, values))
+    return meta
+
+def run_job(job, command, cwd):
+    """
+    Run `job` with the command template `command` in the directory `cwd`.
+
+    The output of the job goes to the shard name plus `.log`.  The shard is
+    written under a temporary name and renamed when the job succeeds, so an
+    interrupted job never leaves a partial shard.  Returns the job's exit
+    status.
+    """
+    tmp = job.shard + ".part"
+    fields = dict(job._asdict(), shard=os.path.abspath(tmp), directory=cwd)
+    args = [arg.format(**fields) for arg in command]
+    with open(job.shard + ".log", "w") as log:
+        status = subprocess.call(args, cwd=cwd, stdout=log,
+                                 stderr=subprocess.STDOUT)
+    if status == 0 and os.path.exists(tmp):
+        os.replace(tmp, job.shard)
+    elif status == 0:
+        status = -1 # the job did not write its shard
+    return status
+
+def run_jobs(jobs, command, cwd, workers=os.cpu_count(), skip_existing=True,
+             log=print, skip=None):
+    """
+    Run `jobs` on a pool of `workers` concurrent processes and return the
+    jobs that failed.
+
+    Jobs whose shard already exists are skipped when `skip_existing` is set,
+    so an interrupted campaign can be restarted.  If given, `skip` is called
+    with each job just before it would start, and the job is skipped if it
+    returns True (e.g. a `sequential_planner.SequentialStopper`).  Each
+    completed shard is
+    recorded in the manifest of its directory, which must already exist
+    (see `shard_store.init_manifest`).  Progress is reported through `log`.
+    """
+    if skip_existing:
+        # record shards that were renamed into place just before a crash
+        recorded = {}
+        for job in jobs:
+            if not os.path.exists(job.shard):
+                continue
+            shard_dir = os.path.dirname(job.shard)
+            if shard_dir not in recorded:
+                recorded[shard_dir] = {entry["shard"] for entry in
+                                       read_manifest(shard_dir)[1]}
+            if os.path.basename(job.shard) not in recorded[shard_dir]:
+                append_manifest(shard_dir, job.order, job.value, job.sample,
+                                job.shard)
+        jobs = [job for job in jobs if not os.path.exists(job.shard)]
+    def start(job):
+        if skip is not None and skip(job):
+            return None
+        return run_job(job, command, cwd)
+
+    failed = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(start, job): job for job in jobs}
+        for done, future in enumerate(
+                concurrent.futures.as_completed(futures), 1):
+            job = futures[future]
+            status = future.result()
+            if status is None:
+                log("[{}/{}] order {} value {} sample {}: skipped".format(
+                    done, len(jobs), job.order, job.value, job.sample))
+                continue
+            if status != 0:
+                failed.append(job)
+            else:
+                append_manifest(os.path.dirname(job.shard), job.order,
+                                job.value, job.sample, job.shard)
+            log("[{}/{}] order {} value {} sample {}: {}".format(
+                done, len(jobs), job.order, job.value, job.sample,
+                "ok" if status == 0 else "FAILED ({})".format(status)))
+    return failed
+
+def merge_shards(campaign, shard_dir, order, file_name, allow_missing=False):
+    """
+    Merge the shards of `order` in `shard_dir` into the raw statistics file
+    `file_name`, with the blocks, shapes and metadata that the serial
+    gatherer writes.  Raises ValueError if any shard is missing, unless
+    `allow_missing` is set, in which case the missing samples are NaN (the
+    summaries of `summary_stats.py` leave them out).
+    """
+    meta, data, filled = merge_manifest(campaign.order_dir(shard_dir, order))
+    if not np.all(filled[:,0] if allow_missing else filled):
+        raise ValueError("{} of {} shards missing for order {}".format(
+            np.sum(~filled), filled.size, order))
+    write_data_file(file_name, list(zip(campaign.names, data)),
+                    _meta(campaign, order, campaign.values))
+
+def run_campaign(campaign, shard_dir, out_dir, workers=os.cpu_count(),
+                 command=None, orders=None, log=print, target=None,
+                 **kwargs):
+    """
+    Run all jobs of `campaign` (for `orders`, default all) and merge them
+    into one raw statistics file per order in `out_dir`.
+
+    Shards are kept in one directory per order under `shard_dir`.  With a
+    `target` half-width (in percent), the jobs run sample by sample and the
+    remaining jobs of a mesh are skipped once its cells have converged; the
+    keyword arguments go to `sequential_planner.SequentialStopper`, and the
+    skipped samples are NaN in the merged files.  Returns the list of
+    failed jobs; the files of orders with failed jobs are not written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for order in campaign.orders if orders is None else orders:
+        init_manifest(campaign.order_dir(shard_dir, order),
+                      campaign.manifest_meta(order))
+    jobs = campaign.jobs(shard_dir, orders, interleave=target is not None)
+    skip = None
+    if target is not None:
+        skip = SequentialStopper(campaign, shard_dir, target, **kwargs)
+    failed = run_jobs(jobs, campaign.command if command is None else command,
+                      campaign.directory, workers, log=log, skip=skip)
+    for order in campaign.orders if orders is None else orders:
+        if any(job.order == order for job in failed):
+            log("not merging order {}: some jobs failed".format(order))
+            continue
+        file_name = os.path.join(out_dir, campaign.output.format(order))
+        merge_shards(campaign, shard_dir, order, file_name,
+                     allow_missing=target is not None)
+        log("wrote " + file_name)
+    return failed
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "stub":
+        name, order, value, sample, shard = sys.argv[2:7]
+        write_stub_shard(campaigns[name], int(order), int(value), int(sample),
+                         shard)
+        sys.exit(0)
+    parser = argparse.ArgumentParser(description="run a statistics campaign")
+    parser.add_argument("campaign", choices=sorted(campaigns))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--orders", type=int, nargs="+")
+    parser.add_argument("--shard-dir", default=None,
+                        help="default: shards/ in the campaign directory")
+    parser.add_argument("--out-dir", default=None,
+                        help="default: the campaign directory")
+    parser.add_argument("--stub", action="store_true",
+                        help="use a stub worker in place of Julia")
+    parser.add_argument("--target", type=float, default=None,
+                        help="stop each mesh once the confidence intervals "
+                        "of its median percent errors are this narrow")
+    parser.add_argument("--min-samples", type=int, default=20)
+    args = parser.parse_args()
+    campaign = campaigns[args.campaign]
+    shard_dir = args.shard_dir or os.path.join(campaign.directory, "shards")
+    out_dir = args.out_dir or campaign.directory
+    failed = run_campaign(campaign, shard_dir, out_dir, args.workers,
+                          stub_command(campaign) if args.stub else None,
+                          args.orders, target=args.target,
+                          min_samples=args.min_samples)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,195 @@
+"""module for convergence rates and extrapolated reference values
+
+The verification plots estimate the convergence rate from the last two
+meshes, and the reference values of the quantities of interest come from a
+separate, very expensive benchmark campaign (`compute_ks_benchmark.jl`).
+This module fits error models to all the meshes (and step sizes and
+orders) at once by weighted least squares, and reports the fitted
+parameters with their standard errors:
+
+  * `fit_error_model` fits `e(h) = C_0 h^p + C_1 h^(p+1) + ...` to errors
+    against a known reference, with relative residuals, so every mesh
+    counts the same whatever the size of its error;
+  * `fit_reference` fits `Q(h) = Q* + C_0 h^p + ... [+ D dt^r]` to the
+    values of a quantity computed on several meshes, sharing the limit
+    `Q*` between any number of series (e.g. one per order of accuracy),
+    each with its own rate and coefficients.  `Q*` is the Richardson
+    extrapolated reference value, and its standard error follows from the
+    scatter of the values or from their `sigma`.
+
+Rates left unknown are fitted along with the coefficients
+(`scipy.optimize.least_squares`); the covariance of the parameters is
+that of the linearized problem at the solution, scaled by the reduced
+chi-square unless `absolute_sigma` is set, as in `scipy.optimize.curve_fit`.
+`extrapolate_cubes` applies `fit_reference` to the sample means of the
+raw statistics (`StatsCube`s) of several orders.
+"""
+
+import collections
+import numpy as np
+import scipy.optimize
+
+RateFit = collections.namedtuple("RateFit", ["rate", "rate_se", "coeffs",
+                                             "cov", "dof"])
+RateFit.__doc__ = """A fitted error model `sum_k coeffs[k] h^(rate+k)`: the
+`rate` and its standard error `rate_se` (NaN without spare points), the
+coefficients, the covariance of `(rate,) + coeffs`, and the degrees of
+freedom of the fit."""
+
+ReferenceFit = collections.namedtuple("ReferenceFit", [
+    "value", "value_se", "rates", "rates_se", "params", "cov", "chi2", "dof"])
+ReferenceFit.__doc__ = """An extrapolated reference: the limit `value` and
+its standard error, the rate of each series and its standard error (zero
+for rates that were given), all fitted parameters with their covariance,
+and the chi-square and degrees of freedom of the fit."""
+
+def _covariance(jac, resid, dof, absolute_sigma):
+    """Return the covariance of a least-squares fit from its Jacobian."""
+    cov = np.linalg.pinv(jac.T @ jac)
+    if not absolute_sigma:
+        cov = cov*(np.sum(resid**2)/dof if dof > 0 else np.nan)
+    return cov
+
+def fit_error_model(h, error, terms=1, rate=None, weights=None):
+    """
+    Fit `error = sum_k C_k h^(p+k)`, for `k < terms`, to the errors
+    `error` on the meshes (or step sizes) `h`, minimizing the weighted
+    relative residuals `weights*(model - error)/error` (default weights 1).
+    The rate `p` is fitted unless `rate` is given.  Returns a `RateFit`.
+    """
+    h = np.asarray(h, dtype=float)
+    error = np.asarray(error, dtype=float)
+    w = np.ones_like(h) if weights is None else np.asarray(weights, float)
+    # start from the straight line through the points in log-log scale
+    slope, intercept = np.polyfit(np.log(h), np.log(error), 1, w=w)
+    p0 = slope if rate is None else rate
+
+    def model(x):
+        p = x[0] if rate is None else rate
+        c = x[1:] if rate is None else x
+        return sum(c[k]*h**(p + k) for k in range(terms))
+
+    def resid(x):
+        return w*(model(x) - error)/error
+
+    x0 = np.r_[[p0] if rate is None else [], np.exp(intercept),
+               np.zeros(terms - 1)]
+    sol = scipy.optimize.least_squares(resid, x0, method="lm"
+                                       if h.size >= x0.size else "trf")
+    dof = h.size - x0.size
+    cov = _covariance(sol.jac, sol.fun, dof, False)
+    if rate is None:
+        return RateFit(sol.x[0], np.sqrt(cov[0,0]), sol.x[1:], cov, dof)
+    return RateFit(rate, 0.0, sol.x, cov, dof)
+
+def _per_series(x, num_series, name):
+    """Return `x` (None, a scalar or a sequence) as a list per series."""
+    if x is None or np.isscalar(x):
+        return [x]*num_series
+    if len(x) != num_series:
+        raise ValueError(name + " must have one entry per series!")
+    return list(x)
+
+def fit_reference(h, values, sigma=None, series=None, rate=None, terms=1,
+                  dt=None, dt_rate=None, absolute_sigma=False):
+    """
+    Fit `values = Q* + sum_k C_k h^(p+k) [+ D dt^r]`, for `k < terms`, to
+    the values of a quantity on the meshes `h` (and step sizes `dt`), and
+    return the limit `Q*` as a `ReferenceFit`.
+
+    `series` labels each value with the series it belongs to (e.g. the
+    order of accuracy; default: a single series).  All series share `Q*`,
+    and each has its own rate `p`, coefficients `C_k` and `D`.  `rate` and
+    `dt_rate` give the rates of each series (a scalar or one entry per
+    series, in sorted label order); None entries of `rate` are fitted, and
+    `dt_rate` is needed with `dt`.  `sigma` holds the standard errors of
+    the values (e.g. the standard errors of sample means).
+    """
+    h = np.asarray(h, dtype=float).ravel()
+    values = np.asarray(values, dtype=float).ravel()
+    sigma = np.ones_like(values) if sigma is None else \
+        np.broadcast_to(np.asarray(sigma, dtype=float), values.shape).ravel()
+    labels = np.zeros(values.size, dtype=int) if series is None else \
+        np.asarray(series).ravel()
+    names, index = np.unique(labels, return_inverse=True)
+    rates = _per_series(rate, names.size, "rate")
+    if dt is not None:
+        dt = np.asarray(dt, dtype=float).ravel()
+        dt_rates = _per_series(dt_rate, names.size, "dt_rate")
+        if None in dt_rates:
+            raise ValueError("dt_rate is needed with dt!")
+    # parameter layout: Q*, then per series [p], C_0..C_{terms-1}, [D]
+    slots = []
+    num = 1
+    for s in range(names.size):
+        p_slot = num if rates[s] is None else None
+        num += p_slot is not None
+        slots.append((p_slot, list(range(num, num + terms)),
+                      num + terms if dt is not None else None))
+        num += terms + (dt is not None)
+
+    def model(x):
+        out = np.full(values.size, x[0])
+        for s, (p_slot, c_slots, d_slot) in enumerate(slots):
+            rows = index == s
+            p = x[p_slot] if p_slot is not None else rates[s]
+            for k, c in enumerate(c_slots):
+                out[rows] += x[c]*h[rows]**(p + k)
+            if d_slot is not None:
+                out[rows] += x[d_slot]*dt[rows]**dt_rates[s]
+        return out
+
+    def resid(x):
+        return (model(x) - values)/sigma
+
+    # start from the linear fit with the given rates, or rates of 2
+    x0 = np.zeros(num)
+    for s, (p_slot, _, _) in enumerate(slots):
+        if p_slot is not None:
+            x0[p_slot] = 2.0
+    linear = [0] + [c for _, c_slots, d_slot in slots for c in c_slots
+                    + ([] if d_slot is None else [d_slot])]
+
+    def unit(slot):
+        x = np.where(np.isin(np.arange(num), linear), 0.0, x0)
+        x[slot] = 1.0
+        return x
+
+    basis = np.stack([model(unit(slot)) for slot in linear], axis=1)
+    x0[linear] = np.linalg.lstsq(basis/sigma[:,None], values/sigma,
+                                 rcond=None)[0]
+    sol = scipy.optimize.least_squares(resid, x0, x_scale="jac")
+    dof = values.size - num
+    cov = _covariance(sol.jac, sol.fun, dof, absolute_sigma)
+    fitted = [rates[s] if p is None else sol.x[p]
+              for s, (p, _, _) in enumerate(slots)]
+    fitted_se = [0.0 if p is None else np.sqrt(cov[p,p]) for p, _, _ in slots]
+    return ReferenceFit(sol.x[0], np.sqrt(cov[0,0]), np.array(fitted),
+                        np.array(fitted_se), sol.x, cov,
+                        np.sum(sol.fun**2), dof)
+
+def extrapolate_cubes(cubes, orders, quantity, time_idx, terms=1):
+    """
+    Return the Richardson extrapolation of the mean of `quantity`, for the
+    integration period `time_idx`, as a `ReferenceFit`.
+
+    `cubes` holds the `StatsCube`s of the schemes of accuracy `orders`.
+    The sample means of every mesh of every cube are fitted together with
+    `fit_reference`, each order with its own coefficients and its known
+    rate, weighted by their standard errors, so that moderate runs give a
+    reference value with an error bar.  Cells without spread (e.g. runs
+    that failed and were written as zeros) are left out.
+    """
+    h, values, sigma, series = [], [], [], []
+    for cube, order in zip(cubes, orders):
+        samples = cube[quantity][time_idx]
+        count = np.sum(~np.isnan(samples), axis=-1)
+        std = np.nanstd(samples, axis=-1, ddof=1)
+        keep = std > 0
+        h.append(cube.mesh_values()[keep])
+        values.append(np.nanmean(samples, axis=-1)[keep])
+        sigma.append(std[keep]/np.sqrt(count[keep]))
+        series.append(np.full(np.sum(keep), order))
+    return fit_reference(np.concatenate(h), np.concatenate(values),
+                         np.concatenate(sigma), np.concatenate(series),
+                         rate=sorted(orders), terms=terms)
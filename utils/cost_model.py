@@ -0,0 +1,321 @@
+"""module for the cost of the statistics runs and the cheapest way to an error
+
+The statistics files record, for every (order, mesh or step size, tau)
+cell, the percent errors of the quantities of interest and the cpu time of
+each sample, and `plot_statistics_error_vs_cputime.py` plots one against
+the other.  This module turns the same cells into a plan:
+
+  * `fit_cost_model` fits, per order, `cputime = c nodes^a steps^b` to the
+    median cpu times of the cells, by least squares in log scale with a
+    soft-L1 loss, so that an outlier (e.g. the first solve of a Julia
+    session, which includes compilation) does not skew the fit.  Exponents
+    of counts that do not vary between the cells are fixed at 1, e.g. the
+    nodes exponent of the Lorenz system, which has one "node".  The Newton
+    iterations per step of the implicit midpoint rule of the KS solver are
+    not recorded; their number grows with the stiffness `dt/dx^4`, so they
+    show up as a nodes exponent above 1, that is, as a cost per node-step
+    that grows like `nodes^(a-1)`;
+  * `pareto_frontier` returns the cells that no other cell beats in both
+    cost and error, over the cells of all orders at once;
+  * `CostPlanner.cheapest` returns the cheapest configuration whose error
+    is at most a target, among the measured cells and the meshes
+    interpolated (in log-log scale) between neighbouring measured meshes,
+    with the run time of a campaign projected from the cost models,
+    including the spin-up of each sample.
+
+`cost_planner` in `load_stats.py` and `load_lorenz_stats.py` builds a
+`CostPlanner` from the statistics files.  Usage from the command line:
+
+    python cost_model.py ks ../kuramoto-sivashinsky/statistics_ks_order*.dat \
+        --target 1.0 --samples 10
+    python cost_model.py lorenz ../lorenz/statistics_lorenz_order*.dat \
+        --target 0.5
+"""
+
+import argparse
+import collections
+import sys
+import numpy as np
+import scipy.optimize
+
+CostModel = collections.namedtuple("CostModel", [
+    "coeff", "exponents", "exponents_se", "scatter", "dof"])
+CostModel.__doc__ = """A fitted cost model `cputime = coeff nodes^a steps^b`:
+the `exponents` (a, b) and their standard errors (zero for exponents fixed
+at 1), a robust standard deviation of the log residuals (`scatter`, from
+their median absolute value, so `exp(scatter)` is the typical factor
+between model and measurement), and the degrees of freedom of the fit."""
+
+Plan = collections.namedtuple("Plan", [
+    "order", "tau", "mesh", "nodes", "steps", "error", "interpolated",
+    "sample_seconds", "run_seconds"])
+Plan.__doc__ = """The cheapest configuration for a target error: the order,
+integration period and mesh (dx or dt), the nodes and steps of one sample,
+its error (measured, or interpolated between measured meshes if
+`interpolated`), and the projected cpu time of one sample (spin-up
+included) and of the whole run."""
+
+def fit_cost_model(nodes, steps, cputime, f_scale=0.5):
+    """
+    Fit `cputime = c nodes^a steps^b` to the cpu times `cputime` of runs
+    of `nodes` nodes and `steps` steps, and return a `CostModel`.  Cells
+    without a positive, finite cpu time (e.g. failed runs) are left out.
+    `f_scale` is the log residual beyond which a cell counts as an outlier.
+    """
+    nodes, steps, cputime = (np.asarray(x, dtype=float).ravel()
+                             for x in (nodes, steps, cputime))
+    keep = np.isfinite(cputime) & (cputime > 0)
+    cols = [np.log(nodes[keep]), np.log(steps[keep])]
+    fitted = [np.ptp(col) > 0 if col.size else False for col in cols]
+    # exponents that cannot be fitted are fixed at 1
+    y = np.log(cputime[keep]) - sum(col for col, fit in zip(cols, fitted)
+                                    if not fit)
+    X = np.stack([np.ones(y.size)] + [col for col, fit in zip(cols, fitted)
+                                      if fit], axis=1)
+    dof = y.size - X.shape[1]
+    if dof < 0:
+        raise ValueError("not enough cells to fit the cost model!")
+    x0 = np.linalg.lstsq(X, y, rcond=None)[0]
+    sol = scipy.optimize.least_squares(lambda x: X @ x - y, x0,
+                                       loss="soft_l1", f_scale=f_scale)
+    # covariance of the reweighted problem at the solution, scaled by the
+    # median absolute residual so that outliers do not inflate it
+    r = sol.fun
+    w = 1/np.sqrt(1 + (r/f_scale)**2)
+    scatter = 1.4826*np.median(np.abs(r)) if dof > 0 else np.nan
+    cov = np.linalg.pinv(X.T @ (w[:,None]*X))*scatter**2
+    exponents, exponents_se = np.ones(2), np.zeros(2)
+    slots = np.cumsum(fitted)
+    for k, fit in enumerate(fitted):
+        if fit:
+            exponents[k] = sol.x[slots[k]]
+            exponents_se[k] = np.sqrt(cov[slots[k],slots[k]])
+    return CostModel(np.exp(sol.x[0]), exponents, exponents_se, scatter, dof)
+
+def predict_cost(model, nodes, steps):
+    """Return the cpu time of runs of `nodes` nodes and `steps` steps."""
+    a, b = model.exponents
+    return model.coeff*np.asarray(nodes, dtype=float)**a \
+        * np.asarray(steps, dtype=float)**b
+
+def pareto_frontier(cost, error):
+    """
+    Return the indices of the points (`cost`, `error`), given as 1D arrays,
+    that no other point beats in both cost and error, by increasing cost.
+    Points with a NaN cost or error are left out.
+    """
+    cost = np.asarray(cost, dtype=float)
+    error = np.asarray(error, dtype=float)
+    valid = np.flatnonzero(np.isfinite(cost) & np.isfinite(error))
+    order = valid[np.lexsort((error[valid], cost[valid]))]
+    best = np.minimum.accumulate(error[order])
+    return order[np.r_[True, error[order][1:] < best[:-1]]]
+
+class CostPlanner:
+    """
+    The cells (order, tau, mesh) of a set of statistics files and the cost
+    models of their orders.
+
+    `tables` holds one `SummaryTable` per order in `orders` and `tau` the
+    integration periods.  `nodes` and `dt` are functions returning the
+    number of nodes and the time step of a run on an array of meshes, and
+    `spin` is the spin-up period run before each sample.  The cells are
+    held as arrays of shape (order, tau, mesh), with the meshes of each
+    order sorted from coarse to fine: `mesh`, `nodes`, `steps`, `error` (the
+    summary `field` of the percent error of `qoi`, e.g. "med" or, to be
+    conservative, "q3" or "cihi"), `cputime` (the measured median) and
+    `cost` (the model); `valid` marks the cells with a cpu time and an
+    error.  `models` maps each order to its `CostModel`.
+    """
+    def __init__(self, tables, orders, tau, qoi, nodes, dt, spin=0.0,
+                 field="med"):
+        if len(tables) != len(orders):
+            raise ValueError("tables and orders must have the same length!")
+        self.orders = np.array(orders)
+        self.taus = np.asarray(tau, dtype=float)
+        self.qoi = qoi
+        self.field = field
+        self.spin = spin
+        self._nodes = nodes
+        self._dt = dt
+        columns = [np.argsort(-np.asarray(table.mesh)) for table in tables]
+        self.mesh = np.stack([np.broadcast_to(np.asarray(table.mesh)[col],
+                                              (self.taus.size, col.size))
+                              for table, col in zip(tables, columns)])
+        self.error = np.stack([table[qoi, field][:, col]
+                               for table, col in zip(tables, columns)])
+        self.cputime = np.stack([table[qoi, "cpu_med"][:, col]
+                                 for table, col in zip(tables, columns)])
+        self.nodes, self.steps = self.counts(self.mesh,
+                                             self.taus[None,:,None])
+        with np.errstate(invalid="ignore"):
+            self.valid = np.isfinite(self.error) & (self.cputime > 0)
+        self.models = {order: fit_cost_model(self.nodes[p], self.steps[p],
+                                             np.where(self.valid[p],
+                                                      self.cputime[p], np.nan))
+                       for p, order in enumerate(orders)}
+        self.cost = np.stack([predict_cost(self.models[order], self.nodes[p],
+                                           self.steps[p])
+                              for p, order in enumerate(orders)])
+
+    def counts(self, mesh, tau):
+        """
+        Return the nodes and steps of runs of period `tau` on `mesh`, both
+        rounded up to whole numbers.
+        """
+        mesh = np.asarray(mesh, dtype=float)
+        nodes = np.ceil(np.round(self._nodes(mesh), 6))
+        steps = np.ceil(np.round(tau/self._dt(mesh), 6))
+        return np.broadcast_arrays(nodes, steps)
+
+    def node_step_seconds(self, order, nodes):
+        """
+        Return the cpu seconds per node and step of `order` on `nodes`
+        nodes, according to its cost model.
+        """
+        model = self.models[order]
+        return predict_cost(model, nodes, 1)/np.asarray(nodes, dtype=float)
+
+    def sample_seconds(self, order, mesh, tau):
+        """
+        Return the projected cpu time of one sample of period `tau` on
+        `mesh` with `order`, spin-up included.
+        """
+        model = self.models[order]
+        nodes, steps = self.counts(mesh, tau)
+        seconds = predict_cost(model, nodes, steps)
+        if self.spin > 0:
+            seconds = seconds + predict_cost(model, nodes,
+                                             self.counts(mesh, self.spin)[1])
+        return seconds
+
+    def frontier(self, measured=False):
+        """
+        Return the (order, tau, mesh) indices of the cells on the Pareto
+        frontier of error against cost (the modeled cost, or the `measured`
+        cpu time), by increasing cost, as a tuple of arrays.
+        """
+        cost = self.cputime if measured else self.cost
+        idx = pareto_frontier(np.where(self.valid, cost, np.nan).ravel(),
+                              np.where(self.valid, self.error, np.nan).ravel())
+        return np.unravel_index(idx, self.error.shape)
+
+    def candidates(self, target):
+        """
+        Return the configurations whose error is at most `target`: the
+        measured cells, and the meshes where the error interpolated in
+        log-log scale between two neighbouring measured meshes crosses the
+        target, as a dict of 1D arrays (order, tau, mesh, error and
+        interpolated).
+        """
+        with np.errstate(invalid="ignore", divide="ignore", over="ignore"):
+            met = self.valid & (self.error <= target)
+            lo, hi = self.error[..., :-1], self.error[..., 1:]
+            both = self.valid[..., :-1] & self.valid[..., 1:]
+            cross = both & (lo > target) & (hi <= target) & (hi > 0)
+            frac = np.log(lo/target)/np.log(lo/hi)
+            mesh = np.exp(np.log(self.mesh[..., :-1]) + frac*np.log(
+                self.mesh[..., 1:]/self.mesh[..., :-1]))
+        shape = self.error.shape
+        p, t, _ = np.indices(shape)
+        pc, tc, _ = np.indices(cross.shape)
+        return dict(order=np.r_[self.orders[p[met]], self.orders[pc[cross]]],
+                    tau=np.r_[self.taus[t[met]], self.taus[tc[cross]]],
+                    mesh=np.r_[self.mesh[met], mesh[cross]],
+                    error=np.r_[self.error[met],
+                                np.full(np.sum(cross), float(target))],
+                    interpolated=np.r_[np.zeros(np.sum(met), dtype=bool),
+                                       np.ones(np.sum(cross), dtype=bool)])
+
+    def cheapest(self, target, num_samples=1, interpolate=True):
+        """
+        Return the `Plan` of the cheapest configuration whose error is at
+        most `target`, for a run of `num_samples` samples, or None if no
+        measured or interpolated configuration reaches it.  Set
+        `interpolate` to False to only consider the measured cells.
+        """
+        cand = self.candidates(target)
+        if not interpolate:
+            cand = {key: value[~cand["interpolated"]]
+                    for key, value in cand.items()}
+        if cand["order"].size == 0:
+            return None
+        seconds = np.empty(cand["order"].size)
+        for order in np.unique(cand["order"]):
+            rows = cand["order"] == order
+            seconds[rows] = self.sample_seconds(order, cand["mesh"][rows],
+                                                cand["tau"][rows])
+        best = np.argmin(seconds)
+        nodes, steps = self.counts(cand["mesh"][best], cand["tau"][best])
+        return Plan(int(cand["order"][best]), float(cand["tau"][best]),
+                    float(cand["mesh"][best]), int(nodes), int(steps),
+                    float(cand["error"][best]),
+                    bool(cand["interpolated"][best]), float(seconds[best]),
+                    num_samples*float(seconds[best]))
+
+    def report(self, target=None, num_samples=1):
+        """
+        Return a text report of the cost models, the Pareto frontier and,
+        given a `target` error, the cheapest plan for it.
+        """
+        lines = ["cost models (cputime = c nodes^a steps^b):"]
+        for p, order in enumerate(self.orders):
+            model = self.models[order]
+            nodes = np.unique(self.nodes[p][self.valid[p]])
+            per_step = self.node_step_seconds(order, nodes)
+            lines.append("  order {}: c {:.3g}  a {:.3f} +/- {:.2g}  "
+                         "b {:.3f} +/- {:.2g}  scatter x{:.2f}".format(
+                             order, model.coeff, model.exponents[0],
+                             model.exponents_se[0], model.exponents[1],
+                             model.exponents_se[1], np.exp(model.scatter)))
+            lines.append("    seconds per node-step {}".format(" ".join(
+                "{:.3g}".format(s) for s in np.atleast_1d(per_step))))
+        lines.append("Pareto frontier ({} error of {} vs modeled cost):"
+                     .format(self.field, self.qoi))
+        for p, t, m in zip(*self.frontier()):
+            lines.append("  order {}  tau {:g}  mesh {:.6g}  error {:.4g}%  "
+                         "cost {:.4g} s (measured {:.4g} s)".format(
+                             self.orders[p], self.taus[t], self.mesh[p,t,m],
+                             self.error[p,t,m], self.cost[p,t,m],
+                             self.cputime[p,t,m]))
+        if target is not None:
+            plan = self.cheapest(target, num_samples)
+            if plan is None:
+                lines.append("no configuration reaches {:g}%".format(target))
+            else:
+                lines.append(
+                    "cheapest for {:g}%: order {}  tau {:g}  mesh {:.6g} "
+                    "({} nodes, {} steps)  error {:.4g}%{}\n  projected "
+                    "{:.4g} s per sample, {:.4g} s for {} samples".format(
+                        target, plan.order, plan.tau, plan.mesh, plan.nodes,
+                        plan.steps, plan.error,
+                        " (interpolated)" if plan.interpolated else "",
+                        plan.sample_seconds, plan.run_seconds, num_samples))
+        return "\n".join(lines)
+
+if __name__ == "__main__":
+    from campaign import campaigns
+    parser = argparse.ArgumentParser(
+        description="cost models and cheapest configuration for an error")
+    parser.add_argument("campaign", choices=sorted(campaigns))
+    parser.add_argument("files", nargs="+",
+                        help="statistics files, one per order")
+    parser.add_argument("--orders", type=int, nargs="*", default=None,
+                        help="orders of the files (default: the campaign's)")
+    parser.add_argument("--target", type=float, default=None,
+                        help="target percent error")
+    parser.add_argument("--samples", type=int, default=1,
+                        help="number of samples of the planned run")
+    parser.add_argument("--field", default="med",
+                        help="summary field of the error (default: med)")
+    args = parser.parse_args()
+    campaign = campaigns[args.campaign]
+    sys.path.append(campaign.directory)
+    if args.campaign == "ks":
+        from load_stats import cost_planner
+    else:
+        from load_lorenz_stats import cost_planner
+    orders = campaign.orders if args.orders is None else args.orders
+    planner = cost_planner(args.files, orders, len(campaign.values),
+                           len(campaign.tau), campaign.tau, field=args.field)
+    print(planner.report(args.target, args.samples))
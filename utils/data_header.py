@@ -0,0 +1,196 @@
+"""module for reading and writing self-describing headers on text data files
+
+A data file with a header starts with a few comment lines, for example
+
+    # hoc-data 1
+    # meta order=2
+    # meta tau=40.0,400.0,4000.0
+    # block name=dx dtype=float64 shape=3,5,1000 line=0 offset=0
+    # block name=u_avg dtype=float64 shape=3,5,1000 line=15 offset=82335
+    # end
+
+followed by the numeric rows of each block in turn.  A block of shape
+`(n_1, ..., n_k)` occupies `n_1*...*n_{k-1}` rows of `n_k` values, in C
+order.  `line` and `offset` give the first row of the block, counted in
+rows and in bytes from the first line after `# end`.  Because the header
+lines start with `#`, `np.loadtxt` skips them, so files with a header can
+still be read by code that does not know about it.
+"""
+
+import collections
+import numpy as np
+from stats_cache import cached_loadtxt, current_cache
+
+magic = "# hoc-data 1"
+
+Block = collections.namedtuple("Block", ["name", "dtype", "shape", "line",
+                                         "offset"])
+Block.__doc__ = "Description of one block of a data file with a header."
+
+class DataHeader:
+    """
+    Parsed header of a data file.
+
+    `blocks` maps block names to `Block` tuples (in file order), `meta` maps
+    metadata keys to their values, and `data_start` is the byte position of
+    the first data line in the file.
+    """
+    def __init__(self, blocks, meta, data_start):
+        self.blocks = blocks
+        self.meta = meta
+        self.data_start = data_start
+
+    def names(self):
+        return tuple(self.blocks)
+
+def _parse_value(text):
+    vals = []
+    for item in text.split(","):
+        try:
+            val = int(item)
+        except ValueError:
+            try:
+                val = float(item)
+            except ValueError:
+                val = item
+        vals.append(val)
+    return vals[0] if len(vals) == 1 else vals
+
+def _fields(line):
+    fields = {}
+    for item in line.split():
+        key, _, val = item.partition("=")
+        fields[key] = val
+    return fields
+
+def read_header(file_name):
+    """
+    Return the `DataHeader` of `file_name`, or None if it has no header.
+
+    Only the header lines are read, so this costs the same no matter how
+    large the data section is.
+    """
+    blocks = collections.OrderedDict()
+    meta = collections.OrderedDict()
+    with open(file_name, "rb") as f:
+        if f.readline().decode().rstrip() != magic:
+            return None
+        while True:
+            line = f.readline().decode()
+            if not line:
+                raise ValueError("unterminated header in " + file_name)
+            line = line.strip()
+            if line == "# end":
+                break
+            if line.startswith("# meta "):
+                key, _, val = line[len("# meta "):].partition("=")
+                meta[key.strip()] = _parse_value(val.strip())
+            elif line.startswith("# block "):
+                fields = _fields(line[len("# block "):])
+                shape = tuple(int(n) for n in fields["shape"].split(","))
+                blocks[fields["name"]] = Block(
+                    fields["name"], fields.get("dtype", "float64"), shape,
+                    int(fields["line"]), int(fields["offset"]))
+        data_start = f.tell()
+    return DataHeader(blocks, meta, data_start)
+
+def _num_rows(shape):
+    return int(np.prod(shape[:-1], dtype=int))
+
+def check_shape(file_name, block, shape):
+    """Raise ValueError unless `block` matches `shape` (None matches any)."""
+    if len(shape) != len(block.shape) or any(
+            n is not None and n != m for n, m in zip(shape, block.shape)):
+        raise ValueError("block " + block.name + " of " + file_name
+                         + " has shape " + str(block.shape) + ", expected "
+                         + str(tuple(shape)))
+
+def legacy_blocks(names, shapes):
+    """
+    Describe the blocks of a file without a header.
+
+    `names` and `shapes` list the blocks in file order; the return value is
+    a dictionary of `Block` tuples with the line offsets filled in (byte
+    offsets are unknown for such files and are set to -1).
+    """
+    blocks = collections.OrderedDict()
+    line = 0
+    for name, shape in zip(names, shapes):
+        shape = tuple(shape)
+        blocks[name] = Block(name, "float64", shape, line, -1)
+        line += _num_rows(shape)
+    return blocks
+
+def load_block(file_name, name, shape=None, legacy=None):
+    """
+    Return block `name` of the data file `file_name` as an array.
+
+    If the file has a header, the block is located from it: when the binary
+    cache of the file is current the block is a view into it, otherwise only
+    the rows of the block are parsed.  Files without a header need `legacy`,
+    the dictionary returned by `legacy_blocks`, and are loaded whole through
+    the cache.  If `shape` is given, the shape of the block is checked
+    against it before any data is read (None entries match any size).
+    """
+    header = read_header(file_name)
+    if header is not None:
+        blocks = header.blocks
+    elif legacy is not None:
+        blocks = legacy
+    else:
+        raise ValueError(file_name + " has no header; legacy layout needed")
+    if name not in blocks:
+        raise KeyError("no block " + repr(name) + " in " + file_name)
+    block = blocks[name]
+    if shape is not None:
+        check_shape(file_name, block, shape)
+    rows = _num_rows(block.shape)
+    data = current_cache(file_name) if header is not None else \
+        cached_loadtxt(file_name)
+    if data is None:
+        with open(file_name, "rb") as f:
+            f.seek(header.data_start + block.offset)
+            data = np.loadtxt(f, max_rows=rows, ndmin=2)
+        first = 0
+    else:
+        first = block.line
+    if data.shape[0] < first + rows or data.shape[1] != block.shape[-1]:
+        raise ValueError("block " + name + " of " + file_name
+                         + " is inconsistent with its description")
+    return data[first:first+rows].reshape(block.shape)
+
+def format_row(values):
+    """Format one row of values the way Julia's `Print3DArray` does."""
+    return "".join(repr(float(v)) + " " for v in values) + "\n"
+
+def write_data_file(file_name, blocks, meta=()):
+    """
+    Write a data file with a header.
+
+    `blocks` is a sequence of `(name, array)` pairs, each array being written
+    as rows of its last axis, and `meta` is a sequence of `(key, value)`
+    pairs, where a value may be a scalar or a sequence of scalars.
+    """
+    texts = []
+    for name, arr in blocks:
+        arr = np.asarray(arr, dtype=float)
+        rows = arr.reshape(-1, arr.shape[-1])
+        texts.append("".join(format_row(row) for row in rows).encode())
+    with open(file_name, "wb") as f:
+        lines = [magic]
+        for key, val in meta:
+            val = np.atleast_1d(val)
+            lines.append("# meta " + key + "=" + ",".join(str(v) for v in val))
+        line = 0
+        offset = 0
+        for (name, arr), text in zip(blocks, texts):
+            shape = np.shape(arr)
+            lines.append("# block name={} dtype=float64 shape={} line={} "
+                         "offset={}".format(name, ",".join(map(str, shape)),
+                                            line, offset))
+            line += _num_rows(shape)
+            offset += len(text)
+        lines.append("# end")
+        f.write(("\n".join(lines) + "\n").encode())
+        for text in texts:
+            f.write(text)
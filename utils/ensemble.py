@@ -0,0 +1,240 @@
+"""module for integrating ensembles of Lorenz and Chen trajectories in lockstep
+
+`statistics_gather.jl` obtains its samples by cutting one long trajectory into
+windows, so neighbouring samples are correlated.  This module instead marches
+an ensemble of independent initial conditions, stored as an (M, 3) array, with
+one explicit Runge-Kutta step applied to every member at once, and folds the
+z values into Gregory window averages (`gregory.WindowAverager`) as the steps
+are taken.  The methods are those of `statistics_gather.jl` for orders 2 and 4
+(Heun and RK4); for order 8, the 11-stage method of Cooper and Verner is used
+in place of `Vern8`, which needs an embedded error estimate only for adaptive
+stepping.
+
+For comparison with the fixed-step methods, `integrate_adaptive` marches a
+single member with an embedded pair (Dormand-Prince 5(4) or 8(5,3)) and
+samples its dense output onto the uniform grid expected by the Gregory and
+Newton-Cotes averages.  Cost is counted in right-hand-side evaluations.
+"""
+
+import collections
+import math
+import time as timer
+import numpy as np
+import scipy.integrate
+from gregory import WindowAverager
+
+def lorenz_rhs(u):
+    """
+    Return the Lorenz right-hand side, as in `lorenz!`, for the state `u`,
+    whose first axis holds the x, y and z components (any further axes index
+    ensemble members).
+    """
+    x, y, z = u[0], u[1], u[2]
+    return np.stack((10.0*(y - x), x*(28.0 - z) - y, x*y - (8/3)*z))
+
+def chen_rhs(u):
+    """
+    Return the Chen right-hand side, as in `chen.jl` with a=35, b=3 and c=28,
+    for the state `u`; see `lorenz_rhs`.
+    """
+    x, y, z = u[0], u[1], u[2]
+    return np.stack((35.0*(y - x), (28.0 - 35.0)*x - x*z + 28.0*y,
+                     x*y - 3.0*z))
+
+systems = {"lorenz": lorenz_rhs, "chen": chen_rhs}
+
+# initial conditions on the attractors, from statistics_gather.jl and chen.jl
+initial_conditions = {
+    "lorenz": np.array([-5.276131687990789, -8.274832825254473,
+                        16.36301350713599]),
+    "chen": np.array([10.747927627254173, 12.40061941590775,
+                      21.207306876020063])}
+
+ButcherTableau = collections.namedtuple("ButcherTableau", ["A", "b", "c"])
+ButcherTableau.__doc__ = """Explicit Runge-Kutta method: stage coefficients
+`A` (strictly lower triangular), weights `b` and nodes `c`."""
+
+def _tableau(A, b):
+    A = np.array(A, dtype=float)
+    return ButcherTableau(A, np.array(b, dtype=float), A.sum(axis=1))
+
+heun = _tableau([[0, 0], [1, 0]], [1/2, 1/2])
+
+rk4 = _tableau([[0, 0, 0, 0], [1/2, 0, 0, 0], [0, 1/2, 0, 0], [0, 0, 1, 0]],
+               [1/6, 1/3, 1/3, 1/6])
+
+def _cooper_verner8():
+    s = math.sqrt(21.0)
+    A = np.zeros((11, 11))
+    A[1,0] = 1/2
+    A[2,:2] = [1/4, 1/4]
+    A[3,:3] = [1/7, (-7 - 3*s)/98, (21 + 5*s)/49]
+    A[4,[0,2,3]] = [(11 + s)/84, (18 + 4*s)/63, (21 - s)/252]
+    A[5,[0,2,3,4]] = [(5 + s)/48, (9 + s)/36, (-231 + 14*s)/360,
+                      (63 - 7*s)/80]
+    A[6,[0,2,3,4,5]] = [(10 - s)/42, (-432 + 92*s)/315, (633 - 145*s)/90,
+                        (-504 + 115*s)/70, (63 - 13*s)/35]
+    A[7,[0,4,5,6]] = [1/14, (14 - 3*s)/126, (13 - 3*s)/63, 1/9]
+    A[8,[0,4,5,6,7]] = [1/32, (91 - 21*s)/576, 11/72, (-385 - 75*s)/1152,
+                        (63 + 13*s)/128]
+    A[9,[0,4,5,6,7,8]] = [1/14, 1/9, (-733 - 147*s)/2205, (515 + 111*s)/504,
+                          (-51 - 11*s)/56, (132 + 28*s)/245]
+    A[10,4:10] = [(-42 + 7*s)/18, (-18 + 28*s)/45, (-273 - 53*s)/72,
+                  (301 + 53*s)/72, (28 - 28*s)/45, (49 - 7*s)/18]
+    b = np.zeros(11)
+    b[[0,7,8,9,10]] = [9/180, 49/180, 64/180, 49/180, 9/180]
+    return _tableau(A, b)
+
+cooper_verner8 = _cooper_verner8()
+
+# methods by order of accuracy, following statistics_gather.jl
+methods = {2: heun, 4: rk4, 8: cooper_verner8}
+
+def rk_step(rhs, tab, u, dt):
+    """Return `u` advanced by one step of size `dt` of the method `tab`."""
+    k = []
+    for i in range(tab.b.size):
+        y = u
+        for j in np.flatnonzero(tab.A[i,:i]):
+            y = y + (dt*tab.A[i,j])*k[j]
+        k.append(rhs(y))
+    for j in np.flatnonzero(tab.b):
+        u = u + (dt*tab.b[j])*k[j]
+    return u
+
+def integrate_ensemble(rhs, tab, u0, dt, num_steps, averager=None,
+                       chunk_steps=1000):
+    """
+    March the ensemble `u0` (an (M, 3) array, one member per row) through
+    `num_steps` steps of size `dt` with the method `tab`.
+
+    Returns the (M, 3) states at the final time.  If `averager` (a
+    `gregory.WindowAverager`) is given, the z values of every member at every
+    step, including the initial one, are passed to it in chunks of
+    `chunk_steps` steps.  Members that become unstable turn into NaNs (and so
+    do their averages); the other members are unaffected.
+    """
+    u = np.array(u0, dtype=float).T.copy() # components along the first axis
+    buf = None
+    if averager is not None:
+        buf = np.zeros((chunk_steps,) + u.shape[1:])
+        buf[0] = u[2]
+        fill = 1
+    with np.errstate(over="ignore", invalid="ignore"):
+        for step in range(num_steps):
+            u = rk_step(rhs, tab, u, dt)
+            if buf is not None:
+                buf[fill] = u[2]
+                fill += 1
+                if fill == chunk_steps:
+                    averager.update(buf)
+                    fill = 0
+    if buf is not None and fill > 0:
+        averager.update(buf[:fill])
+    return u.T
+
+def spread_initial_conditions(system, num_members, dt, spinup_steps,
+                              scale=1e-3, seed=None):
+    """
+    Return `num_members` initial conditions on the attractor of `system`.
+
+    The members start from random perturbations of size `scale` about
+    `initial_conditions[system]` and are then marched `spinup_steps` steps
+    with RK4, long enough for chaos to make them independent.
+    """
+    rng = np.random.default_rng(seed)
+    u0 = initial_conditions[system] + scale*rng.standard_normal(
+        (num_members, 3))
+    return integrate_ensemble(systems[system], rk4, u0, dt, spinup_steps)
+
+def run_ensemble(system, order, u0, dt, num_steps, window_steps,
+                 chunk_steps=1000):
+    """
+    March the ensemble `u0` of `system` ("lorenz" or "chen") with the method
+    of order `order` while accumulating the z averages of every member over
+    windows of `window_steps` steps, using a Gregory rule of the same order.
+
+    Returns `(averager, u, cputime)`: the `WindowAverager` (whose averages
+    have one column per member), the final states, and the elapsed time in
+    seconds.
+    """
+    averager = WindowAverager(window_steps, order)
+    start = timer.perf_counter()
+    u = integrate_ensemble(systems[system], methods[order], u0, dt, num_steps,
+                           averager=averager, chunk_steps=chunk_steps)
+    return averager, u, timer.perf_counter() - start
+
+# embedded pairs for adaptive stepping, by name as in scipy.integrate
+adaptive_methods = {"RK45": scipy.integrate.RK45,
+                    "DOP853": scipy.integrate.DOP853}
+
+def fixed_step_cost(order, num_steps):
+    """Return the number of right-hand-side evaluations taken by
+    `integrate_ensemble` per member for the method of order `order`."""
+    return methods[order].b.size*num_steps
+
+def integrate_adaptive(system, u0, dt, num_steps, method="DOP853", rtol=1e-8,
+                       atol=1e-8, averager=None, chunk_steps=1000):
+    """
+    March the single initial condition `u0` of `system` from t=0 to
+    `num_steps*dt` with the adaptive embedded pair `method` (a key of
+    `adaptive_methods`).
+
+    The steps are chosen by the error control with tolerances `rtol` and
+    `atol`, while the solution is sampled with the dense output of each step
+    at the uniform times 0, dt, ..., num_steps*dt.  The z samples are passed
+    to `averager`, if given, in chunks of `chunk_steps`.  Returns `(u, nfev)`,
+    the state at the final time and the number of right-hand-side
+    evaluations.
+    """
+    rhs = systems[system]
+    Time = num_steps*dt
+    solver = adaptive_methods[method](lambda t, u: rhs(u), 0.0,
+                                      np.array(u0, dtype=float), Time,
+                                      rtol=rtol, atol=atol)
+    buf = None
+    if averager is not None:
+        buf = np.zeros(chunk_steps)
+        buf[0] = solver.y[2]
+        fill = 1
+    sample = 1 # index of the next uniform sample
+    while solver.status == "running":
+        solver.step()
+        if solver.status == "failed":
+            raise RuntimeError("{} failed: {}".format(method, solver.message))
+        if buf is None:
+            continue
+        # uniform samples inside the step just taken
+        last = num_steps if solver.status == "finished" else min(
+            int(math.floor(solver.t/dt)), num_steps)
+        if last < sample:
+            continue
+        times = np.arange(sample, last + 1)*dt
+        z = solver.dense_output()(times)[2]
+        z[times == solver.t] = solver.y[2]
+        for val in z:
+            buf[fill] = val
+            fill += 1
+            if fill == chunk_steps:
+                averager.update(buf)
+                fill = 0
+        sample = last + 1
+    if buf is not None and fill > 0:
+        averager.update(buf[:fill])
+    return solver.y, solver.nfev
+
+def run_adaptive(system, u0, dt, num_steps, window_steps, order,
+                 method="DOP853", rtol=1e-8, atol=1e-8, chunk_steps=1000):
+    """
+    Run `integrate_adaptive` while accumulating the z averages over windows
+    of `window_steps` uniform samples with a Gregory rule of order `order`.
+
+    Returns `(averager, u, nfev, cputime)`; compare `nfev` with
+    `fixed_step_cost`.
+    """
+    averager = WindowAverager(window_steps, order)
+    start = timer.perf_counter()
+    u, nfev = integrate_adaptive(system, u0, dt, num_steps, method, rtol,
+                                 atol, averager=averager,
+                                 chunk_steps=chunk_steps)
+    return averager, u, nfev, timer.perf_counter() - start
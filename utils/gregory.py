@@ -0,0 +1,235 @@
+"""module for Gregory-type quadrature and window averages of uniformly spaced data
+
+This is the Python counterpart of `lorenz/gregory.jl`.  The boundary weights
+are computed exactly, as in the Julia code, but only once for each
+(`numbnd`, `order`) pair.  `window_averages` then computes the Gregory
+average over every window of a trajectory in a single pass, using prefix
+sums for the interior (unit) weights and a correction at the `numbnd` points
+at each end of the windows.
+"""
+
+import functools
+import warnings
+from fractions import Fraction
+import numpy as np
+
+def calc_bernoulli(n):
+    """
+    Return the `n`th Bernoulli number as a `Fraction`.
+
+    Follows the convention that the `n=1` Bernoulli number is equal to -1/2.
+    """
+    A = [Fraction(0)]*(n + 1)
+    for m in range(n + 1):
+        A[m] = Fraction(1, m + 1)
+        for j in range(m, 0, -1):
+            A[j-1] = j*(A[j-1] - A[j])
+    return -A[0] if n == 1 else A[0]
+
+def solve_exact(A, b):
+    """Solve the square system `A x = b` of Fractions by Gauss-Jordan."""
+    n = len(b)
+    M = [list(row) + [rhs] for row, rhs in zip(A, b)]
+    for k in range(n):
+        piv = next(i for i in range(k, n) if M[i][k] != 0)
+        M[k], M[piv] = M[piv], M[k]
+        for i in range(n):
+            if i != k and M[i][k] != 0:
+                fac = M[i][k]/M[k][k]
+                M[i] = [a - fac*c for a, c in zip(M[i], M[k])]
+    return [M[k][n]/M[k][k] for k in range(n)]
+
+@functools.lru_cache(maxsize=None)
+def exact_boundary_weights(numbnd, order):
+    """
+    Return the boundary weights of a Gregory rule as a tuple of Fractions.
+
+    The rule has order `order` and uses `numbnd` boundary points at each end,
+    where `numbnd >= order-1`.  When `numbnd > order-1` the moment conditions
+    do not fix the weights, and the minimum-norm weights are returned.
+    """
+    if numbnd < order - 1:
+        raise ValueError("number of boundary nodes must be at least order-1")
+    A = [[Fraction(j*(numbnd - i)**(j-1)) for i in range(numbnd)]
+         for j in range(1, order)]
+    b = [numbnd**j - (-1)**j*calc_bernoulli(j) for j in range(1, order)]
+    if numbnd == order - 1:
+        return tuple(solve_exact(A, b))
+    # minimum-norm solution A^T (A A^T)^{-1} b; the unconstrained weights
+    # (order 1) are all zero, since there are no moment conditions
+    AAt = [[sum(a*c for a, c in zip(ra, rc)) for rc in A] for ra in A]
+    y = solve_exact(AAt, b) if b else []
+    return tuple(sum((A[j][i]*y[j] for j in range(len(y))), Fraction(0))
+                 for i in range(numbnd))
+
+@functools.lru_cache(maxsize=None)
+def boundary_weights(numbnd, order):
+    """
+    Return the boundary weights of a Gregory rule as a float64 array.
+
+    See `exact_boundary_weights`; the returned array is cached and read-only.
+    """
+    w = np.array([float(v) for v in exact_boundary_weights(numbnd, order)])
+    w.setflags(write=False)
+    return w
+
+def adjust_order(num_steps, numbnd, order):
+    """
+    Return `(numbnd, order)` reduced, if needed, to fit `num_steps` steps.
+
+    Follows `calcZAverage` in `statistics_gather.jl`: if the window is too
+    short for `numbnd` boundary points at each end, the largest rule that
+    fits is used instead and a warning is issued.
+    """
+    if 2*numbnd > num_steps:
+        numbnd = max(num_steps//2, 1)
+        order = numbnd + 1
+        warnings.warn("had to adopt order {} quadrature".format(order))
+    return numbnd, order
+
+def integrate(data, numbnd, order, h=1.0):
+    """
+    Integrate uniformly spaced `data` using a Gregory quadrature rule of order
+    `order` with `numbnd` boundary points.  The mesh spacing is defined by `h`.
+    """
+    data = np.asarray(data)
+    if data.shape[0] < 2*numbnd:
+        raise ValueError("number of data points must be at least 2*numbnd")
+    w = boundary_weights(numbnd, order)
+    integral = np.sum(data[numbnd:data.shape[0]-numbnd], axis=0)
+    for i in range(numbnd):
+        integral = integral + w[i]*(data[i] + data[-i-1])
+    return integral*h
+
+def window_averages(data, num_steps, order, numbnd=None, stride=None):
+    """
+    Return the Gregory averages of `data` over windows of `num_steps` steps.
+
+    `data` holds uniformly spaced samples along its first axis (any trailing
+    axes are averaged independently).  Window `k` covers the samples
+    `k*stride` through `k*stride + num_steps`, so with the default `stride`
+    of `num_steps` the windows are non-overlapping and share end points, as
+    in `statistics_gather.jl`, while `stride=1` gives sliding windows.  The
+    rule has order `order` and `numbnd` (default `order-1`) boundary points,
+    reduced as in `adjust_order` for short windows.  The cost is O(N) for N
+    samples, independent of the window length.
+    """
+    data = np.asarray(data, dtype=float)
+    num_steps = int(num_steps)
+    if num_steps <= 0:
+        raise ValueError("num_steps must be positive!")
+    if stride is None:
+        stride = num_steps
+    if numbnd is None:
+        numbnd = order - 1
+    numbnd, order = adjust_order(num_steps, numbnd, order)
+    w = boundary_weights(numbnd, order)
+    starts = np.arange(0, data.shape[0] - num_steps, stride)
+    if starts.size == 0:
+        return np.zeros((0,) + data.shape[1:])
+    # work with centered data so the prefix sums do not lose precision; the
+    # rule integrates constants exactly, so the shift is simply added back
+    shift = np.mean(data, axis=0)
+    centered = data - shift
+    psum = np.zeros((data.shape[0] + 1,) + data.shape[1:])
+    np.cumsum(centered, axis=0, out=psum[1:])
+    total = psum[starts + num_steps + 1] - psum[starts]
+    for i in range(numbnd):
+        total += (w[i] - 1)*(centered[starts + i]
+                             + centered[starts + num_steps - i])
+    return shift + total/num_steps
+
+def tau_steps(tau, dt):
+    """Return the number of steps of size `dt` in the period `tau`."""
+    steps = int(round(tau/dt))
+    if steps <= 0 or abs(steps*dt - tau) > 1e-8*tau:
+        raise ValueError("tau = {} is not a multiple of dt = {}".format(tau,
+                                                                        dt))
+    return steps
+
+def window_averages_for_taus(data, dt, taus, order, stride=None):
+    """
+    Return a dictionary mapping each period in `taus` to the window averages
+    of `data` (sampled with spacing `dt`) over windows of that length.
+
+    Any periods that are multiples of `dt` may be used; `stride` is passed on
+    to `window_averages` (in steps) and defaults to non-overlapping windows.
+    """
+    return {tau: window_averages(data, tau_steps(tau, dt), order,
+                                 stride=stride) for tau in taus}
+
+class WindowAverager:
+    """
+    Accumulate Gregory window averages of a stream of uniformly spaced samples.
+
+    This is the streaming counterpart of `window_averages` for non-overlapping
+    windows: samples are passed to `update` in chunks of any size, and the
+    average over each window of `num_steps` steps is folded in as the samples
+    arrive, so only one open window per window length is kept in memory.
+    `window_steps` lists the window lengths (in steps) to accumulate, and the
+    samples may have trailing axes (e.g. one entry per integrand), which are
+    averaged independently.
+    """
+    def __init__(self, window_steps, order, numbnd=None):
+        self.order = order
+        self.window_steps = tuple(int(n) for n in window_steps)
+        self.count = 0
+        self._rules = {}
+        self._open = {}
+        self._done = {}
+        for n in self.window_steps:
+            if n <= 0:
+                raise ValueError("window lengths must be positive!")
+            nb, o = adjust_order(n, order - 1 if numbnd is None else numbnd,
+                                 order)
+            self._rules[n] = boundary_weights(nb, o)
+            self._done[n] = []
+
+    def _weights(self, n, pos):
+        """Return the weight of position `pos` (< `n`) within its window."""
+        w = self._rules[n]
+        wt = np.ones(pos.shape)
+        head = pos < w.size
+        wt[head] = w[pos[head]]
+        tail = n - pos < w.size
+        wt[tail] = w[n - pos[tail]]
+        return wt
+
+    def update(self, values):
+        """Fold the samples `values` (new samples along the first axis) in."""
+        values = np.asarray(values, dtype=float)
+        num = values.shape[0]
+        if num == 0:
+            return
+        g = self.count + np.arange(num)
+        expand = (slice(None),) + (None,)*(values.ndim - 1)
+        for n in self.window_steps:
+            pos = g % n
+            win = g//n
+            # sum the weighted samples of each window touched by this chunk
+            weighted = self._weights(n, pos)[expand]*values
+            cuts = np.flatnonzero(pos == 0)
+            if cuts.size == 0 or cuts[0] != 0:
+                cuts = np.concatenate(([0], cuts))
+            ids = win[cuts]
+            sums = np.add.reduceat(weighted, cuts, axis=0)
+            done = []
+            prev = self._open.pop(n, None)
+            if prev is not None and prev[0] == ids[0]:
+                sums[0] += prev[1]
+            elif prev is not None:
+                # the open window ends at the first sample of this chunk
+                done.append((prev[1] + self._rules[n][0]*values[0])[None])
+            # the sample that starts a window also ends the previous one
+            if ids.size > 1:
+                done.append(sums[:-1] + self._rules[n][0]*values[cuts[1:]])
+            self._open[n] = (ids[-1], sums[-1])
+            self._done[n].extend(d/n for d in done)
+        self.count += num
+
+    def averages(self, num_steps):
+        """Return the averages over all completed windows of `num_steps`."""
+        done = self._done[int(num_steps)]
+        if not done:
+            return np.zeros(0)
+        return np.concatenate(done)
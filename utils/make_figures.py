@@ -0,0 +1,343 @@
+"""module for rendering every statistics and verification figure in one pass
+
+Each plot script in `kuramoto-sivashinsky` and `lorenz` draws one figure
+variant, selected by module-level settings such as `time_idx` or `dt_idx`.
+The scripts now expose the drawing as a function returning the figure, and
+this module renders every variant of every script: each integration period
+for the error-versus-mesh plots, each mesh or step size for the
+error-versus-tau plots, and each time step for the KS verification plot.
+
+Every data file is loaded once, in the parent process, which leaves its
+summary table (see `summary_stats.py`) in memory; the figures are then
+drawn on a pool of forked worker processes with the Agg backend, so the
+workers share the loaded data instead of reading the files again.  Variants whose
+data files do not exist are skipped.
+
+Rebuilds are incremental.  A manifest in the output directory
+(`figures_manifest.json`) records, for every figure, a SHA-256 digest of
+its inputs: the contents of its data files, its parameters, and the source
+of its plot script and of the repository modules the script imports,
+directly or through the loaders (found from the imported modules
+themselves).  A figure is only redrawn when this digest changes or its png
+is missing, so when one order's statistics file changes only the figures
+reading that file are redrawn, and editing a module only redraws the
+figures whose scripts use it.
+File contents are only hashed again when their size or modification time
+changes.
+
+Usage from the command line:
+
+    python make_figures.py --out-dir ../figures --workers 8
+"""
+
+import matplotlib
+matplotlib.use("Agg")
+
+import argparse
+import collections
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import time as timer
+import types
+
+_root = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     ".."))
+ks_dir = os.path.join(_root, "kuramoto-sivashinsky")
+lorenz_dir = os.path.join(_root, "lorenz")
+sys.path.extend([ks_dir, lorenz_dir])
+
+import matplotlib.pyplot as plt
+from shard_store import manifest_name as shard_manifest_name
+from sketches import is_sketch_file
+
+Figure = collections.namedtuple("Figure", ["name", "module", "function",
+                                           "kwargs", "data_files"])
+Figure.__doc__ = """One figure variant: the png `name`, the key of the plot
+`module` in `plot_modules` and the `function` in it that draws the figure,
+the keyword arguments `kwargs` passed to it, and the `data_files` it reads."""
+
+# the plot scripts, keyed by a name that is unique across the two
+# directories (both hold a plot_statistics_error_vs_time.py)
+plot_scripts = {
+    "ks_dx": (ks_dir, "plot_statistics_error_vs_dx.py"),
+    "ks_time": (ks_dir, "plot_statistics_error_vs_time.py"),
+    "ks_cpu": (ks_dir, "plot_statistics_error_vs_cputime.py"),
+    "ks_verify": (ks_dir, "plot_ks_error_verification.py"),
+    "ks_verify_cpu": (ks_dir, "plot_ks_cputime_verification.py"),
+    "lorenz_dt": (lorenz_dir, "plot_statistics_error_vs_dt.py"),
+    "lorenz_time": (lorenz_dir, "plot_statistics_error_vs_time.py")}
+
+
+manifest_name = "figures_manifest.json"
+dpi = 300
+
+plot_modules = {}
+
+def import_plot_modules():
+    """Import every script in `plot_scripts` into `plot_modules`."""
+    for key, (directory, script) in plot_scripts.items():
+        if key in plot_modules:
+            continue
+        spec = importlib.util.spec_from_file_location(
+            "plot_" + key, os.path.join(directory, script))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        plot_modules[key] = module
+    return plot_modules
+
+def figure_variants(ks_data_dir=ks_dir, lorenz_data_dir=lorenz_dir):
+    """
+    Return the list of `Figure` variants drawn from the data files in
+    `ks_data_dir` and `lorenz_data_dir`, the slowest to draw first.
+    """
+    mods = import_plot_modules()
+    ks_files = [os.path.join(ks_data_dir, f)
+                for f in mods["ks_dx"].data_files]
+    lorenz_files = [os.path.join(lorenz_data_dir, f)
+                    for f in mods["lorenz_dt"].data_files]
+    verify_file = os.path.join(ks_data_dir,
+                               os.path.basename(mods["ks_verify"].data_file))
+    figs = [Figure("ks_error_vs_cpu.png", "ks_cpu", "plot_error_vs_cputime",
+                   dict(data_files=ks_files), ks_files)]
+    for idx in range(mods["ks_dx"].num_times):
+        figs.append(Figure("ks_error_vs_dx_tau{}.png".format(idx), "ks_dx",
+                           "plot_error_vs_dx",
+                           dict(time_idx=idx, data_files=ks_files), ks_files))
+    for idx in range(mods["ks_time"].num_meshes):
+        figs.append(Figure("ks_error_vs_time_dx{}.png".format(idx),
+                           "ks_time", "plot_error_vs_time",
+                           dict(dx_idx=idx, data_files=ks_files), ks_files))
+    for idx in range(mods["lorenz_dt"].num_times):
+        figs.append(Figure("lorenz_error_vs_dt_tau{}.png".format(idx),
+                           "lorenz_dt", "plot_error_vs_dt",
+                           dict(time_idx=idx, verbose=False,
+                                data_files=lorenz_files), lorenz_files))
+    for idx in range(mods["lorenz_time"].num_step_sizes):
+        # the second-order boxes are left out on the coarsest step, so the
+        # three-entry legend only fits the other step sizes
+        figs.append(Figure("lorenz_error_vs_time_dt{}.png".format(idx),
+                           "lorenz_time", "plot_error_vs_time",
+                           dict(dt_idx=idx,
+                                legend=mods["lorenz_time"].legend and idx > 0,
+                                data_files=lorenz_files), lorenz_files))
+    for idx in range(mods["ks_verify"].num_steps):
+        figs.append(Figure("ks_verification_dt{}.png".format(idx),
+                           "ks_verify", "plot_error_verification",
+                           dict(dt_idx=idx, verbose=False,
+                                data_file=verify_file), [verify_file]))
+    figs.append(Figure("ks_cputime_verification.png", "ks_verify_cpu",
+                       "plot_cputime_verification",
+                       dict(verbose=False, data_file=verify_file),
+                       [verify_file]))
+    return figs
+
+def preload(figs):
+    """
+    Load every data file read by `figs` once, so that forked workers
+    inherit the parsed data.  Returns the set of files that were loaded.
+    """
+    import load_stats
+    import load_lorenz_stats
+    mods = plot_modules
+    loaded = set()
+    for fig in figs:
+        for file_name in fig.data_files:
+            if file_name in loaded or not os.path.exists(file_name):
+                continue
+            if fig.module.startswith("ks_verify"):
+                for name in load_stats.verify_quantities:
+                    load_stats.load_verify_block(
+                        file_name, name, len(mods["ks_verify"].order),
+                        mods["ks_verify"].num_meshes,
+                        mods["ks_verify"].num_steps)
+            elif fig.module.startswith("ks"):
+                # the cpu-time plot bootstraps the samples themselves
+                if not is_sketch_file(file_name):
+                    load_stats.load_cube(
+                        file_name, mods["ks_dx"].num_meshes,
+                        mods["ks_dx"].num_times)
+                load_stats.load_summary_table(file_name,
+                                              mods["ks_dx"].num_meshes,
+                                              mods["ks_dx"].num_times)
+            else:
+                load_lorenz_stats.load_summary_table(
+                    file_name, mods["lorenz_dt"].num_step_sizes,
+                    mods["lorenz_dt"].num_times)
+            loaded.add(file_name)
+    return loaded
+
+def read_build_manifest(out_dir):
+    """
+    Return the manifest of `out_dir`: a dict with the digest of each figure
+    ("figures") and the size, modification time and digest of each input
+    file ("files").  Returns an empty manifest if there is none.
+    """
+    try:
+        with open(os.path.join(out_dir, manifest_name)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    manifest.setdefault("figures", {})
+    manifest.setdefault("files", {})
+    return manifest
+
+def write_build_manifest(out_dir, manifest):
+    """Write `manifest` to `out_dir`, replacing the previous one atomically."""
+    file_name = os.path.join(out_dir, manifest_name)
+    with open(file_name + ".part", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(file_name + ".part", file_name)
+
+def file_digest(file_name, known):
+    """
+    Return the SHA-256 digest of the contents of `file_name` (of the
+    manifest of a shard directory).  `known` maps file names to their last
+    `[size, mtime_ns, digest]`; the digest is reused when the size and
+    modification time still match, and `known` is updated otherwise.
+    """
+    if os.path.isdir(file_name):
+        file_name = os.path.join(file_name, shard_manifest_name)
+    st = os.stat(file_name)
+    stamp = [st.st_size, st.st_mtime_ns]
+    if known.get(file_name, [None])[:2] == stamp:
+        return known[file_name][2]
+    sha = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    known[file_name] = stamp + [sha.hexdigest()]
+    return known[file_name][2]
+
+def _is_repo_file(path):
+    return path.endswith(".py") and path.startswith(_root + os.sep)
+
+def module_files(module):
+    """
+    Return the source files of `module` and of every module of this
+    repository that it uses, in sorted order.  The modules used are found
+    by following the modules, functions and classes in the namespace of
+    each module (`import x` and `from x import f` alike), recursively.
+    """
+    seen, files, stack = set(), set(), [module]
+    while stack:
+        mod = stack.pop()
+        path = getattr(mod, "__file__", None)
+        if path is None or id(mod) in seen:
+            continue
+        seen.add(id(mod))
+        path = os.path.abspath(path)
+        if not _is_repo_file(path):
+            continue
+        files.add(path)
+        for value in list(vars(mod).values()):
+            if isinstance(value, types.ModuleType):
+                stack.append(value)
+                continue
+            name = getattr(value, "__module__", None)
+            if isinstance(name, str) and name in sys.modules:
+                stack.append(sys.modules[name])
+    return sorted(files)
+
+# the source files of each plot module, see `code_files`
+_code_files = {}
+
+def code_files(fig):
+    """
+    Return the source files whose code draws the variant `fig`: its plot
+    script and the repository modules that the script imports, directly or
+    through other modules.
+    """
+    if fig.module not in _code_files:
+        _code_files[fig.module] = module_files(
+            import_plot_modules()[fig.module])
+    return _code_files[fig.module]
+
+def figure_digest(fig, known):
+    """
+    Return the digest of the inputs of the variant `fig`: its name, drawing
+    function, parameters, data files and code, the matplotlib version and
+    the resolution.  `known` is the file table passed to `file_digest`.
+    """
+    sha = hashlib.sha256()
+    params = [fig.name, fig.function, sorted(fig.kwargs.items()),
+              matplotlib.__version__, dpi]
+    sha.update(repr(params).encode())
+    for file_name in list(fig.data_files) + code_files(fig):
+        sha.update(file_digest(file_name, known).encode())
+    return sha.hexdigest()
+
+def render(fig, out_dir):
+    """Draw the variant `fig` and save it in `out_dir`; returns its path."""
+    module = plot_modules[fig.module]
+    handle = getattr(module, fig.function)(**fig.kwargs)
+    path = os.path.join(out_dir, fig.name)
+    handle.savefig(path, facecolor=handle.get_facecolor(), dpi=dpi,
+                   edgecolor="none")
+    plt.close(handle)
+    return fig.name, path
+
+def _render_task(args):
+    return render(*args)
+
+def make_figures(out_dir, workers=os.cpu_count(), ks_data_dir=ks_dir,
+                 lorenz_data_dir=lorenz_dir, force=False, log=print):
+    """
+    Render the figure variants whose inputs changed since the last run (all
+    of them if `force` is set) into `out_dir` on `workers` processes, and
+    return the paths written.  Variants with missing data files are skipped.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = read_build_manifest(out_dir)
+    todo = []
+    for fig in figure_variants(ks_data_dir, lorenz_data_dir):
+        missing = [f for f in fig.data_files if not os.path.exists(f)]
+        if missing:
+            log("skipping {}: missing {}".format(fig.name,
+                                                 ", ".join(missing)))
+            continue
+        digest = figure_digest(fig, manifest["files"])
+        if not force and manifest["figures"].get(fig.name) == digest and \
+                os.path.exists(os.path.join(out_dir, fig.name)):
+            continue
+        todo.append((fig, digest))
+    # only the data of the figures to redraw is loaded
+    preload([fig for fig, digest in todo])
+    digests = dict((fig.name, digest) for fig, digest in todo)
+    tasks = [(fig, out_dir) for fig, digest in todo]
+    pool = None
+    if workers > 1 and len(tasks) > 1:
+        # fork, so the workers inherit the imported modules and loaded data
+        pool = multiprocessing.get_context("fork").Pool(workers)
+    paths = []
+    try:
+        results = map(_render_task, tasks) if pool is None else \
+            pool.imap_unordered(_render_task, tasks)
+        for name, path in results:
+            manifest["figures"][name] = digests[name]
+            paths.append(path)
+    finally:
+        if pool is not None:
+            pool.terminate()
+        # figures drawn before a failure are not drawn again
+        write_build_manifest(out_dir, manifest)
+    return paths
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="render every statistics and verification figure")
+    parser.add_argument("--out-dir", default=os.path.join(_root, "figures"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--ks-data-dir", default=ks_dir)
+    parser.add_argument("--lorenz-data-dir", default=lorenz_dir)
+    parser.add_argument("--force", action="store_true",
+                        help="redraw every figure, even if it is up to date")
+    args = parser.parse_args()
+    start = timer.time()
+    paths = make_figures(args.out_dir, args.workers, args.ks_data_dir,
+                         args.lorenz_data_dir, args.force)
+    print("wrote {} figures to {} in {:.1f} s".format(
+        len(paths), args.out_dir, timer.time() - start))
@@ -0,0 +1,105 @@
+"""module for batched composite Newton-Cotes quadrature
+
+Python counterpart of the rules in `NewtonCotes/`.  The weights of the
+closed Newton-Cotes rules are generated exactly (rather than typed in, as in
+`NewtonCotes4pt.m` through `NewtonCotes14pt.m`) and cached, the highest-order
+rule that fits a window is selected automatically, and the composite rule is
+applied to a whole batch of windows as a single matrix-vector product.
+"""
+
+import functools
+from fractions import Fraction
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from gregory import solve_exact
+
+# the rules available in the NewtonCotes directory, by number of points
+available_rules = (14, 13, 12, 11, 10, 9, 8, 7, 6, 4)
+
+@functools.lru_cache(maxsize=None)
+def exact_weights(num_rule_pts):
+    """
+    Return the weights of the closed `num_rule_pts`-point Newton-Cotes rule.
+
+    The weights are Fractions for unit spacing, so they sum to
+    `num_rule_pts-1`; for example, `exact_weights(4)` is `(3/8, 9/8, 9/8,
+    3/8)`.  They follow from requiring that the rule integrate 1, x, ...,
+    x^(num_rule_pts-1) exactly.
+    """
+    if num_rule_pts < 2:
+        raise ValueError("a Newton-Cotes rule needs at least 2 points")
+    n = num_rule_pts - 1
+    A = [[Fraction(j**k) for j in range(n + 1)] for k in range(n + 1)]
+    b = [Fraction(n**(k + 1), k + 1) for k in range(n + 1)]
+    return tuple(solve_exact(A, b))
+
+def select_rule(num_pts, rules=available_rules):
+    """
+    Return the number of points of the highest-order rule in `rules` whose
+    composite version fits a window of `num_pts` points, i.e. for which
+    `num_pts-1` is a multiple of the number of rule intervals.
+    """
+    fits = [m for m in rules if m >= 2 and (num_pts - 1) % (m - 1) == 0]
+    if num_pts < 2 or not fits:
+        raise ValueError("no Newton-Cotes rule fits {} points".format(num_pts))
+    return max(fits)
+
+@functools.lru_cache(maxsize=None)
+def composite_weights(num_pts, num_rule_pts=None):
+    """
+    Return the weights of the composite Newton-Cotes rule for `num_pts`
+    points as a read-only float64 array (for unit spacing).
+
+    The `num_rule_pts`-point rule is repeated over the window, adjacent
+    panels sharing their end points; by default the rule is chosen by
+    `select_rule`.
+    """
+    if num_rule_pts is None:
+        num_rule_pts = select_rule(num_pts)
+    elif (num_pts - 1) % (num_rule_pts - 1) != 0:
+        raise ValueError("{}-point rule does not fit {} points".format(
+            num_rule_pts, num_pts))
+    rule = np.array([float(v) for v in exact_weights(num_rule_pts)])
+    w = np.zeros(num_pts)
+    for i in range(0, num_pts - 1, num_rule_pts - 1):
+        w[i:i+num_rule_pts] += rule
+    w.setflags(write=False)
+    return w
+
+def integrate(f, h, num_rule_pts=None):
+    """
+    Integrate the samples `f` with spacing `h` along their last axis.
+
+    `f` may be a single vector, like the MATLAB `NewtonCotesXpt(f, h)`
+    functions, or a batch of vectors stacked along the leading axes.
+    """
+    f = np.asarray(f, dtype=float)
+    return (f @ composite_weights(f.shape[-1], num_rule_pts))*h
+
+def window_integrals(f, h, num_pts, stride=None, num_rule_pts=None):
+    """
+    Integrate the samples `f` (spacing `h`) over every window of `num_pts`
+    points along the last axis.
+
+    Window `k` starts at sample `k*stride`; the default `stride` of
+    `num_pts-1` gives adjacent windows that share end points, like the
+    `for i = 1:100:29901` loops in `method_comparisons_*.m`.  Any leading
+    axes of `f` (e.g. one row per method) are kept, and the result has the
+    windows along the last axis.  All windows are evaluated with one matrix
+    product over a strided view of `f`, without copying the samples.
+    """
+    f = np.asarray(f, dtype=float)
+    if stride is None:
+        stride = num_pts - 1
+    if f.shape[-1] < num_pts:
+        return np.zeros(f.shape[:-1] + (0,))
+    windows = sliding_window_view(f, num_pts, axis=-1)[..., ::stride, :]
+    return (windows @ composite_weights(num_pts, num_rule_pts))*h
+
+def window_averages(f, h, num_pts, stride=None, num_rule_pts=None):
+    """
+    Return the time averages of `f` over windows of `num_pts` points; see
+    `window_integrals` for the arguments.
+    """
+    return window_integrals(f, h, num_pts, stride, num_rule_pts)/(
+        (num_pts - 1)*h)
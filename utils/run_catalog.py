@@ -0,0 +1,396 @@
+"""module for an indexed SQLite catalog of the statistics and verification data
+
+The raw statistics files (and shard directories, see `shard_store.py`) and
+the KS verification files only make sense together with parameters that the
+plot scripts repeat by hand: the number of meshes, the periods `tau`, the
+orders.  This module ingests them into a single SQLite database, one row per
+sample and quantity of interest, with every parameter spelled out, so that
+any slice can be selected with an indexed query:
+
+    samples(source_id, system, ord, h, mesh_idx, tau, tau_idx, sample,
+            qoi, value, cputime)
+    verification(source_id, system, ord, dx, dt, num_nodes, num_steps,
+                 qoi, value, cputime)
+
+`ord` is the order of accuracy and `h` the mesh size (dx for KS, dt for
+Lorenz).  The parameters come from the file header when there is one, and
+otherwise from the file name and the layouts in `legacy_layouts`.
+Ingestion is incremental: each source is recorded with its size and
+modification time, and is only re-read (its rows replaced) when these
+change.
+
+Usage from the command line (`--check` reports the cells that do not hold
+the `num_samples*rows` samples of a finished campaign of `campaign.py`):
+
+    python run_catalog.py catalog.db ../kuramoto-sivashinsky ../lorenz --check
+"""
+
+import itertools
+import os
+import re
+import sqlite3
+import sys
+import time as timer
+import numpy as np
+from data_header import read_header, legacy_blocks, load_block
+from shard_store import _layout, is_shard_dir, manifest_name, read_manifest
+from stats_cube import load_stats_cube
+
+_schema = """
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    system TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ingested REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS samples (
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    system TEXT NOT NULL,
+    ord INTEGER NOT NULL,
+    h REAL NOT NULL,
+    mesh_idx INTEGER NOT NULL,
+    tau REAL NOT NULL,
+    tau_idx INTEGER NOT NULL,
+    sample INTEGER NOT NULL,
+    qoi TEXT NOT NULL,
+    value REAL,
+    cputime REAL
+);
+CREATE INDEX IF NOT EXISTS samples_params
+    ON samples(system, qoi, ord, tau, h);
+CREATE INDEX IF NOT EXISTS samples_source ON samples(source_id);
+CREATE TABLE IF NOT EXISTS verification (
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    system TEXT NOT NULL,
+    ord INTEGER NOT NULL,
+    dx REAL NOT NULL,
+    dt REAL NOT NULL,
+    num_nodes INTEGER,
+    num_steps INTEGER,
+    qoi TEXT NOT NULL,
+    value REAL,
+    cputime REAL
+);
+CREATE INDEX IF NOT EXISTS verification_params
+    ON verification(system, qoi, ord, dx, dt);
+CREATE INDEX IF NOT EXISTS verification_source ON verification(source_id);
+"""
+
+# the layout of each kind of file: the quantity blocks (the first holds the
+# mesh size), the quantities of interest, and the defaults for files without
+# a header, which are those of the gather scripts and plot scripts
+legacy_layouts = {
+    "ks": dict(quantities=("dx", "u_avg", "u2_avg", "cputime"),
+               qoi=("u_avg", "u2_avg"), tau=(40.0, 400.0, 4000.0)),
+    "lorenz": dict(quantities=("dt", "z_avg", "cputime"), qoi=("z_avg",),
+                   tau=(1.0, 10.0, 100.0)),
+    "verify_ks": dict(quantities=("dx", "dt", "err_avg", "err_sqavg",
+                                  "cputime"),
+                      qoi=("err_avg", "err_sqavg"), order=(2, 4, 6),
+                      num_nodes=tuple(range(63, 512, 64)),
+                      num_steps=(250, 500, 1000))}
+
+# the merged file of each order, as named by `campaign.py`
+merged_template = "raw_statistics_{}_order{}.dat"
+
+_name_pattern = re.compile(r"statistics_(ks|lorenz)_order(\d+)")
+
+def connect(file_name):
+    """Open (creating if needed) the catalog `file_name`."""
+    con = sqlite3.connect(file_name)
+    con.executescript(_schema)
+    return con
+
+def _stamp(path):
+    if os.path.isdir(path):
+        path = os.path.join(path, manifest_name)
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+def classify(path):
+    """
+    Return `(kind, system, meta)` for the data file or shard directory
+    `path`, or None if it is not one the catalog knows.  `kind` is "stats"
+    or "verify", and `meta` holds the order and periods (for "stats").
+    """
+    if is_shard_dir(path):
+        meta = read_manifest(path)[0]
+        system = meta["name"]
+        if system not in ("ks", "lorenz"):
+            return None
+        return "stats", system, dict(order=int(meta["order"]),
+                                     tau=np.atleast_1d(meta["tau"]))
+    if not os.path.isfile(path) or not path.endswith(".dat"):
+        return None
+    header = read_header(path)
+    names = header.names() if header is not None else ()
+    name = os.path.basename(path)
+    if names[:3] == legacy_layouts["verify_ks"]["quantities"][:3] or (
+            header is None and name.startswith("verify_accuracy_ks")):
+        return "verify", "ks", header.meta if header is not None else {}
+    match = _name_pattern.search(name)
+    for system in ("ks", "lorenz"):
+        layout = legacy_layouts[system]
+        if names[:len(layout["quantities"])] == layout["quantities"] or (
+                header is None and match and match.group(1) == system):
+            meta = header.meta if header is not None else {}
+            if "order" in meta:
+                order = int(meta["order"])
+            elif match:
+                order = int(match.group(2))
+            else:
+                return None
+            tau = np.atleast_1d(meta.get("tau", layout["tau"]))
+            return "stats", system, dict(order=order, tau=tau)
+    return None
+
+def _stats_rows(path, system, meta, source):
+    """
+    Return an iterator over the `samples` rows, for the source id `source`,
+    of a statistics file or shard directory.  The columns are built with
+    NumPy and zipped, so there is no Python loop per sample.
+    """
+    layout = legacy_layouts[system]
+    tau = meta["tau"]
+    num_times = tau.size
+    if is_shard_dir(path):
+        num_meshes = len(np.atleast_1d(read_manifest(path)[0]["values"]))
+    else:
+        header = read_header(path)
+        if header is not None:
+            num_meshes = header.blocks[layout["quantities"][0]].shape[1]
+        else:
+            with open(path) as f:
+                rows = sum(1 for line in f if line.strip())
+            num_meshes = rows//(len(layout["quantities"])*num_times)
+    cube = load_stats_cube(path, layout["quantities"], num_meshes, num_times)
+    h = cube.mesh_values()
+    cputime = cube["cputime"]
+    t_idx, m_idx, s_idx = np.meshgrid(np.arange(num_times),
+                                      np.arange(num_meshes),
+                                      np.arange(cube.num_samples),
+                                      indexing="ij")
+    t_idx, m_idx, s_idx = t_idx.ravel(), m_idx.ravel(), s_idx.ravel()
+    # columns shared by every quantity of interest, as Python scalars
+    cols = [np.asarray(h, dtype=float)[m_idx].tolist(), m_idx.tolist(),
+            np.asarray(tau, dtype=float)[t_idx].tolist(), t_idx.tolist(),
+            s_idx.tolist()]
+    cpu = cputime.ravel().astype(float).tolist()
+    return itertools.chain.from_iterable(
+        zip(itertools.repeat(source), itertools.repeat(system),
+            itertools.repeat(int(meta["order"])), *cols,
+            itertools.repeat(qoi), cube[qoi].ravel().astype(float).tolist(),
+            cpu)
+        for qoi in layout["qoi"])
+
+def _verify_rows(path, system, meta, source):
+    """
+    Yield the `verification` rows, for the source id `source`, of a
+    verification file.
+    """
+    layout = legacy_layouts["verify_" + system]
+    orders = np.atleast_1d(meta.get("order", layout["order"]))
+    num_nodes = np.atleast_1d(meta.get("num_nodes", layout["num_nodes"]))
+    num_steps = np.atleast_1d(meta.get("num_steps", layout["num_steps"]))
+    shape = (orders.size, num_nodes.size, num_steps.size)
+    legacy = legacy_blocks(layout["quantities"], [shape]*
+                           len(layout["quantities"]))
+    block = {name: load_block(path, name, shape, legacy)
+             for name in layout["quantities"]}
+    for qoi in layout["qoi"]:
+        for (p, n, k), val in np.ndenumerate(block[qoi]):
+            yield (source, system, int(orders[p]), float(block["dx"][p,n,k]),
+                   float(block["dt"][p,n,k]), int(num_nodes[n]),
+                   int(num_steps[k]), qoi, float(val),
+                   float(block["cputime"][p,n,k]))
+
+def ingest(con, path, force=False):
+    """
+    Ingest the data file or shard directory `path` into the catalog `con`.
+
+    Nothing is read if the catalog already holds `path` with the same size
+    and modification time, unless `force` is set; otherwise the rows of any
+    earlier version are replaced.  Returns the number of rows inserted, or
+    None if the source was skipped.
+    """
+    info = classify(path)
+    if info is None:
+        return None
+    kind, system, meta = info
+    path = os.path.abspath(path)
+    size, mtime = _stamp(path)
+    row = con.execute("SELECT id, size, mtime_ns FROM sources WHERE path = ?",
+                      (path,)).fetchone()
+    if row is not None and row[1:] == (size, mtime) and not force:
+        return None
+    with con:
+        if row is not None:
+            con.execute("DELETE FROM samples WHERE source_id = ?", row[:1])
+            con.execute("DELETE FROM verification WHERE source_id = ?",
+                        row[:1])
+            con.execute("DELETE FROM sources WHERE id = ?", row[:1])
+        source = con.execute(
+            "INSERT INTO sources (path, kind, system, size, mtime_ns, "
+            "ingested) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, kind, system, size, mtime, timer.time())).lastrowid
+        if kind == "stats":
+            cur = con.executemany(
+                "INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _stats_rows(path, system, meta, source))
+        else:
+            cur = con.executemany(
+                "INSERT INTO verification VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _verify_rows(path, system, meta, source))
+    return cur.rowcount
+
+def forget(con, path):
+    """Remove the source `path` and its rows from the catalog `con`."""
+    row = con.execute("SELECT id FROM sources WHERE path = ?",
+                      (os.path.abspath(path),)).fetchone()
+    if row is None:
+        return False
+    with con:
+        con.execute("DELETE FROM samples WHERE source_id = ?", row)
+        con.execute("DELETE FROM verification WHERE source_id = ?", row)
+        con.execute("DELETE FROM sources WHERE id = ?", row)
+    return True
+
+def merged_output(shard_dir):
+    """
+    Return the merged statistics file of the shard directory `shard_dir`,
+    or None if there is none.
+
+    `campaign.py` merges `<dir>/shards/order<p>` into
+    `<dir>/raw_statistics_<system>_order<p>.dat` by default.  That file
+    only counts as the merge of `shard_dir` if its header describes the
+    same campaign as the manifest: the same order and periods, blocks of
+    one column per mesh or step size and per row of every sample, and the
+    same mesh values when the manifest records them (`value_key`).
+    """
+    meta = read_manifest(shard_dir)[0]
+    names, values, tau, num_samples, rows = _layout(meta)
+    out_dir = os.path.dirname(os.path.dirname(os.path.abspath(shard_dir)))
+    path = os.path.join(out_dir, merged_template.format(meta["name"],
+                                                        int(meta["order"])))
+    header = read_header(path) if os.path.isfile(path) else None
+    if header is None:
+        return None
+    found = header.meta
+    block = header.blocks.get(names[0])
+    key = meta.get("value_key")
+    if ("order" not in found or int(found["order"]) != int(meta["order"])
+            or np.atleast_1d(found.get("tau", ())).tolist() != tau
+            or block is None
+            or tuple(block.shape) != (len(tau), len(values),
+                                      num_samples*rows)
+            or (key is not None and
+                np.atleast_1d(found.get(key, ())).tolist() != values)):
+        return None
+    return path
+
+def ingest_tree(con, root, force=False, log=print):
+    """
+    Ingest every data file and shard directory under `root`; see `ingest`.
+    Returns the total number of rows inserted.
+
+    Shards hold the same samples as the file they are merged into, so a
+    shard directory whose `merged_output` is also under `root` is skipped,
+    and dropped from the catalog if an earlier ingestion (before the merge)
+    added it.
+    """
+    candidates = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        if is_shard_dir(dirpath):
+            candidates.append(os.path.abspath(dirpath))
+        else:
+            candidates += [os.path.abspath(os.path.join(dirpath, name))
+                           for name in sorted(filenames)
+                           if name.endswith(".dat")]
+    files = set(candidates)
+    total = 0
+    for path in candidates:
+        merged = merged_output(path) if is_shard_dir(path) else None
+        if merged in files:
+            if forget(con, path):
+                log("dropped {}: its samples are in {}".format(path, merged))
+            continue
+        count = ingest(con, path, force)
+        if count is not None:
+            log("ingested {} rows from {}".format(count, path))
+            total += count
+    return total
+
+def cell_counts(con, system, qoi):
+    """
+    Return `(order, h, tau, count)` arrays with the number of catalogued
+    samples of `qoi` in every cell of `system`.
+    """
+    rows = con.execute("SELECT ord, h, tau, COUNT(*) FROM samples "
+                       "WHERE system = ? AND qoi = ? GROUP BY ord, h, tau "
+                       "ORDER BY ord, h, tau", (system, qoi)).fetchall()
+    return tuple(np.array(rows, dtype=float).reshape(-1, 4).T)
+
+def check_counts(con, system, qoi, expected):
+    """
+    Return the `(order, h, tau, count)` of the cells of `system` whose
+    number of samples of `qoi` is not `expected` (e.g. `num_samples*rows`
+    of a finished campaign, see `campaign.py`).
+    """
+    order, h, tau, count = cell_counts(con, system, qoi)
+    bad = count != expected
+    return list(zip(order[bad].astype(int), h[bad], tau[bad],
+                    count[bad].astype(int)))
+
+def query_samples(con, system, qoi, order=None, tau=None, h=None):
+    """
+    Return `(h, tau, sample, value, cputime)` arrays of the catalogued
+    samples of `qoi` for `system`, optionally restricted to one `order`,
+    period `tau` and mesh size `h` (matched to a relative tolerance of 1e-9).
+    """
+    sql = ("SELECT h, tau, sample, value, cputime FROM samples "
+           "WHERE system = ? AND qoi = ?")
+    args = [system, qoi]
+    if order is not None:
+        sql += " AND ord = ?"
+        args.append(int(order))
+    for name, val in (("tau", tau), ("h", h)):
+        if val is not None:
+            sql += " AND {0} BETWEEN ? AND ?".format(name)
+            args += [val*(1 - 1e-9), val*(1 + 1e-9)]
+    rows = con.execute(sql + " ORDER BY h, tau, sample", args).fetchall()
+    cols = np.array(rows, dtype=float).reshape(-1, 5).T
+    return tuple(cols)
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    check = "--check" in args
+    args = [arg for arg in args if arg != "--check"]
+    if len(args) < 2:
+        print("usage: python run_catalog.py catalog.db <file or dir> ... "
+              "[--check]")
+        sys.exit(1)
+    con = connect(args[0])
+    for path in args[1:]:
+        if os.path.isdir(path) and not is_shard_dir(path):
+            ingest_tree(con, path)
+        else:
+            count = ingest(con, path)
+            if count is not None:
+                print("ingested {} rows from {}".format(count, path))
+    if check:
+        # every cell of a finished campaign has num_samples*rows samples
+        from campaign import campaigns
+        for system, campaign in sorted(campaigns.items()):
+            expected = campaign.num_samples*campaign.rows
+            for qoi in legacy_layouts[system]["qoi"]:
+                for order, h, tau, count in check_counts(con, system, qoi,
+                                                         expected):
+                    print("{} order {} h {:.6g} tau {:g}: {} samples of {} "
+                          "instead of {}".format(system, order, h, tau, count,
+                                                 qoi, expected))
+    con.close()
@@ -0,0 +1,336 @@
+"""module for stopping the statistics campaigns cell by cell
+
+`gatherStatsKS` runs a fixed number of samples for every (order, dx, tau)
+cell, and `gatherStatsLorenz` a fixed number of windows, however quickly
+the error statistics of a cell settle.  This module follows a campaign as
+its shards arrive (see `shard_store.py`): each new shard in the manifest is
+read once and its samples are folded into online statistics of the percent
+errors of one quantity, per (tau, mesh) cell:
+
+  * the count, mean and variance, updated with Welford's algorithm;
+  * the quartiles, tracked with the P^2 algorithm of Jain and Chlamtac,
+    which keeps five markers per quantile instead of the samples.
+
+A cell has converged when it has at least `min_samples` samples and the
+half-width of the confidence interval of its median (the notch
+`1.57*IQR/sqrt(n)` of the box plots) or of its mean (`z*s/sqrt(n)`) is at
+most the target.  `SequentialPlanner.report` lists the cells that can stop
+and estimates how many more samples the others need; `SequentialStopper`
+lets `campaign.py` skip the remaining jobs of a mesh once all of its cells
+have converged, so the CPU goes to the cells that are still noisy.
+
+Usage from the command line, to check a campaign that is running:
+
+    python sequential_planner.py ks shards/order2 shards/order4 --target 1.0
+"""
+
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import threading
+import numpy as np
+from data_header import load_block
+from shard_store import _layout, read_manifest
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the quantity followed for each campaign by default
+default_quantity = {"ks": "u2_avg", "lorenz": "z_avg"}
+
+# the directory and loader module holding the reference values (`<qoi>_ref`)
+# of each campaign
+reference_loaders = {"ks": ("kuramoto-sivashinsky", "load_stats"),
+                     "lorenz": ("lorenz", "load_lorenz_stats")}
+
+def default_reference(name, quantity=None):
+    """
+    Return the quantity followed by default for the campaign `name` (or
+    `quantity`) and its reference value, read from the campaign's loader
+    (e.g. `u2_avg_ref` in `load_stats.py`), which is imported on first use.
+    """
+    quantity = default_quantity[name] if quantity is None else quantity
+    directory, loader = reference_loaders[name]
+    directory = os.path.join(_root, directory)
+    if directory not in sys.path:
+        sys.path.append(directory)
+    return quantity, float(getattr(importlib.import_module(loader),
+                                   quantity + "_ref"))
+
+class RunningMoments:
+    """
+    Count, mean and variance of a stream of samples per cell, updated with
+    Welford's algorithm.  The cells form an array of shape `shape`.
+    """
+    def __init__(self, shape):
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def add(self, x, where=None):
+        """Add the sample `x` to the cells `where` (default: all)."""
+        x = np.broadcast_to(x, self.count.shape)
+        where = np.ones(self.count.shape, dtype=bool) if where is None \
+            else np.broadcast_to(where, self.count.shape)
+        self.count += where
+        delta = np.where(where, x - self.mean, 0.0)
+        self.mean += delta/np.maximum(self.count, 1)
+        self.m2 += delta*np.where(where, x - self.mean, 0.0)
+
+    @property
+    def var(self):
+        """The sample variance (NaN for cells with fewer than two samples)."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.count > 1, self.m2/(self.count - 1), np.nan)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+class RunningQuantile:
+    """
+    Estimate of the quantile `p` of a stream of samples per cell, tracked
+    with the P^2 algorithm: five markers per cell whose heights approximate
+    the minimum, the quantiles `p/2`, `p` and `(1+p)/2`, and the maximum.
+    The estimate is exact for the first five samples of a cell.
+    """
+    def __init__(self, p, shape):
+        self.p = p
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.q = np.full((5,) + tuple(shape), np.nan)
+        self.n = np.tile(np.arange(1.0, 6.0).reshape((5,) + (1,)*len(shape)),
+                         (1,) + tuple(shape))
+        self.want = np.tile(np.array([1, 1 + 2*p, 1 + 4*p, 3 + 2*p, 5.0])
+                            .reshape((5,) + (1,)*len(shape)),
+                            (1,) + tuple(shape))
+        self.step = np.array([0, p/2, p, (1 + p)/2, 1]).reshape(
+            (5,) + (1,)*len(shape))
+
+    def add(self, x, where=None):
+        """Add the sample `x` to the cells `where` (default: all)."""
+        x = np.broadcast_to(x, self.count.shape)
+        where = np.ones(self.count.shape, dtype=bool) if where is None \
+            else np.broadcast_to(where, self.count.shape)
+        # the first five samples of a cell fill its markers, in order
+        fill = where & (self.count < 5)
+        if fill.any():
+            slot = np.minimum(self.count, 4)
+            q = np.moveaxis(self.q, 0, -1)
+            q[fill, slot[fill]] = x[fill]
+            full = fill & (self.count == 4)
+            q[full] = np.sort(q[full], axis=-1)
+        track = where & (self.count >= 5)
+        self.count += where
+        if not track.any():
+            return
+        q, n = self.q, self.n
+        # extend the extremes and find k with q[k] <= x < q[k+1]
+        q[0] = np.where(track, np.minimum(q[0], x), q[0])
+        q[4] = np.where(track, np.maximum(q[4], x), q[4])
+        k = np.clip(np.sum(x >= q[1:4], axis=0), 0, 3)
+        n += track*(np.arange(5).reshape((5,) + (1,)*x.ndim) > k)
+        self.want += track*self.step
+        for i in (1, 2, 3):
+            d = self.want[i] - n[i]
+            move = track & (((d >= 1) & (n[i+1] - n[i] > 1))
+                            | ((d <= -1) & (n[i-1] - n[i] < -1)))
+            if not move.any():
+                continue
+            s = np.sign(d)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                parabolic = q[i] + s/(n[i+1] - n[i-1])*(
+                    (n[i] - n[i-1] + s)*(q[i+1] - q[i])/(n[i+1] - n[i])
+                    + (n[i+1] - n[i] - s)*(q[i] - q[i-1])/(n[i] - n[i-1]))
+                j = np.where(s > 0, i + 1, i - 1)
+                qj = np.take_along_axis(q, j[None], 0)[0]
+                nj = np.take_along_axis(n, j[None], 0)[0]
+                linear = q[i] + s*(qj - q[i])/(nj - n[i])
+            ok = (q[i-1] < parabolic) & (parabolic < q[i+1])
+            q[i] = np.where(move, np.where(ok, parabolic, linear), q[i])
+            n[i] = np.where(move, n[i] + s, n[i])
+
+    @property
+    def value(self):
+        """The current estimate (NaN for cells without samples)."""
+        value = self.q[2].copy()
+        early = (self.count > 0) & (self.count <= 5)
+        if early.any():
+            value[early] = np.nanquantile(np.moveaxis(self.q, 0, -1)[early],
+                                          self.p, axis=-1)
+        value[self.count == 0] = np.nan
+        return value
+
+class CellStatistics:
+    """
+    Online statistics of the samples of a grid of cells: `moments` (a
+    `RunningMoments`) and `quantiles`, a dict of `RunningQuantile` keyed by
+    the quartiles 0.25, 0.5 and 0.75.
+    """
+    def __init__(self, shape):
+        self.moments = RunningMoments(shape)
+        self.quantiles = dict((p, RunningQuantile(p, shape))
+                              for p in (0.25, 0.5, 0.75))
+
+    @property
+    def count(self):
+        return self.moments.count
+
+    def add(self, x, where=None):
+        """Add the sample `x` to the cells `where`, skipping NaN."""
+        x = np.broadcast_to(x, self.count.shape)
+        where = ~np.isnan(x) if where is None else where & ~np.isnan(x)
+        self.moments.add(x, where)
+        for quantile in self.quantiles.values():
+            quantile.add(x, where)
+
+    def add_samples(self, samples, where=None):
+        """Add the samples along the last axis of `samples`, in order."""
+        for x in np.moveaxis(np.asarray(samples, dtype=float), -1, 0):
+            self.add(x, where)
+
+    def half_width(self, stat="median", alpha=0.05):
+        """
+        Return the half-width of the confidence interval of the `stat`
+        ("median" or "mean") of each cell.  The median uses the notch
+        formula of the box plots, which has about 95% coverage whatever
+        `alpha`.
+        """
+        n = np.maximum(self.count, 1)
+        if stat == "median":
+            iqr = self.quantiles[0.75].value - self.quantiles[0.25].value
+            return 1.57*iqr/np.sqrt(n)
+        if stat == "mean":
+            z = statistics.NormalDist().inv_cdf(1 - alpha/2)
+            return z*self.moments.std/np.sqrt(n)
+        raise ValueError("stat must be 'median' or 'mean'")
+
+    def samples_needed(self, target, stat="median", alpha=0.05):
+        """
+        Return the estimated number of further samples each cell needs for
+        a half-width of `target`, from the spread seen so far.
+        """
+        width = self.half_width(stat, alpha)*np.sqrt(np.maximum(self.count, 1))
+        with np.errstate(invalid="ignore"):
+            total = np.ceil((width/target)**2)
+        total = np.where(np.isnan(total), 0, total)
+        return np.maximum(total - self.count, 0).astype(np.int64)
+
+class SequentialPlanner:
+    """
+    Follows the shard directory `shard_dir` of a running campaign, keeping
+    `CellStatistics` of the percent errors of `quantity` against `ref` for
+    every (tau, mesh) cell.
+
+    Call `update` to read the shards added to the manifest since the last
+    call.  A cell has converged when it has at least `min_samples` samples
+    and its `stat` ("median" or "mean") has a confidence interval of
+    half-width at most `target`, in percent.
+    """
+    def __init__(self, shard_dir, quantity, ref, target, stat="median",
+                 min_samples=20, alpha=0.05):
+        self.shard_dir = shard_dir
+        self.quantity = quantity
+        self.ref = ref
+        self.target = target
+        self.stat = stat
+        self.min_samples = min_samples
+        self.alpha = alpha
+        meta, _, _ = read_manifest(shard_dir, 0)
+        self.order = int(meta["order"])
+        _, self.values, self.tau, self.num_samples, self.rows = _layout(meta)
+        self.stats = CellStatistics((len(self.tau), len(self.values)))
+        self.offset = 0
+
+    def update(self):
+        """Fold in the new shards of the manifest; return how many."""
+        _, entries, self.offset = read_manifest(self.shard_dir, self.offset)
+        shape = (len(self.tau), 1, self.rows)
+        for entry in entries:
+            index = self.values.index(entry["value"])
+            block = load_block(os.path.join(self.shard_dir, entry["shard"]),
+                               self.quantity, shape)[:,0,:]
+            error = np.abs(block - self.ref)*100/self.ref
+            where = np.zeros(self.stats.count.shape, dtype=bool)
+            where[:,index] = True
+            expanded = np.zeros(self.stats.count.shape + (self.rows,))
+            expanded[:,index] = error
+            self.stats.add_samples(expanded, where)
+        return len(entries)
+
+    def converged(self):
+        """Return, per (tau, mesh) cell, whether the cell can stop."""
+        width = self.stats.half_width(self.stat, self.alpha)
+        return (self.stats.count >= self.min_samples) & (width <= self.target)
+
+    def done_values(self):
+        """Return the mesh values all of whose cells have converged."""
+        done = np.all(self.converged(), axis=0)
+        return [value for value, ok in zip(self.values, done) if ok]
+
+    def report(self):
+        """Return a table of the cells, one line per (tau, mesh) cell."""
+        width = self.stats.half_width(self.stat, self.alpha)
+        center = self.stats.quantiles[0.5].value if self.stat == "median" \
+            else self.stats.moments.mean
+        needed = self.stats.samples_needed(self.target, self.stat, self.alpha)
+        needed = np.maximum(needed, self.min_samples - self.stats.count)
+        converged = self.converged()
+        lines = ["order {}: {} within +/-{} of the {} percent error of "
+                 "{}".format(self.order, np.sum(converged), self.target,
+                             self.stat, self.quantity)]
+        for t, tau in enumerate(self.tau):
+            for m, value in enumerate(self.values):
+                lines.append("  tau={:<8g} value={:<8g} n={:<6d} {}={:<10.4g} "
+                             "+/-{:<10.4g} {}".format(
+                                 tau, value, self.stats.count[t,m],
+                                 self.stat, center[t,m], width[t,m],
+                                 "stop" if converged[t,m] else
+                                 "needs ~{} more".format(needed[t,m])))
+        return "\n".join(lines)
+
+class SequentialStopper:
+    """
+    Decides, for `campaign.run_jobs`, which jobs of a campaign can be
+    skipped: calling it with a `Job` reads the new shards of the job's
+    order and returns True once every cell of the job's mesh has converged.
+    The keyword arguments are passed to the `SequentialPlanner` of each
+    order.  Calls from several worker threads are serialized.
+    """
+    def __init__(self, campaign, shard_dir, target, **kwargs):
+        quantity = kwargs.pop("quantity", default_quantity[campaign.name])
+        ref = kwargs.pop("ref", None)
+        if ref is None:
+            quantity, ref = default_reference(campaign.name, quantity)
+        self.planners = dict(
+            (order, SequentialPlanner(campaign.order_dir(shard_dir, order),
+                                      quantity, ref, target, **kwargs))
+            for order in campaign.orders
+            if os.path.exists(campaign.order_dir(shard_dir, order)))
+        self._lock = threading.Lock()
+
+    def __call__(self, job):
+        planner = self.planners.get(job.order)
+        if planner is None:
+            return False
+        with self._lock:
+            planner.update()
+            return job.value in planner.done_values()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="report which cells of a running campaign can stop")
+    parser.add_argument("campaign", choices=sorted(default_quantity))
+    parser.add_argument("shard_dirs", nargs="+")
+    parser.add_argument("--target", type=float, required=True,
+                        help="confidence-interval half-width, in percent")
+    parser.add_argument("--stat", choices=("median", "mean"),
+                        default="median")
+    parser.add_argument("--min-samples", type=int, default=20)
+    args = parser.parse_args()
+    quantity, ref = default_reference(args.campaign)
+    for shard_dir in args.shard_dirs:
+        planner = SequentialPlanner(shard_dir, quantity, ref, args.target,
+                                    args.stat, args.min_samples)
+        planner.update()
+        print(planner.report())
@@ -0,0 +1,190 @@
+"""module for sharded raw statistics, merged incrementally as shards arrive
+
+Instead of one `raw_statistics_*` file written at the end of a campaign, the
+gatherers (and `campaign.py`) can write one small shard per (order, mesh or
+step size, sample) job into a directory per order, e.g.
+`shards/order2/ks_order2_127_sample3.dat`.  Each shard is a data file with a
+header (see `data_header.py`) holding blocks of shape `(num_times, 1, rows)`.
+When a shard is complete it is renamed into place and a line is appended to
+the directory's `manifest.txt`, which starts with a description of the
+whole campaign:
+
+    # hoc-manifest 1
+    # meta name=ks
+    # meta order=2
+    # meta names=dx,u_avg,u2_avg,cputime
+    # meta tau=40.0,400.0,4000.0
+    # meta values=127,159,191,223,255
+    # meta value_key=num_nodes
+    # meta num_samples=10
+    # meta rows=100
+    order=2 value=127 sample=1 shard=ks_order2_127_sample1.dat
+
+`stats_cube.load_sharded_cube` merges the shards listed in the manifest
+into a `StatsCube`, and `load_stats_cube` does so when given a shard
+directory in place of a file.  The merged array is cached in the directory
+(`merged.npz`) together with the position reached in the manifest and a
+digest of the manifest up to there, so later loads only read the shards
+added since, and a manifest that was started over is merged afresh.
+Slots of samples that are not yet complete for every mesh are dropped, so
+partial results can be plotted while a campaign is still running.
+"""
+
+import hashlib
+import os
+import numpy as np
+from data_header import load_block, _parse_value
+
+manifest_name = "manifest.txt"
+manifest_magic = "# hoc-manifest 1"
+merged_name = "merged.npz"
+
+def init_manifest(shard_dir, meta):
+    """
+    Create `shard_dir` and its manifest, recording the `(key, value)` pairs
+    in `meta`, unless the manifest already exists.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    file_name = os.path.join(shard_dir, manifest_name)
+    if os.path.exists(file_name):
+        return
+    lines = [manifest_magic]
+    for key, val in meta:
+        val = np.atleast_1d(val)
+        lines.append("# meta " + key + "=" + ",".join(str(v) for v in val))
+    tmp = file_name + ".tmp{}".format(os.getpid())
+    with open(tmp, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, file_name)
+
+def append_manifest(shard_dir, order, value, sample, shard):
+    """Record the completed shard `shard` (a file in `shard_dir`)."""
+    with open(os.path.join(shard_dir, manifest_name), "a") as f:
+        f.write("order={} value={} sample={} shard={}\n".format(
+            order, value, sample, os.path.basename(shard)))
+
+def read_manifest(shard_dir, offset=0):
+    """
+    Read the manifest of `shard_dir` from byte `offset` on.
+
+    Returns `(meta, entries, offset)`: the campaign metadata (a dictionary),
+    the shard entries after `offset` (dictionaries with keys `order`,
+    `value`, `sample` and `shard`), and the offset just past the last
+    complete line, from which to continue next time.
+    """
+    meta = {}
+    with open(os.path.join(shard_dir, manifest_name), "rb") as f:
+        if f.readline().decode().rstrip() != manifest_magic:
+            raise ValueError("not a shard manifest in " + shard_dir)
+        while True:
+            pos = f.tell()
+            line = f.readline().decode()
+            if not line.startswith("# meta "):
+                break
+            key, _, val = line[len("# meta "):].partition("=")
+            meta[key.strip()] = _parse_value(val.strip())
+        start = max(offset, pos)
+        f.seek(start)
+        rest = f.read()
+    # a last line without a newline is still being written
+    rest = rest[:rest.rfind(b"\n") + 1]
+    entries = []
+    for line in rest.decode().splitlines():
+        fields = dict(item.split("=", 1) for item in line.split())
+        if fields:
+            entries.append({"order": int(fields["order"]),
+                            "value": _parse_value(fields["value"]),
+                            "sample": int(fields["sample"]),
+                            "shard": fields["shard"]})
+    return meta, entries, start + len(rest)
+
+def _manifest_digest(shard_dir, offset):
+    """
+    Return the SHA-256 digest of the first `offset` bytes of the manifest of
+    `shard_dir`, or None if the manifest is shorter.
+    """
+    file_name = os.path.join(shard_dir, manifest_name)
+    if os.path.getsize(file_name) < offset:
+        return None
+    sha = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        left = offset
+        while left > 0:
+            chunk = f.read(min(left, 1 << 20))
+            if not chunk:
+                return None
+            sha.update(chunk)
+            left -= len(chunk)
+    return sha.hexdigest()
+
+def _layout(meta):
+    names = np.atleast_1d(meta["names"]).tolist()
+    values = np.atleast_1d(meta["values"]).tolist()
+    tau = np.atleast_1d(meta["tau"]).tolist()
+    return names, values, tau, int(meta["num_samples"]), int(meta["rows"])
+
+def merge_manifest(shard_dir, use_cache=True):
+    """
+    Merge the shards of `shard_dir` into one array.
+
+    Returns `(meta, data, filled)`, where `data[quantity, tau, value,
+    sample]` holds the merged blocks (NaN where no shard has arrived yet)
+    and `filled[value, sample]` records which shards are present, with
+    samples numbered from 0.  With `use_cache`, the merge resumes from
+    `merged.npz`, and the updated merge is written back to it.
+    """
+    cache = os.path.join(shard_dir, merged_name)
+    meta, _, _ = read_manifest(shard_dir, 0)
+    names, values, tau, num_samples, rows = _layout(meta)
+    data = filled = None
+    offset = 0
+    if use_cache and os.path.exists(cache):
+        with np.load(cache) as saved:
+            # the merge only holds if the part of the manifest it read is
+            # unchanged, i.e. the manifest was not started over since
+            if saved["data"].shape == (len(names), len(tau), len(values),
+                                       num_samples*rows) \
+                    and "digest" in saved.files \
+                    and str(saved["digest"]) == _manifest_digest(
+                        shard_dir, int(saved["offset"])):
+                data = saved["data"]
+                filled = saved["filled"]
+                offset = int(saved["offset"])
+    if data is None:
+        data = np.full((len(names), len(tau), len(values), num_samples*rows),
+                       np.nan)
+        filled = np.zeros((len(values), num_samples), dtype=bool)
+    meta, entries, end = read_manifest(shard_dir, offset)
+    for entry in entries:
+        index = values.index(entry["value"])
+        sample = entry["sample"] - 1
+        shard = os.path.join(shard_dir, entry["shard"])
+        cols = slice(sample*rows, (sample + 1)*rows)
+        for q, name in enumerate(names):
+            data[q,:,index,cols] = load_block(shard, name,
+                                              (len(tau), 1, rows))[:,0,:]
+        filled[index,sample] = True
+    if use_cache and entries:
+        tmp = cache + ".tmp{}.npz".format(os.getpid())
+        try:
+            np.savez(tmp, data=data, filled=filled, offset=end,
+                     digest=_manifest_digest(shard_dir, end))
+            os.replace(tmp, cache)
+        except OSError:
+            pass # e.g. a read-only directory; the merge still succeeds
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    return meta, data, filled
+
+def complete_samples(filled, rows):
+    """
+    Return the indices, along the sample axis of a merged array, of the
+    samples whose shards are present for every mesh or step size.
+    """
+    done = np.flatnonzero(np.all(filled, axis=0))
+    return (done[:,None]*rows + np.arange(rows)).ravel()
+
+def is_shard_dir(path):
+    """Return True if `path` is a directory with a shard manifest."""
+    return os.path.isfile(os.path.join(path, manifest_name))
@@ -0,0 +1,88 @@
+# Shard directories of the statistics gatherers, included by both
+# `kuramoto-sivashinsky/chaotic_statistics_gather.jl` and
+# `lorenz/statistics_gather.jl`.  See `utils/shard_store.py` for the layout.
+# The including module provides `WriteDataFile` and uses `DelimitedFiles`.
+
+"""
+    initManifest(shard_dir, meta)
+
+Create `shard_dir` and its manifest, recording the `key => value` pairs in 
+`meta`, unless the manifest already exists.
+"""
+function initManifest(shard_dir, meta)
+    mkpath(shard_dir)
+    file_name = joinpath(shard_dir, "manifest.txt")
+    if isfile(file_name)
+        return nothing
+    end
+    open(file_name*".tmp", "w") do file
+        println(file, "# hoc-manifest 1")
+        for (key, val) in meta
+            vals = isa(val, AbstractString) ? [val] : val
+            println(file, "# meta ", key, "=", join(vals, ","))
+        end
+    end
+    mv(file_name*".tmp", file_name, force=true)
+    return nothing
+end
+
+"""
+    shard = shardName(shard_dir, prefix, order, value, sample)
+
+Returns the name of the shard file for one job in `shard_dir`.
+"""
+function shardName(shard_dir, prefix, order, value, sample)
+    return joinpath(shard_dir, "$(prefix)_order$(order)_$(value)_sample$(sample).dat")
+end
+
+"""
+    writeShard(shard, order, value, sample, names, arrays, meta)
+
+Writes a shard with `WriteDataFile` under a temporary name, renames it into
+place, and records it in the manifest of its directory, so a shard is either
+complete or absent.
+"""
+function writeShard(shard, order, value, sample, names, arrays, meta)
+    WriteDataFile(shard*".part", names, arrays, meta)
+    mv(shard*".part", shard, force=true)
+    open(joinpath(dirname(shard), "manifest.txt"), "a") do file
+        println(file, "order=", order, " value=", value, " sample=", sample, 
+                " shard=", basename(shard))
+    end
+end
+
+"""
+    recordShard(shard, order, value, sample)
+
+Appends the entry of the existing `shard` to the manifest of its directory
+unless it is already there, and returns whether it was appended.  A crash
+between the rename and the append of `writeShard` leaves a complete shard
+that the manifest does not list, so restarts call this for every shard they
+reuse, as `utils/campaign.py` does.
+"""
+function recordShard(shard, order, value, sample)
+    manifest = joinpath(dirname(shard), "manifest.txt")
+    entry = "shard="*basename(shard)
+    for line in eachline(manifest)
+        if !startswith(line, "#") && endswith(rstrip(line), entry)
+            return false
+        end
+    end
+    open(manifest, "a") do file
+        println(file, "order=", order, " value=", value, " sample=", sample, 
+                " ", entry)
+    end
+    return true
+end
+
+"""
+    arrays = readShard(shard, num_blocks, num_times)
+
+Reads the `num_blocks` blocks of `shard` back, each as a matrix with one row
+per sample and one column per integration period.
+"""
+function readShard(shard, num_blocks, num_times)
+    data = readdlm(shard, comments=true, comment_char='#')
+    return [permutedims(data[(b-1)*num_times+1:b*num_times, :]) 
+            for b = 1:num_blocks]
+end
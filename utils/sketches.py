@@ -0,0 +1,252 @@
+"""module for mergeable sketches of the raw statistics
+
+The summaries of `summary_stats.py` are computed from the full sample
+matrix of a statistics file.  When campaigns run on several machines, the
+samples of a cell are spread over many files that we would rather not
+gather in one place.  This module reduces the samples of every
+(channel, tau, mesh) cell to a small sketch that can be built where the
+samples are and merged afterwards:
+
+  * the count, mean and sum of squared deviations (M2), merged exactly
+    with the pairwise formulas of Chan, Golub and LeVeque;
+  * the minimum and maximum, merged exactly;
+  * a DDSketch of the values (Masson, Rim and Lee): counts in logarithmic
+    buckets `(gamma^(k-1), gamma^k]` with `gamma = (1+a)/(1-a)`, merged
+    exactly by adding the counts.  Any quantile read from it is within a
+    relative error `a` (`rel_err`) of a sample of the right rank, as long
+    as the values span fewer than `max_buckets` buckets; beyond that the
+    lowest buckets are collapsed, which only affects the smallest values.
+
+The channels are the percent errors of the quantities of interest against
+their reference values, plus the cpu time, so a merged sketch holds every
+field of a `SummaryTable`; `summary_stats.load_summary` (and so the
+plotting scripts) accepts a sketch file (`*.sketch.npz`) in place of a
+data file.  The values sketched must not be negative.
+
+Usage from the command line, to merge the sketches of several machines:
+
+    python sketches.py merge order2.sketch.npz node*/order2.sketch.npz
+"""
+
+import argparse
+import os
+import numpy as np
+
+sketch_suffix = ".sketch.npz"
+
+def is_sketch_file(file_name):
+    """Return True if `file_name` names a sketch file."""
+    return str(file_name).endswith(sketch_suffix)
+
+class StatsSketch:
+    """
+    Mergeable sketches of the cells (channel, tau, mesh) of a statistics
+    file.
+
+    `channels` names the first axis, `refs` holds the reference value of
+    each channel (NaN for channels that are not errors, e.g. the cpu time)
+    and `mesh` the mesh (dx or dt) values.  `count`, `mean`, `m2`, `lo` and
+    `hi` have the shape of the cells; `zeros` counts the values equal to
+    zero, and `buckets[..., j]` the values in the bucket with key
+    `offset + j`.
+    """
+    def __init__(self, channels, refs, mesh, rel_err, max_buckets, count,
+                 mean, m2, lo, hi, zeros, buckets, offset):
+        self.channels = tuple(channels)
+        self.refs = np.asarray(refs, dtype=float)
+        self.mesh = np.asarray(mesh, dtype=float)
+        self.rel_err = rel_err
+        self.max_buckets = max_buckets
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+        self.lo = lo
+        self.hi = hi
+        self.zeros = zeros
+        self.buckets = buckets
+        self.offset = offset
+
+    @property
+    def gamma(self):
+        return (1 + self.rel_err)/(1 - self.rel_err)
+
+    @property
+    def num_times(self):
+        return self.count.shape[1]
+
+    @property
+    def num_meshes(self):
+        return self.count.shape[2]
+
+    def index(self, name):
+        """Return the position of channel `name` along the first axis."""
+        try:
+            return self.channels.index(name)
+        except ValueError:
+            raise KeyError("unknown channel " + repr(name)) from None
+
+    @property
+    def std(self):
+        """The (population) standard deviation of each cell."""
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.sqrt(self.m2/self.count)
+
+    def _value_at(self, rank):
+        """Return the estimate of the value of 0-based `rank` of each cell."""
+        cum = self.zeros[..., None] + np.cumsum(self.buckets, axis=-1)
+        j = np.argmax(cum > rank[..., None], axis=-1)
+        value = 2*self.gamma**(self.offset + j)/(self.gamma + 1)
+        value = np.where(rank < self.zeros, 0.0, value)
+        value = np.where(rank <= 0, self.lo, value)
+        return np.clip(np.where(rank >= self.count - 1, self.hi, value),
+                       self.lo, self.hi)
+
+    def quantile(self, q):
+        """
+        Return the quantile `q` of every cell, interpolated between ranks
+        as `np.quantile` does (NaN for cells without values).
+        """
+        rank = q*(self.count - 1)
+        below = np.floor(rank)
+        lo, hi = self._value_at(below), self._value_at(np.ceil(rank))
+        value = lo + (rank - below)*(hi - lo)
+        return np.where(self.count > 0, value, np.nan)
+
+    def merge(self, other):
+        """Return the sketch of the values of both `self` and `other`."""
+        if (self.channels != other.channels or self.rel_err != other.rel_err
+                or self.count.shape != other.count.shape
+                or not np.allclose(self.refs, other.refs, equal_nan=True)):
+            raise ValueError("sketches of different layouts cannot be merged")
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(count > 0, self.mean + delta*other.count/count,
+                            0.0)
+            m2 = np.where(count > 0, self.m2 + other.m2
+                          + delta**2*self.count*other.count/count, 0.0)
+        top = max(self.offset + self.buckets.shape[-1],
+                  other.offset + other.buckets.shape[-1])
+        max_buckets = max(self.max_buckets, other.max_buckets)
+        offset = max(min(self.offset, other.offset), top - max_buckets)
+        buckets = _rebucket(self.buckets, self.offset, offset, top - offset) \
+            + _rebucket(other.buckets, other.offset, offset, top - offset)
+        mesh = self.mesh if np.all(np.isfinite(self.mesh)) else other.mesh
+        return StatsSketch(self.channels, self.refs, mesh, self.rel_err,
+                           max_buckets, count, mean, m2,
+                           np.fmin(self.lo, other.lo),
+                           np.fmax(self.hi, other.hi),
+                           self.zeros + other.zeros, buckets, offset)
+
+def _rebucket(buckets, offset, new_offset, size):
+    """
+    Return `buckets` (starting at key `offset`) on `size` buckets starting
+    at key `new_offset`, adding any buckets below it into the first one.
+    """
+    out = np.zeros(buckets.shape[:-1] + (size,), dtype=buckets.dtype)
+    shift = offset - new_offset
+    if shift >= 0:
+        out[..., shift:shift+buckets.shape[-1]] = buckets
+    else:
+        out[..., 0] = buckets[..., :1-shift].sum(axis=-1)
+        out[..., 1:buckets.shape[-1]+shift] = buckets[..., 1-shift:]
+    return out
+
+def sketch_values(values, channels, refs, mesh, rel_err=0.01,
+                  max_buckets=2048):
+    """
+    Return the `StatsSketch` of `values`, an array of shape (channel, tau,
+    mesh, sample); NaN values are left out.
+    """
+    values = np.asarray(values, dtype=float)
+    if np.any(values < 0):
+        raise ValueError("sketched values must not be negative!")
+    cells = values.shape[:-1]
+    valid = ~np.isnan(values)
+    count = valid.sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(count > 0, np.nansum(values, axis=-1)/count, 0.0)
+        m2 = np.nansum(np.where(valid, values - mean[..., None], 0.0)**2,
+                       axis=-1)
+    with np.errstate(invalid="ignore"):
+        lo = np.where(count > 0, np.min(np.where(valid, values, np.inf),
+                                        axis=-1), np.nan)
+        hi = np.where(count > 0, np.max(np.where(valid, values, -np.inf),
+                                        axis=-1), np.nan)
+    positive = valid & (values > 0)
+    zeros = np.sum(valid & (values == 0), axis=-1)
+    gamma = (1 + rel_err)/(1 - rel_err)
+    keys = np.ceil(np.log(values[positive])/np.log(gamma)).astype(np.int64)
+    if keys.size == 0:
+        offset, size = 0, 1
+    else:
+        offset = max(int(keys.min()), int(keys.max()) - max_buckets + 1)
+        size = int(keys.max()) - offset + 1
+    cell = np.broadcast_to(np.arange(int(np.prod(cells))).reshape(cells)
+                           [..., None], values.shape)[positive]
+    flat = cell*size + np.maximum(keys, offset) - offset
+    buckets = np.bincount(flat, minlength=int(np.prod(cells))*size)
+    buckets = buckets.reshape(cells + (size,))
+    return StatsSketch(channels, refs, mesh, rel_err, max_buckets, count,
+                       mean, m2, lo, hi, zeros, buckets, offset)
+
+def sketch_cube(cube, refs, cputime="cputime", rel_err=0.01,
+                max_buckets=2048):
+    """
+    Return the `StatsSketch` of the percent errors of the quantities and
+    reference values in the dict `refs`, and of the `cputime`, of the
+    `StatsCube` `cube`.
+    """
+    qois = tuple(refs)
+    ref = np.array([refs[qoi] for qoi in qois])
+    errors = [np.abs(cube[qoi] - refs[qoi])*100/refs[qoi] for qoi in qois]
+    values = np.stack(errors + [cube[cputime]])
+    if cube.num_samples > 0:
+        mesh = np.array(cube.mesh_values())
+    else:
+        mesh = np.full(cube.num_meshes, np.nan)
+    return sketch_values(values, qois + (cputime,), np.append(ref, np.nan),
+                         mesh, rel_err, max_buckets)
+
+def merge_sketches(sketches):
+    """Return the merge of the `StatsSketch`es in the sequence `sketches`."""
+    sketches = list(sketches)
+    if not sketches:
+        raise ValueError("no sketches to merge!")
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged = merged.merge(sketch)
+    return merged
+
+def save_sketch(file_name, sketch):
+    """Write `sketch` to `file_name` (which should end in `sketch_suffix`)."""
+    tmp = file_name + ".tmp{}.npz".format(os.getpid())
+    try:
+        np.savez(tmp, channels=np.array(sketch.channels), refs=sketch.refs,
+                 mesh=sketch.mesh, rel_err=sketch.rel_err,
+                 max_buckets=sketch.max_buckets, count=sketch.count,
+                 mean=sketch.mean, m2=sketch.m2, lo=sketch.lo, hi=sketch.hi,
+                 zeros=sketch.zeros, buckets=sketch.buckets,
+                 offset=sketch.offset)
+        os.replace(tmp, file_name)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def load_sketch(file_name):
+    """Return the `StatsSketch` saved in `file_name`."""
+    with np.load(file_name) as f:
+        return StatsSketch(tuple(f["channels"].tolist()), f["refs"],
+                           f["mesh"], float(f["rel_err"]),
+                           int(f["max_buckets"]), f["count"], f["mean"],
+                           f["m2"], f["lo"], f["hi"], f["zeros"],
+                           f["buckets"], int(f["offset"]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="merge statistics sketches")
+    parser.add_argument("command", choices=("merge",))
+    parser.add_argument("output")
+    parser.add_argument("inputs", nargs="+")
+    args = parser.parse_args()
+    save_sketch(args.output, merge_sketches(load_sketch(name)
+                                            for name in args.inputs))
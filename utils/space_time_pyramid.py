@@ -0,0 +1,200 @@
+"""module for level-of-detail rendering of stored space-time solutions
+
+A space-time solution stored with `space_time_store.py` can have far more
+time steps than a figure has pixels: at dt=0.01 over 400 time units the KS
+solution has 40,000 steps, drawn on an axes about 1,500 pixels wide.  This
+module builds, once per solution, a pyramid of reduced copies along the
+time axis (the long one; the nodes are kept).  Level `k` groups the time
+steps in blocks of `factors[k]` steps, each level halving the resolution
+of the one before, and keeps the minimum, maximum and mean of every block
+at every node.  The finest level has at most `max_rows` blocks, so the
+pyramid stays small however long the solution is.
+
+`render_space_time` draws a time window of the solution at the coarsest
+level that still has at least one block per pixel of the axes, with
+`imshow` (the fast path) or `contourf`, and takes the color range from the
+block extrema so it does not depend on the level drawn.  The time spent
+drawing is thus bounded by the figure size, not the length of the run.
+
+The pyramid is saved next to the text solution (the file name plus
+`.lod.npz`) with the size and modification time of the text file, and is
+rebuilt when these change.
+"""
+
+import os
+import numpy as np
+from trajectory_store import _source_stamp
+
+pyramid_suffix = ".lod.npz"
+max_rows = 4096
+min_rows = 16
+_chunk_bytes = 1 << 24
+
+def pyramid_name(file_name):
+    """Return the name of the pyramid sidecar of the solution `file_name`."""
+    return file_name + pyramid_suffix
+
+class Pyramid:
+    """
+    Multi-resolution copies of a space-time solution.
+
+    `factors[k]` is the number of time steps per block at level `k`, and
+    `mins[k]`, `maxs[k]` and `means[k]` are arrays of shape (blocks, nodes)
+    holding the extrema and mean of each block.  `num_steps` is the number
+    of time steps of the full solution.
+    """
+    def __init__(self, num_steps, factors, mins, maxs, means):
+        self.num_steps = num_steps
+        self.factors = list(factors)
+        self.mins = mins
+        self.maxs = maxs
+        self.means = means
+
+    @property
+    def vmin(self):
+        return self.mins[-1].min()
+
+    @property
+    def vmax(self):
+        return self.maxs[-1].max()
+
+    def level_for(self, steps, pixels):
+        """
+        Return the coarsest level with at least `pixels` blocks over
+        `steps` time steps, or None if the full solution is needed.
+        """
+        for k in reversed(range(len(self.factors))):
+            if -(-steps//self.factors[k]) >= pixels:
+                return k
+        return None
+
+    def window(self, k, start, stop):
+        """
+        Return `(first, mins, maxs, means)` for the blocks of level `k`
+        that cover the time steps `start` to `stop`; `first` is the first
+        time step of the first block.
+        """
+        f = self.factors[k]
+        lo, hi = start//f, -(-stop//f)
+        return lo*f, self.mins[k][lo:hi], self.maxs[k][lo:hi], \
+            self.means[k][lo:hi]
+
+def _coarsen(mins, maxs, sums, counts):
+    """Merge pairs of consecutive blocks."""
+    starts = np.arange(0, mins.shape[0], 2)
+    return (np.minimum.reduceat(mins, starts, axis=0),
+            np.maximum.reduceat(maxs, starts, axis=0),
+            np.add.reduceat(sums, starts, axis=0),
+            np.add.reduceat(counts, starts))
+
+def build_pyramid(sol):
+    """
+    Build the `Pyramid` of the `SpaceTimeSolution` `sol`, reading it once,
+    a few MiB at a time.
+    """
+    factor = 2
+    while -(-sol.num_steps//factor) > max_rows:
+        factor *= 2
+    chunk = max(1, _chunk_bytes//(8*max(sol.num_nodes, 1)*factor))*factor
+    parts = []
+    for start in range(0, sol.num_steps, chunk):
+        data = np.asarray(sol.data[start:start+chunk])
+        starts = np.arange(0, data.shape[0], factor)
+        parts.append((np.minimum.reduceat(data, starts, axis=0),
+                      np.maximum.reduceat(data, starts, axis=0),
+                      np.add.reduceat(data, starts, axis=0),
+                      np.diff(np.append(starts, data.shape[0]))))
+    level = tuple(np.concatenate(arrays) for arrays in zip(*parts))
+    factors, mins, maxs, means = [], [], [], []
+    while True:
+        factors.append(factor)
+        mins.append(level[0])
+        maxs.append(level[1])
+        means.append(level[2]/level[3][:,None])
+        if level[0].shape[0] <= min_rows:
+            break
+        level = _coarsen(*level)
+        factor *= 2
+    return Pyramid(sol.num_steps, factors, mins, maxs, means)
+
+def _save_pyramid(file_name, pyramid):
+    sidecar = pyramid_name(file_name)
+    tmp = sidecar + ".tmp{}.npz".format(os.getpid())
+    arrays = dict(stamp=np.array(_source_stamp(file_name), dtype=np.int64),
+                  num_steps=pyramid.num_steps, factors=pyramid.factors)
+    for k in range(len(pyramid.factors)):
+        arrays["min{}".format(k)] = pyramid.mins[k]
+        arrays["max{}".format(k)] = pyramid.maxs[k]
+        arrays["mean{}".format(k)] = pyramid.means[k]
+    try:
+        np.savez(tmp, **arrays)
+        os.replace(tmp, sidecar)
+    except OSError:
+        # read-only directories just go without a sidecar
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def _load_pyramid(file_name, num_steps):
+    """Return the saved pyramid of `file_name`, or None if stale."""
+    sidecar = pyramid_name(file_name)
+    if not os.path.exists(sidecar):
+        return None
+    with np.load(sidecar) as f:
+        if not np.array_equal(f["stamp"], _source_stamp(file_name)) or \
+                int(f["num_steps"]) != num_steps:
+            return None
+        factors = [int(factor) for factor in f["factors"]]
+        levels = range(len(factors))
+        return Pyramid(num_steps, factors,
+                       [f["min{}".format(k)] for k in levels],
+                       [f["max{}".format(k)] for k in levels],
+                       [f["mean{}".format(k)] for k in levels])
+
+def open_pyramid(sol):
+    """
+    Return the `Pyramid` of the `SpaceTimeSolution` `sol`, building and
+    saving it if there is no current one.
+    """
+    pyramid = _load_pyramid(sol.file_name, sol.num_steps)
+    if pyramid is None:
+        pyramid = build_pyramid(sol)
+        _save_pyramid(sol.file_name, pyramid)
+    return pyramid
+
+def render_space_time(ax, sol, pyramid=None, t_start=None, t_stop=None,
+                      x_range=(0.0, 1.0), cmap="inferno", levels=20,
+                      fast=True):
+    """
+    Draw the solution `sol` over the times `t_start` to `t_stop` (default:
+    all of it) on `ax`, time along x and space over `x_range` along y.
+
+    The level of `pyramid` (default: `open_pyramid(sol)`) is chosen to
+    match the width of `ax` in pixels, so the position and size of `ax`
+    should be set first.  With `fast`, the block means are drawn with
+    `imshow`; otherwise they are drawn with `contourf` and `levels` evenly
+    spaced levels.  The color range is that of the whole solution.  Returns
+    the image or contour set.
+    """
+    if pyramid is None:
+        pyramid = open_pyramid(sol)
+    start = 0 if t_start is None else sol.step_at(t_start)
+    stop = sol.num_steps if t_stop is None else sol.step_at(t_stop) + 1
+    pixels = int(np.ceil(ax.get_window_extent().width))
+    k = pyramid.level_for(stop - start, pixels)
+    if k is None:
+        first, u, step = start, np.asarray(sol.data[start:stop]), 1
+    else:
+        first, lo, hi, u = pyramid.window(k, start, stop)
+        step = pyramid.factors[k]
+    vmin, vmax = pyramid.vmin, pyramid.vmax
+    # block centers in time
+    t = sol.t0 + (first + step*np.arange(u.shape[0]) + 0.5*(step - 1))*sol.dt
+    if fast:
+        edges = (t[0] - 0.5*step*sol.dt, t[-1] + 0.5*step*sol.dt)
+        return ax.imshow(u.T, origin="lower", aspect="auto", cmap=cmap,
+                         interpolation="nearest", vmin=vmin, vmax=vmax,
+                         extent=[edges[0], edges[1], x_range[0], x_range[1]])
+    x = np.linspace(x_range[0], x_range[1], u.shape[1])
+    X, T = np.meshgrid(x, t)
+    return ax.contourf(T, X, u, np.linspace(vmin, vmax, levels + 1),
+                       cmap=cmap)
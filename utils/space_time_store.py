@@ -0,0 +1,275 @@
+"""module for time-tiled, memory-mapped storage of space-time solutions
+
+`solve_ks.jl`, `solve_periodic_ks.jl` and `verify_spatial_accuracy.jl`
+write a KS solution as text, one time step per line with one value per
+node.  This module converts such a file once into a binary store next to it
+(the same name plus `.tiles`):
+
+  * a fixed-size header: the size and modification time of the text file,
+    the number of time steps and nodes, the number of steps per tile, the
+    number of tiles, and the time range of the solution;
+  * the tile index: for each tile, its first time step, the byte offset of
+    its data, and the minimum and maximum of the solution over the tile;
+  * the data, starting on a page boundary: the time steps in order as
+    little-endian float64 rows, so each tile of `tile_steps` rows is one
+    contiguous block.
+
+The data is memory mapped, so a time slice or a window of time steps only
+touches the pages holding those rows, whatever the size of the solution,
+and the tile index gives the range of values of any window without reading
+it.  The store records the size and modification time of the text file and
+is rebuilt when they change.
+
+Usage from the command line, to convert solutions ahead of time:
+
+    python space_time_store.py ks_solution.dat --time 0 400
+"""
+
+import argparse
+import os
+import struct
+import numpy as np
+from trajectory_store import _count_rows, _source_stamp
+
+store_suffix = ".tiles"
+_magic = b"HOCTIL\x00\x01"
+_header_fmt = "<8sQqQQQQdd"
+_header_size = 128
+_index_dtype = np.dtype([("first", "<u8"), ("offset", "<u8"),
+                         ("min", "<f8"), ("max", "<f8")])
+_page = 4096
+_tile_bytes = 1 << 20
+
+def store_name(file_name):
+    """Return the name of the tiled store for the solution `file_name`."""
+    return file_name + store_suffix
+
+def default_tile_steps(num_nodes):
+    """Return the number of time steps in a tile of about 1 MiB."""
+    return max(1, _tile_bytes//(8*max(num_nodes, 1)))
+
+def _data_offset(num_tiles):
+    end = _header_size + _index_dtype.itemsize*num_tiles
+    return -(-end//_page)*_page
+
+def convert_solution(file_name, time_range=None, tile_steps=None):
+    """
+    Convert the text solution `file_name` into its tiled store.
+
+    `time_range` is the (initial, final) time of the solution, recorded in
+    the header; by default the time is the step index.  `tile_steps` is the
+    number of time steps per tile (see `default_tile_steps`).  The text is
+    parsed a few tiles at a time and written straight into the memory-mapped
+    store, so the conversion never holds more than that in memory.  Returns
+    the name of the store.
+    """
+    stamp = _source_stamp(file_name)
+    num_steps = _count_rows(file_name)
+    with open(file_name, "r") as f:
+        num_nodes = len(f.readline().split())
+    if tile_steps is None:
+        tile_steps = default_tile_steps(num_nodes)
+    if time_range is None:
+        time_range = (0.0, float(max(num_steps - 1, 0)))
+    num_tiles = -(-num_steps//tile_steps)
+    offset = _data_offset(num_tiles)
+    index = np.zeros(num_tiles, dtype=_index_dtype)
+    index["first"] = np.arange(num_tiles)*tile_steps
+    index["offset"] = offset + index["first"]*8*num_nodes
+    store = store_name(file_name)
+    tmp = store + ".tmp{}".format(os.getpid())
+    header = struct.pack(_header_fmt, _magic, stamp[0], stamp[1], num_steps,
+                         num_nodes, tile_steps, num_tiles, time_range[0],
+                         time_range[1])
+    try:
+        with open(tmp, "wb") as f:
+            f.truncate(offset + 8*num_steps*num_nodes)
+        if num_steps*num_nodes > 0:
+            data = np.memmap(tmp, dtype="<f8", mode="r+", offset=offset,
+                             shape=(num_steps, num_nodes))
+            chunk_tiles = max(1, 16*_tile_bytes//(8*num_nodes*tile_steps))
+            ptr = 0
+            with open(file_name, "r") as f:
+                while ptr < num_steps:
+                    chunk = np.loadtxt(f, max_rows=chunk_tiles*tile_steps,
+                                       ndmin=2)
+                    if chunk.shape[0] == 0:
+                        break
+                    data[ptr:ptr+chunk.shape[0]] = chunk
+                    for start in range(0, chunk.shape[0], tile_steps):
+                        tile = chunk[start:start+tile_steps]
+                        k = (ptr + start)//tile_steps
+                        index["min"][k] = tile.min()
+                        index["max"][k] = tile.max()
+                    ptr += chunk.shape[0]
+            data.flush()
+            del data
+            if ptr != num_steps:
+                raise ValueError("blank or malformed lines in " + file_name)
+        with open(tmp, "r+b") as f:
+            f.write(header.ljust(_header_size, b"\x00"))
+            f.write(index.tobytes())
+        os.replace(tmp, store)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return store
+
+class SpaceTimeSolution:
+    """
+    A stored space-time solution with random access by time.
+
+    `data[n]` is the solution at time step `n`, with `data` a read-only
+    memory map of shape (`num_steps`, `num_nodes`) (or a plain array, if the
+    store could not be written).  Time step `n` is at time `t0 + n*dt`.
+    `index` holds the first step, byte offset, minimum and maximum of each
+    tile of `tile_steps` steps.
+    """
+    def __init__(self, file_name, data, tile_steps, index, t0, t1):
+        self.file_name = file_name
+        self.data = data
+        self.tile_steps = tile_steps
+        self.index = index
+        self.t0 = t0
+        self.t1 = t1
+
+    @property
+    def num_steps(self):
+        return self.data.shape[0]
+
+    @property
+    def num_nodes(self):
+        return self.data.shape[1]
+
+    @property
+    def num_tiles(self):
+        return self.index.size
+
+    @property
+    def dt(self):
+        return (self.t1 - self.t0)/max(self.num_steps - 1, 1)
+
+    def times(self, start=None, stop=None):
+        """Return the times of the steps `start` to `stop`."""
+        steps = np.arange(self.num_steps)[start:stop]
+        return self.t0 + steps*self.dt
+
+    def step_at(self, t):
+        """Return the time step nearest to time `t`."""
+        n = int(round((t - self.t0)/self.dt)) if self.dt > 0 else 0
+        return min(max(n, 0), self.num_steps - 1)
+
+    def tile_of(self, step):
+        """Return the tile holding time step `step`."""
+        return step//self.tile_steps
+
+    def tile(self, k):
+        """Return the time steps of tile `k`."""
+        first = int(self.index["first"][k])
+        return self.data[first:first+self.tile_steps]
+
+    def step(self, n):
+        """Return the solution at time step `n` (negative counts back)."""
+        return self.data[n]
+
+    def slice(self, t):
+        """Return the solution at the time step nearest to time `t`."""
+        return self.data[self.step_at(t)]
+
+    def window(self, t_start, t_stop):
+        """
+        Return `(times, u)` for the time steps from `t_start` to `t_stop`
+        (both included, rounded to the nearest step); `u` is a view.
+        """
+        start, stop = self.step_at(t_start), self.step_at(t_stop) + 1
+        return self.times(start, stop), self.data[start:stop]
+
+    def value_range(self, start=None, stop=None):
+        """
+        Return the (min, max) of the solution over the time steps `start`
+        to `stop`, bounded from the tile index without reading the data;
+        the bound is exact when the steps cover whole tiles.
+        """
+        steps = np.arange(self.num_steps)[start:stop]
+        if steps.size == 0:
+            return np.nan, np.nan
+        tiles = slice(self.tile_of(steps[0]), self.tile_of(steps[-1]) + 1)
+        return self.index["min"][tiles].min(), self.index["max"][tiles].max()
+
+def _open_store(file_name):
+    """
+    Return `(data, tile_steps, index, t0, t1)` of the store of `file_name`,
+    or None if there is no current store.
+    """
+    store = store_name(file_name)
+    try:
+        with open(store, "rb") as f:
+            header = f.read(_header_size)
+            fields = struct.unpack_from(_header_fmt, header) \
+                if len(header) == _header_size else None
+            if fields is None:
+                return None
+            index = np.frombuffer(
+                f.read(_index_dtype.itemsize*fields[6]), dtype=_index_dtype)
+    except OSError:
+        return None
+    magic, size, mtime, num_steps, num_nodes, tile_steps, num_tiles, t0, t1 \
+        = fields
+    if magic != _magic or (size, mtime) != _source_stamp(file_name):
+        return None
+    offset = _data_offset(num_tiles)
+    if index.size != num_tiles or \
+            os.path.getsize(store) != offset + 8*num_steps*num_nodes:
+        return None
+    if num_steps*num_nodes == 0:
+        data = np.zeros((num_steps, num_nodes))
+    else:
+        data = np.memmap(store, dtype="<f8", mode="r", offset=offset,
+                         shape=(num_steps, num_nodes))
+    return data, tile_steps, index, t0, t1
+
+def open_solution(file_name, time_range=None, tile_steps=None):
+    """
+    Open the text solution `file_name` through its tiled store.
+
+    The store is built on first use, with the `time_range` and `tile_steps`
+    given (see `convert_solution`), and rebuilt if `file_name` has changed
+    since.  A `time_range` given for an existing store overrides the
+    recorded one.  If the store cannot be written (for example, in a
+    read-only directory), the text is parsed into memory instead.
+    """
+    opened = _open_store(file_name)
+    if opened is None:
+        try:
+            convert_solution(file_name, time_range, tile_steps)
+            opened = _open_store(file_name)
+        except OSError:
+            opened = None
+    if opened is None:
+        data = np.loadtxt(file_name, ndmin=2)
+        steps = tile_steps or default_tile_steps(data.shape[1])
+        first = np.arange(0, data.shape[0], steps)
+        index = np.zeros(first.size, dtype=_index_dtype)
+        index["first"] = first
+        index["min"] = [data[n:n+steps].min() for n in first]
+        index["max"] = [data[n:n+steps].max() for n in first]
+        t_end = float(max(data.shape[0] - 1, 0))
+        opened = data, steps, index, 0.0, t_end
+    data, steps, index, t0, t1 = opened
+    if time_range is not None:
+        t0, t1 = time_range
+    return SpaceTimeSolution(file_name, data, steps, index, t0, t1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="convert text space-time solutions to tiled stores")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--time", type=float, nargs=2, default=None,
+                        metavar=("T0", "T1"),
+                        help="time range of the solutions (default: steps)")
+    parser.add_argument("--tile-steps", type=int, default=None)
+    args = parser.parse_args()
+    for name in args.files:
+        if _open_store(name) is None:
+            print("converting", name)
+            convert_solution(name, args.time, args.tile_steps)
@@ -0,0 +1,92 @@
+"""module for caching parsed text data files as memory-mapped binary sidecars"""
+
+import os
+import struct
+import numpy as np
+
+# The sidecar is a small fixed-size header followed by a raw little-endian
+# float64 block.  The header records the size and modification time of the
+# text file it was built from, so a stale cache is detected with one os.stat.
+cache_suffix = ".f64cache"
+_magic = b"HOCF64\x00\x01"
+_header_fmt = "<8sQqQQ"
+_header_size = 64
+
+def cache_name(file_name):
+    """Return the name of the binary sidecar cache for `file_name`."""
+    return file_name + cache_suffix
+
+def _source_stamp(file_name):
+    st = os.stat(file_name)
+    return st.st_size, st.st_mtime_ns
+
+def _read_cache(file_name, stamp):
+    """Return the memory-mapped cache for `file_name`, or None if stale."""
+    cache = cache_name(file_name)
+    try:
+        with open(cache, "rb") as f:
+            header = f.read(_header_size)
+    except OSError:
+        return None
+    if len(header) != _header_size:
+        return None
+    magic, size, mtime, nrows, ncols = struct.unpack_from(_header_fmt, header)
+    if magic != _magic or (size, mtime) != stamp:
+        return None
+    if os.path.getsize(cache) != _header_size + 8*nrows*ncols:
+        return None
+    if nrows*ncols == 0:
+        return np.zeros((nrows, ncols))
+    return np.memmap(cache, dtype="<f8", mode="r", offset=_header_size,
+                     shape=(nrows, ncols))
+
+def _write_cache(file_name, stamp, data):
+    """Write `data` to the sidecar of `file_name`; return False on failure."""
+    cache = cache_name(file_name)
+    tmp = cache + ".tmp{}".format(os.getpid())
+    header = struct.pack(_header_fmt, _magic, stamp[0], stamp[1],
+                         data.shape[0], data.shape[1])
+    try:
+        with open(tmp, "wb") as f:
+            f.write(header.ljust(_header_size, b"\x00"))
+            f.write(np.ascontiguousarray(data, dtype="<f8").tobytes())
+        os.replace(tmp, cache)
+    except OSError:
+        # read-only directories and the like just go without a cache
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return False
+    return True
+
+def current_cache(file_name):
+    """
+    Return the memory-mapped cache of `file_name` if it is up to date.
+
+    Unlike `cached_loadtxt`, this never parses the text file; it returns
+    None when there is no current cache.
+    """
+    return _read_cache(file_name, _source_stamp(file_name))
+
+def cached_loadtxt(file_name, use_cache=True):
+    """
+    Load a whitespace-delimited numeric text file as a 2D float64 array.
+
+    The first call parses `file_name` with `np.loadtxt` and writes a binary
+    sidecar (see `cache_name`) next to it.  Later calls check the sidecar
+    against the size and modification time of `file_name` and, if it is
+    current, return a read-only memory map of it instead of parsing the text
+    again.  Set `use_cache` to False to always parse the text file.
+    """
+    if not use_cache:
+        return np.loadtxt(file_name, ndmin=2)
+    stamp = _source_stamp(file_name)
+    data = _read_cache(file_name, stamp)
+    if data is not None:
+        return data
+    data = np.loadtxt(file_name, ndmin=2)
+    if _write_cache(file_name, stamp, data):
+        # hand back the memory map so repeated calls share the page cache
+        cached = _read_cache(file_name, stamp)
+        if cached is not None:
+            return cached
+    return data
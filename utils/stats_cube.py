@@ -0,0 +1,131 @@
+"""module for viewing raw statistics files as a labeled 4D array"""
+
+import os
+import numpy as np
+from stats_cache import cached_loadtxt
+from data_header import read_header, check_shape
+from shard_store import (complete_samples, is_shard_dir, manifest_name,
+                         merge_manifest)
+
+class StatsCube:
+    """
+    Raw statistics data viewed as a 4D array.
+
+    The gather scripts (`chaotic_statistics_gather.jl` and
+    `statistics_gather.jl`) write one `Print3DArray` block per quantity, each
+    block holding `num_times*num_meshes` rows of `num_samples` values.  A
+    `StatsCube` holds that data as `data[quantity, tau, mesh, sample]`, where
+    the quantity axis is labeled by the names in `quantities`.  Indexing the
+    cube with a name, e.g. `cube["u_avg"]`, returns the 3D view for that
+    quantity.
+    """
+    axes = ("quantity", "tau", "mesh", "sample")
+
+    def __init__(self, data, quantities):
+        if data.ndim != 4 or data.shape[0] != len(quantities):
+            raise ValueError("data must be 4D with one entry per quantity!")
+        self.data = data
+        self.quantities = tuple(quantities)
+
+    @property
+    def num_times(self):
+        return self.data.shape[1]
+
+    @property
+    def num_meshes(self):
+        return self.data.shape[2]
+
+    @property
+    def num_samples(self):
+        return self.data.shape[3]
+
+    def index(self, name):
+        """Return the position of quantity `name` along the first axis."""
+        try:
+            return self.quantities.index(name)
+        except ValueError:
+            raise KeyError("unknown quantity " + repr(name)) from None
+
+    def __getitem__(self, name):
+        return self.data[self.index(name)]
+
+    def mesh_values(self):
+        """Return the mesh (dx or dt) values, stored as the first quantity."""
+        return self.data[0, 0, :, 0]
+
+# cubes that have already been loaded, keyed by file and layout
+_cubes = {}
+
+def load_stats_cube(file_name, quantities, num_meshes, num_times):
+    """
+    Load the raw statistics file `file_name` as a `StatsCube`.
+
+    The file must hold one block for each name in `quantities`, and each
+    block must correspond to `num_meshes` mesh (or step) sizes and
+    `num_times` integration periods.  The text is parsed (or its binary
+    cache mapped) once; the cube is a reshaped view of that data, and later
+    calls with the same arguments return the same cube until the file
+    changes on disk.  If the file has a header (see `data_header.py`), the
+    block names and shapes are validated from it before parsing any data.
+    `file_name` may also be a shard directory; see `load_sharded_cube`.
+    """
+    if num_meshes <= 0:
+        raise ValueError("num_meshes must be positive!")
+    if num_times <= 0:
+        raise ValueError("num_times must be positive!")
+    if is_shard_dir(file_name):
+        return load_sharded_cube(file_name, quantities, num_meshes, num_times)
+    quantities = tuple(quantities)
+    key = (os.path.abspath(file_name), quantities, num_meshes, num_times)
+    st = os.stat(file_name)
+    stamp = (st.st_size, st.st_mtime_ns)
+    if key in _cubes and _cubes[key][0] == stamp:
+        return _cubes[key][1]
+    header = read_header(file_name)
+    if header is not None:
+        # files with a header are checked before any data is parsed
+        if header.names()[:len(quantities)] != quantities:
+            raise ValueError(file_name + " holds blocks "
+                             + str(header.names()) + ", expected "
+                             + str(quantities))
+        for name in quantities:
+            check_shape(file_name, header.blocks[name],
+                        (num_times, num_meshes, None))
+    data = cached_loadtxt(file_name)
+    if data.shape[0] != len(quantities)*num_meshes*num_times:
+        raise ValueError("number of meshes and/or num_times inconsistent with "
+                         + file_name)
+    # Print3DArray writes tau-major, then mesh, with samples along each row,
+    # so a C-order reshape of the contiguous data is a view, not a copy
+    cube = StatsCube(data.reshape(len(quantities), num_times, num_meshes,
+                                  data.shape[1]), quantities)
+    _cubes[key] = (stamp, cube)
+    return cube
+
+def load_sharded_cube(shard_dir, quantities, num_meshes, num_times):
+    """
+    Load the shards in `shard_dir` (see `shard_store.py`) as a `StatsCube`.
+
+    Only the shards added to the manifest since the last load are read.  The
+    cube holds the samples that are complete for every mesh, in the same
+    layout as the merged raw statistics file, so partial campaigns can be
+    analyzed while they run.
+    """
+    quantities = tuple(quantities)
+    key = (os.path.abspath(shard_dir), quantities, num_meshes, num_times)
+    st = os.stat(os.path.join(shard_dir, manifest_name))
+    stamp = (st.st_size, st.st_mtime_ns)
+    if key in _cubes and _cubes[key][0] == stamp:
+        return _cubes[key][1]
+    meta, data, filled = merge_manifest(shard_dir)
+    names = tuple(np.atleast_1d(meta["names"]).tolist())
+    if names[:len(quantities)] != quantities:
+        raise ValueError(shard_dir + " holds blocks " + str(names)
+                         + ", expected " + str(quantities))
+    if data.shape[1:3] != (num_times, num_meshes):
+        raise ValueError("number of meshes and/or num_times inconsistent with "
+                         + shard_dir)
+    keep = complete_samples(filled, int(meta["rows"]))
+    cube = StatsCube(data[:len(quantities),...,keep], quantities)
+    _cubes[key] = (stamp, cube)
+    return cube
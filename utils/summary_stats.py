@@ -0,0 +1,228 @@
+"""module for precomputed box-plot summaries of the raw statistics
+
+The box plots used to hand the full sample matrices to `Axes.boxplot`, which
+recomputes the quartiles, medians and notch confidence intervals of every
+box for every figure.  This module computes those summaries for every
+quantity of interest, integration period and mesh (or step) size of a raw
+statistics file in one vectorized pass, and keeps them in a small table:
+
+    data[qoi, field, tau, mesh]
+
+with `field` one of `fields`.  The values summarized are the percent errors
+`|value - ref|*100/ref` against the reference value of each quantity.  The
+box fields match those of `matplotlib.cbook.boxplot_stats` with
+`whis=[0,100]` (whiskers at the extremes, notches at
+`med -/+ 1.57*IQR/sqrt(n)`), so `SummaryTable.bxp_stats` can be drawn with
+`Axes.bxp` and the figures no longer depend on the number of samples.
+Samples that are NaN (e.g. runs that blew up) are left out of each cell,
+and a cube without samples (a shard directory with no complete sample
+yet) gives NaN summaries.  A sketch file of `sketches.py` can stand in for
+the data file; its quartiles are then within the relative error of the
+sketch.
+
+The table is saved next to the data file (the file name plus
+`.summary.npz`, or `summary.npz` in a shard directory) together with the
+size and modification time of the data, and is only recomputed when these
+or the reference values change.
+"""
+
+import os
+import numpy as np
+from shard_store import is_shard_dir, manifest_name
+from sketches import is_sketch_file, load_sketch
+from stats_cube import load_stats_cube
+
+fields = ("min", "q1", "med", "q3", "max", "cilo", "cihi", "mean", "std",
+          "count", "cpu_med", "cpu_mean")
+summary_suffix = ".summary.npz"
+
+class SummaryTable:
+    """
+    Box-plot summaries of the percent errors of the quantities `qois`, held
+    as `data[qoi, field, tau, mesh]`, with the mesh (dx or dt) values in
+    `mesh`.  Indexing with a (qoi, field) pair, e.g. `table["u2_avg",
+    "med"]`, returns the (tau, mesh) array of that field.
+    """
+    def __init__(self, data, qois, mesh):
+        if data.ndim != 4 or data.shape[:2] != (len(qois), len(fields)):
+            raise ValueError("data must be 4D with one entry per qoi and "
+                             "field!")
+        self.data = data
+        self.qois = tuple(qois)
+        self.mesh = mesh
+
+    @property
+    def num_times(self):
+        return self.data.shape[2]
+
+    @property
+    def num_meshes(self):
+        return self.data.shape[3]
+
+    def __getitem__(self, key):
+        qoi, field = key
+        try:
+            q = self.qois.index(qoi)
+        except ValueError:
+            raise KeyError("unknown quantity " + repr(qoi)) from None
+        return self.data[q, fields.index(field)]
+
+    def bxp_stats(self, qoi, tau_idx=slice(None), mesh_idx=slice(None)):
+        """
+        Return the boxes of `qoi` for the periods `tau_idx` and meshes
+        `mesh_idx` (an index or a slice each) as the list of dicts taken by
+        `Axes.bxp`, in row-major (tau, mesh) order.
+        """
+        q = self.qois.index(qoi)
+        cells = self.data[q][:, tau_idx, mesh_idx]
+        cells = cells.reshape(len(fields), -1)
+        stats = []
+        for cell in cells.T:
+            box = dict(zip(fields, cell))
+            stats.append(dict(med=box["med"], q1=box["q1"], q3=box["q3"],
+                              whislo=box["min"], whishi=box["max"],
+                              cilo=box["cilo"], cihi=box["cihi"],
+                              mean=box["mean"], fliers=np.empty(0)))
+        return stats
+
+def summarize(values, ref, cputime):
+    """
+    Return the summary `fields` of the percent errors of `values` against
+    `ref`, along the last (sample) axis, as an array of shape
+    `(len(fields),) + values.shape[:-1]`.  `cputime` must broadcast to the
+    shape of `values`.  NaN samples are ignored.
+    """
+    error = np.abs(values - ref)*100/ref
+    cputime = np.broadcast_to(cputime, error.shape)
+    if error.shape[-1] == 0:
+        return np.full((len(fields),) + error.shape[:-1], np.nan)
+    partial = np.isnan(error).any()
+    percentile = np.nanpercentile if partial else np.percentile
+    lo, q1, med, q3, hi = percentile(error, [0, 25, 50, 75, 100], axis=-1)
+    count = np.sum(~np.isnan(error), axis=-1)
+    half = 1.57*(q3 - q1)/np.sqrt(count)
+    mean = np.nanmean if partial else np.mean
+    std = np.nanstd if partial else np.std
+    cpu_med = (np.nanmedian if partial else np.median)(cputime, axis=-1)
+    return np.stack([lo, q1, med, q3, hi, med - half, med + half,
+                     mean(error, axis=-1), std(error, axis=-1), count,
+                     cpu_med, mean(cputime, axis=-1)])
+
+def summarize_cube(cube, refs, cputime="cputime"):
+    """
+    Return the `SummaryTable` of the `StatsCube` `cube` for the quantities
+    and reference values in the dict `refs`.
+    """
+    qois = tuple(refs)
+    values = np.stack([cube[qoi] for qoi in qois])
+    ref = np.array([refs[qoi] for qoi in qois])[:, None, None, None]
+    data = summarize(values, ref, cube[cputime][None])
+    if cube.num_samples > 0:
+        mesh = np.array(cube.mesh_values())
+    else:
+        mesh = np.full(cube.num_meshes, np.nan)
+    return SummaryTable(np.moveaxis(data, 0, 1), qois, mesh)
+
+def summarize_sketch(sketch, qois):
+    """
+    Return the `SummaryTable` of the quantities `qois` of the `StatsSketch`
+    `sketch`, whose last channel is the cpu time.
+    """
+    cpu = len(sketch.channels) - 1
+    q1, med, q3 = (sketch.quantile(q) for q in (0.25, 0.5, 0.75))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        half = 1.57*(q3 - q1)/np.sqrt(sketch.count)
+    mean = np.where(sketch.count > 0, sketch.mean, np.nan)
+    data = np.stack([sketch.lo, q1, med, q3, sketch.hi, med - half,
+                     med + half, mean, sketch.std, sketch.count,
+                     np.broadcast_to(med[cpu], med.shape),
+                     np.broadcast_to(mean[cpu], mean.shape)], axis=1)
+    rows = [sketch.index(qoi) for qoi in qois]
+    return SummaryTable(data[rows], qois, sketch.mesh)
+
+def summary_name(file_name):
+    """Return the name of the summary sidecar of `file_name`."""
+    if is_shard_dir(file_name):
+        return os.path.join(file_name, "summary.npz")
+    return file_name + summary_suffix
+
+def _source_stamp(file_name):
+    if is_shard_dir(file_name):
+        file_name = os.path.join(file_name, manifest_name)
+    st = os.stat(file_name)
+    return np.array([st.st_size, st.st_mtime_ns], dtype=np.int64)
+
+# tables that have already been loaded, keyed like the cubes
+_tables = {}
+
+def load_summary(file_name, quantities, num_meshes, num_times, refs,
+                 use_cache=True):
+    """
+    Return the `SummaryTable` of the raw statistics file (or shard
+    directory) `file_name` for the quantities and reference values in the
+    dict `refs`; `quantities`, `num_meshes` and `num_times` describe the
+    file as for `load_stats_cube`.  `file_name` may also be a sketch file
+    (see `sketches.py`) with the same quantities and reference values.
+
+    The table is read from its sidecar (see `summary_name`) when this is
+    current, and otherwise computed and written; set `use_cache` to False to
+    always compute it.  The samples themselves are only loaded when the
+    table has to be computed.
+    """
+    qois = tuple(refs)
+    ref = np.array([refs[qoi] for qoi in qois], dtype=float)
+    if is_sketch_file(file_name):
+        sketch = load_sketch(file_name)
+        rows = [sketch.index(qoi) for qoi in qois]
+        if not np.allclose(sketch.refs[rows], ref):
+            raise ValueError(file_name + " was sketched against other "
+                             "reference values")
+        if sketch.count.shape[1:] != (num_times, num_meshes):
+            raise ValueError("number of meshes and/or num_times "
+                             "inconsistent with " + file_name)
+        return summarize_sketch(sketch, qois)
+    key = (os.path.abspath(file_name), tuple(quantities), num_meshes,
+           num_times, qois, tuple(ref))
+    stamp = _source_stamp(file_name)
+    if key in _tables and np.array_equal(_tables[key][0], stamp):
+        return _tables[key][1]
+    sidecar = summary_name(file_name)
+    table = None
+    if use_cache and os.path.exists(sidecar):
+        with np.load(sidecar) as f:
+            if (np.array_equal(f["stamp"], stamp)
+                    and tuple(f["qois"]) == qois
+                    and np.array_equal(f["refs"], ref)
+                    and tuple(f["fields"]) == fields
+                    and f["data"].shape[2:] == (num_times, num_meshes)):
+                table = SummaryTable(f["data"], qois, f["mesh"])
+    if table is None:
+        cube = load_stats_cube(file_name, quantities, num_meshes, num_times)
+        table = summarize_cube(cube, refs)
+        if use_cache:
+            tmp = sidecar + ".tmp{}.npz".format(os.getpid())
+            try:
+                np.savez(tmp, data=table.data, mesh=table.mesh, stamp=stamp,
+                         qois=np.array(qois), refs=ref,
+                         fields=np.array(fields))
+                os.replace(tmp, sidecar)
+            except OSError:
+                # read-only directories just go without a sidecar
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+    _tables[key] = (stamp, table)
+    return table
+
+def plot_boxes(ax, stats, positions, widths, color, lw, zorder):
+    """
+    Draw the boxes `stats` (from `SummaryTable.bxp_stats`) on `ax` with the
+    notched, white-filled style of the statistics plots, and return the
+    artists as `Axes.bxp` does.
+    """
+    return ax.bxp(stats, positions=positions, widths=widths,
+                  shownotches=True, patch_artist=True, zorder=zorder,
+                  medianprops=dict(color=color, linewidth=lw),
+                  capprops=dict(color=color),
+                  whiskerprops=dict(color=color),
+                  boxprops=dict(edgecolor=color, facecolor='w', linewidth=lw,
+                                linestyle='solid'))
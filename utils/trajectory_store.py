@@ -0,0 +1,187 @@
+"""module for column-wise, memory-mapped access to simulated trajectories
+
+The Julia scripts `lorenz.jl` and `chen.jl` write each trajectory to a text
+file in `Simulated Solutions`, one time step per line and one tab-separated
+column per component.  This module converts such a file once into a binary
+column store next to it (the same name plus `.cols`): a small header followed
+by every column stored contiguously as little-endian float64.  The store is
+memory mapped, so a component over an index range, e.g. `traj.z[i:i+100]`,
+only touches the pages holding those values.  The store records the size and
+modification time of the text file and is rebuilt when they change.
+
+Usage from the command line, to convert every trajectory in a directory:
+
+    python trajectory_store.py "../lorenz/Simulated Solutions"
+"""
+
+import os
+import struct
+import sys
+import numpy as np
+
+store_suffix = ".cols"
+_magic = b"HOCCOL\x00\x01"
+_header_fmt = "<8sQqQQ"
+_header_size = 64
+_chunk_rows = 1 << 16
+
+def store_name(file_name):
+    """Return the name of the column store for the trajectory `file_name`."""
+    return file_name + store_suffix
+
+def _source_stamp(file_name):
+    st = os.stat(file_name)
+    return st.st_size, st.st_mtime_ns
+
+def _count_rows(file_name):
+    """Return the number of lines of `file_name` without parsing them."""
+    rows = 0
+    last = b"\n"
+    with open(file_name, "rb") as f:
+        while True:
+            buf = f.read(1 << 24)
+            if not buf:
+                break
+            rows += buf.count(b"\n")
+            last = buf[-1:]
+    if last != b"\n":
+        rows += 1 # final line without a newline
+    return rows
+
+def _count_cols(file_name):
+    with open(file_name, "r") as f:
+        return len(f.readline().split())
+
+def convert_trajectory(file_name, chunk_rows=_chunk_rows):
+    """
+    Convert the text trajectory `file_name` into its column store.
+
+    The text is parsed `chunk_rows` lines at a time and written straight into
+    the memory-mapped store, so the conversion never holds more than one
+    chunk in memory.  Returns the name of the store.
+    """
+    stamp = _source_stamp(file_name)
+    nrows = _count_rows(file_name)
+    ncols = _count_cols(file_name)
+    store = store_name(file_name)
+    tmp = store + ".tmp{}".format(os.getpid())
+    header = struct.pack(_header_fmt, _magic, stamp[0], stamp[1], nrows, ncols)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(header.ljust(_header_size, b"\x00"))
+            f.truncate(_header_size + 8*nrows*ncols)
+        if nrows*ncols > 0:
+            cols = np.memmap(tmp, dtype="<f8", mode="r+", offset=_header_size,
+                             shape=(ncols, nrows))
+            ptr = 0
+            with open(file_name, "r") as f:
+                while ptr < nrows:
+                    chunk = np.loadtxt(f, max_rows=chunk_rows, ndmin=2)
+                    if chunk.shape[0] == 0:
+                        break
+                    cols[:,ptr:ptr+chunk.shape[0]] = chunk.T
+                    ptr += chunk.shape[0]
+            cols.flush()
+            del cols
+            if ptr != nrows:
+                raise ValueError("blank or malformed lines in " + file_name)
+        os.replace(tmp, store)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return store
+
+def _open_store(file_name):
+    """Return the memory-mapped columns of `file_name`, or None if stale."""
+    store = store_name(file_name)
+    try:
+        with open(store, "rb") as f:
+            header = f.read(_header_size)
+    except OSError:
+        return None
+    if len(header) != _header_size:
+        return None
+    magic, size, mtime, nrows, ncols = struct.unpack_from(_header_fmt, header)
+    if magic != _magic or (size, mtime) != _source_stamp(file_name):
+        return None
+    if os.path.getsize(store) != _header_size + 8*nrows*ncols:
+        return None
+    if nrows*ncols == 0:
+        return np.zeros((ncols, nrows))
+    return np.memmap(store, dtype="<f8", mode="r", offset=_header_size,
+                     shape=(ncols, nrows))
+
+class Trajectory:
+    """
+    A stored trajectory with column-wise access.
+
+    `columns[k]` is the `k`th component over all time steps; `x`, `y` and `z`
+    are the first three components.  All of these are read-only memory maps
+    (or plain arrays, if the store could not be written).
+    """
+    def __init__(self, file_name, columns):
+        self.file_name = file_name
+        self.columns = columns
+
+    def __len__(self):
+        return self.columns.shape[1]
+
+    @property
+    def num_components(self):
+        return self.columns.shape[0]
+
+    def component(self, k, start=None, stop=None):
+        """Return component `k` over time steps `start` to `stop`."""
+        return self.columns[k, start:stop]
+
+    @property
+    def x(self):
+        return self.columns[0]
+
+    @property
+    def y(self):
+        return self.columns[1]
+
+    @property
+    def z(self):
+        return self.columns[2]
+
+def open_trajectory(file_name):
+    """
+    Open the text trajectory `file_name` through its column store.
+
+    The store is built on first use, and rebuilt if `file_name` has changed
+    since.  If the store cannot be written (for example, in a read-only
+    directory), the text is parsed into memory instead.
+    """
+    columns = _open_store(file_name)
+    if columns is None:
+        try:
+            convert_trajectory(file_name)
+            columns = _open_store(file_name)
+        except OSError:
+            columns = None
+        if columns is None:
+            columns = np.loadtxt(file_name, ndmin=2).T
+    return Trajectory(file_name, columns)
+
+def import_solution(file_name, start=None, stop=None):
+    """
+    Return the z component of the trajectory `file_name`.
+
+    This is the Python counterpart of `solution_importer.m`; `start` and
+    `stop` select a range of time steps without reading the others.
+    """
+    return open_trajectory(file_name).component(2, start, stop)
+
+if __name__ == "__main__":
+    for path in sys.argv[1:]:
+        if os.path.isdir(path):
+            names = sorted(os.path.join(path, name) for name in os.listdir(path)
+                           if name.endswith(".txt"))
+        else:
+            names = [path]
+        for name in names:
+            if _open_store(name) is None:
+                print("converting", name)
+                convert_trajectory(name)